@@ -486,4 +486,305 @@ def spearmanr_dataframe(A, B, axis=0):
     """
     return A.apply(lambda x: B.apply(lambda y: spearmanr_series(x, y),
                                      axis=axis),
-                   axis=axis)
\ No newline at end of file
+                   axis=axis)
+
+
+FEATURE_STATS_BLOCK_ROWS = 1024
+
+
+class FeatureStats(object):
+    """NaN-aware statistics of each feature (column) of a matrix
+
+    The number of non-NaN values, mean, sum of squared differences from the
+    mean ("M2"), minimum, maximum and number of values above a threshold,
+    computed in one pass over the rows. The statistics of two sets of rows
+    can be merged, or the statistics of some rows removed, with the
+    parallel form of Welford's algorithm, so adding or dropping a few
+    samples doesn't need another pass over all of them.
+
+    Parameters
+    ----------
+    count, mean, m2, minimum, maximum, n_above : numpy.array
+        The statistics of each feature
+    thresh : float, optional (default=-np.inf)
+        Values greater than this are counted in ``n_above``
+    index : pandas.Index, optional
+        Ids of the features
+    """
+
+    def __init__(self, count, mean, m2, minimum, maximum, n_above,
+                 thresh=-np.inf, index=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+        self.n_above = n_above
+        self.thresh = thresh
+        self.index = index
+
+    @classmethod
+    def from_values(cls, values, rows=None, columns=None, thresh=-np.inf,
+                    index=None, block_rows=FEATURE_STATS_BLOCK_ROWS):
+        """Compute the statistics of the columns of a 2d array
+
+        Parameters
+        ----------
+        values : numpy.array
+            A (n_samples, n_features) array, which may be memory-mapped
+        rows, columns : numpy.array, optional (default=None)
+            Positions of the rows and columns to use. If None, use all.
+        thresh : float, optional (default=-np.inf)
+            Values greater than this are counted in ``n_above``
+        index : pandas.Index, optional
+            Ids of the features
+        block_rows : int, optional
+            Number of rows to read at a time
+
+        Returns
+        -------
+        stats : FeatureStats
+        """
+        n_features = values.shape[1] if columns is None else len(columns)
+        stats = cls(np.zeros(n_features, dtype=int),
+                    np.zeros(n_features), np.zeros(n_features),
+                    np.nan * np.ones(n_features),
+                    np.nan * np.ones(n_features),
+                    np.zeros(n_features, dtype=int), thresh=thresh,
+                    index=index)
+        n_rows = values.shape[0] if rows is None else len(rows)
+        for start in range(0, n_rows, block_rows):
+            stop = start + block_rows
+            block = values[start:stop] if rows is None \
+                else values[rows[start:stop]]
+            if columns is not None:
+                block = block[:, columns]
+            stats = stats.merge(cls._from_block(
+                np.asarray(block, dtype=float), thresh, index))
+        return stats
+
+    @classmethod
+    def _from_block(cls, block, thresh, index):
+        finite = ~np.isnan(block)
+        count = finite.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(finite, block, 0).sum(axis=0) / count
+            m2 = (np.where(finite, block - mean, 0) ** 2).sum(axis=0)
+            n_above = (block > thresh).sum(axis=0)
+        minimum = np.where(finite, block, np.inf).min(axis=0)
+        maximum = np.where(finite, block, -np.inf).max(axis=0)
+        empty = count == 0
+        minimum[empty] = np.nan
+        maximum[empty] = np.nan
+        return cls(count, mean, m2, minimum, maximum, n_above,
+                   thresh=thresh, index=index)
+
+    def merge(self, other):
+        """Statistics of the rows of both ``self`` and ``other``"""
+        count = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            mean = self.mean + delta * other.count / count
+            m2 = self.m2 + other.m2 + \
+                delta ** 2 * self.count * other.count / count
+        # Where one side has no values, delta is NaN
+        mean = np.where(self.count == 0, other.mean,
+                        np.where(other.count == 0, self.mean, mean))
+        m2 = np.where(self.count == 0, other.m2,
+                      np.where(other.count == 0, self.m2, m2))
+        return FeatureStats(count, mean, m2,
+                            np.fmin(self.minimum, other.minimum),
+                            np.fmax(self.maximum, other.maximum),
+                            self.n_above + other.n_above,
+                            thresh=self.thresh, index=self.index)
+
+    def remove(self, other, values, rows):
+        """Statistics of the rows of ``self`` which are not in ``other``
+
+        The minimum and maximum can't be "unmerged", so they are computed
+        again from the remaining rows, only for the features where the
+        removed rows had the minimum or maximum.
+
+        Parameters
+        ----------
+        other : FeatureStats
+            Statistics of rows which are included in ``self``
+        values : numpy.array
+            The array ``self`` was computed on
+        rows : numpy.array
+            Positions of the rows of ``values`` which remain
+        """
+        count = self.count - other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (self.count * self.mean - other.count * other.mean) / count
+            delta = other.mean - mean
+            m2 = self.m2 - other.m2 - \
+                delta ** 2 * count * other.count / self.count
+        mean = np.where(other.count == 0, self.mean,
+                        np.where(count == 0, np.nan, mean))
+        m2 = np.where(other.count == 0, self.m2,
+                      np.where(count == 0, 0, np.maximum(m2, 0)))
+
+        minimum = self.minimum.copy()
+        maximum = self.maximum.copy()
+        with np.errstate(invalid='ignore'):
+            changed = np.flatnonzero((other.count > 0) & (
+                (other.minimum <= self.minimum) |
+                (other.maximum >= self.maximum)))
+        if len(changed) > 0:
+            remaining = FeatureStats.from_values(
+                np.asarray(values[np.ix_(rows, changed)]))
+            minimum[changed] = remaining.minimum
+            maximum[changed] = remaining.maximum
+        return FeatureStats(count, mean, m2, minimum, maximum,
+                            self.n_above - other.n_above,
+                            thresh=self.thresh, index=self.index)
+
+    def take(self, columns):
+        """Statistics of only these features
+
+        Parameters
+        ----------
+        columns : numpy.array
+            Boolean mask or positions of the features to keep
+        """
+        index = None if self.index is None else self.index[columns]
+        return FeatureStats(self.count[columns], self.mean[columns],
+                            self.m2[columns], self.minimum[columns],
+                            self.maximum[columns], self.n_above[columns],
+                            thresh=self.thresh, index=index)
+
+    @property
+    def variance(self):
+        """Unbiased (ddof=1) variance, NaN with fewer than two values"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1),
+                            np.nan)
+
+    def to_frame(self):
+        """The statistics as a (n_features, statistics) DataFrame"""
+        return pd.DataFrame(
+            dict(count=self.count, mean=self.mean, variance=self.variance,
+                 minimum=self.minimum, maximum=self.maximum,
+                 n_above=self.n_above), index=self.index,
+            columns=['count', 'mean', 'variance', 'minimum', 'maximum',
+                     'n_above'])
+
+
+class Standardizer(object):
+    """Gather, impute, mean-center and scale features in a single buffer
+
+    Like ``fillna(means)`` followed by scikit-learn's
+    ``StandardScaler().fit_transform``, without the intermediate copies:
+    the requested rows and columns are copied once into a preallocated
+    array, which is then imputed, centered and scaled in place, a block of
+    rows at a time. The means and scales are kept, so other data can be
+    :py:meth:`transform`-ed the same way.
+
+    Parameters
+    ----------
+    standardize : bool, optional (default=True)
+        If False, only fill missing values with the mean of the feature
+    dtype : numpy.dtype, optional (default=np.float64)
+        Type of the standardized values, e.g. np.float32 for half the memory
+
+    Attributes
+    ----------
+    means : numpy.array
+        Mean of each feature, ignoring missing values. NaN if a feature
+        has no values, which are filled with 0 instead.
+    scales : numpy.array
+        Standard deviation of each feature (1 if it has no variance), or
+        all 1 if ``standardize`` is False
+    """
+
+    def __init__(self, standardize=True, dtype=np.float64):
+        self.standardize = standardize
+        self.dtype = dtype
+        self.means = None
+        self.scales = None
+
+    def fit(self, stats, n_samples):
+        """Use the means and variances of these :py:class:`FeatureStats`
+
+        Parameters
+        ----------
+        stats : FeatureStats
+            Statistics of the features, computed before imputing
+        n_samples : int
+            Number of samples, including the ones with missing values
+        """
+        self.means = stats.mean
+        if self.standardize:
+            # The imputed values don't add to the sum of squares, and
+            # StandardScaler uses the population (ddof=0) standard deviation
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scales = np.sqrt(stats.m2 / n_samples)
+            scales[~(scales > 0)] = 1.
+            self.scales = scales
+        else:
+            self.scales = np.ones(len(stats.mean))
+        return self
+
+    def fit_transform(self, values, rows=None, columns=None, stats=None,
+                      block_rows=FEATURE_STATS_BLOCK_ROWS):
+        """Standardize these rows and columns of ``values`` into a new array
+
+        Parameters
+        ----------
+        values : numpy.array
+            A (n_samples, n_features) array, which may be memory-mapped
+        rows, columns : numpy.array, optional (default=None)
+            Positions of the rows and columns to use. If None, use all.
+        stats : FeatureStats, optional (default=None)
+            Statistics of these rows and columns, if already computed
+        block_rows : int, optional
+            Number of rows to read and standardize at a time
+
+        Returns
+        -------
+        standardized : numpy.array
+            A (len(rows), len(columns)) array of ``dtype``
+        """
+        rows = np.arange(values.shape[0]) if rows is None else rows
+        columns = np.arange(values.shape[1]) if columns is None else columns
+        if stats is None:
+            stats = FeatureStats.from_values(values, rows=rows,
+                                             columns=columns,
+                                             block_rows=block_rows)
+        self.fit(stats, len(rows))
+
+        standardized = np.empty((len(rows), len(columns)), dtype=self.dtype)
+        for start in range(0, len(rows), block_rows):
+            stop = start + block_rows
+            standardized[start:stop] = values[np.ix_(rows[start:stop],
+                                                     columns)]
+            self._transform_inplace(standardized[start:stop])
+        return standardized
+
+    def transform(self, values, block_rows=FEATURE_STATS_BLOCK_ROWS):
+        """Standardize other data with the same means and scales
+
+        Parameters
+        ----------
+        values : numpy.array
+            A (n_samples, n_features) array with the same features as the
+            data this was fit on
+
+        Returns
+        -------
+        standardized : numpy.array
+            A new array of ``dtype``
+        """
+        standardized = np.array(values, dtype=self.dtype)
+        for start in range(0, standardized.shape[0], block_rows):
+            self._transform_inplace(standardized[start:start + block_rows])
+        return standardized
+
+    def _transform_inplace(self, block):
+        means = np.where(np.isnan(self.means), 0, self.means)
+        missing_rows, missing_columns = np.nonzero(np.isnan(block))
+        block[missing_rows, missing_columns] = means[missing_columns]
+        if self.standardize:
+            block -= means.astype(block.dtype)
+            block /= self.scales.astype(block.dtype)
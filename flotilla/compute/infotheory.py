@@ -2,12 +2,20 @@
 Information-theoretic calculations
 """
 
+import warnings
+
 import numpy as np
 import pandas as pd
-from sklearn import cross_validation
+from scipy import sparse
+from joblib import Parallel, delayed, cpu_count
 
 EPSILON = 100 * np.finfo(float).eps
 
+# Maximum number of histogram bins to compare at once, of every feature in a
+# block of pairs of phenotypes in jsd_permutation_test, or of every
+# bootstrap iteration of a block of features in cross_phenotype_jsd
+JSD_BLOCK_SIZE = 2 ** 22
+
 
 def bin_range_strings(bins):
     """Given a list of bins, make a list of strings of those bin ranges
@@ -41,9 +49,44 @@ def _check_prob_dist(x):
                              'probability distributions that **sum to 1**')
 
 
-def binify(df, bins):
+def bin_indices(x, bins):
+    """Index of the bin that each value falls into
+
+    As with ``np.histogram``, each bin is half-open except the last, which
+    includes the final bin edge.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_samples, n_features) array of values
+    bins : iterable
+        Bin edges, including the final bin value
+
+    Returns
+    -------
+    index : numpy.array
+        A (n_samples, n_features) integer array of the bin of each value,
+        or -1 if the value is NA or outside of the bins
+    """
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.shape[0] - 1
+    x = np.asarray(x, dtype=float)
+
+    index = np.digitize(x.ravel(), bins).reshape(x.shape) - 1
+    index[x == bins[-1]] = n_bins - 1
+    index[~(np.isfinite(x) & (index >= 0) & (index < n_bins))] = -1
+    return index
+
+
+def binify(df, bins, dtype=float):
     """Makes a histogram of each column the provided binsize
 
+    All columns are binned in a single pass: one ``np.digitize`` of the
+    whole matrix, then one ``np.bincount`` with each column's bin indices
+    offset so they don't overlap. As with ``np.histogram``, each bin is
+    half-open except the last, which includes the final bin edge, and NA or
+    out-of-range values are not counted.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -53,20 +96,184 @@ def binify(df, bins):
         Bins you would like to use for this data. Must include the final bin
         value, e.g. (0, 0.5, 1) for the two bins (0, 0.5) and (0.5, 1).
         nbins = len(bins) - 1
+    dtype : numpy.dtype, optional (default=float)
+        Type of the output, e.g. ``np.float32`` to halve its memory
 
     Returns
     -------
     binned : pandas.DataFrame
-        An nbins x features DataFrame of each column binned across rows
+        An nbins x features DataFrame of each column binned across rows. A
+        column with no values within the bins is all NA.
     """
     if bins is None:
         raise ValueError('Must specify "bins"')
-    binned = df.apply(lambda x: pd.Series(np.histogram(x, bins=bins)[0]))
-    binned.index = bin_range_strings(bins)
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.shape[0] - 1
+    index = bin_indices(df.values, bins)
+    n_features = index.shape[1]
+    valid = index >= 0
+
+    # Offset each column so a single bincount counts every feature at once
+    index = index + np.arange(n_features) * n_bins
+    counts = np.bincount(index[valid], minlength=n_bins * n_features)
+    counts = counts.reshape(n_features, n_bins).T.astype(float)
 
     # Normalize so each column sums to 1
-    binned = binned / binned.sum().astype(float)
-    return binned
+    with np.errstate(invalid='ignore', divide='ignore'):
+        binned = counts / counts.sum(axis=0)
+    return pd.DataFrame(binned.astype(dtype), index=bin_range_strings(bins),
+                        columns=df.columns)
+
+
+def _check_prob_dist_array(x, axis=0):
+    """Array version of _check_prob_dist, for distributions along ``axis``"""
+    if np.any(x < 0):
+        raise ValueError('Each column of the input arrays must be '
+                         '**non-negative** probability distributions')
+    if np.any(np.abs(x.sum(axis=axis) - 1) > EPSILON):
+        raise ValueError('Each column of the input arrays must be '
+                         'probability distributions that **sum to 1**')
+
+
+def _sum_p_log2_ratio(p, q, axis=0, out=None):
+    """Sum of p * log2(p / q) along ``axis``, skipping terms where p or q
+    is zero or NA, which makes log0 = 0. Allocates two temporary arrays the
+    shape of ``p``, the mask of the valid terms and the terms themselves.
+    """
+    valid = (p > 0) & (q > 0)
+    terms = np.divide(p, q, out=np.zeros(valid.shape), where=valid)
+    np.log2(terms, out=terms, where=valid)
+    np.multiply(terms, p, out=terms, where=valid)
+    return terms.sum(axis=axis, out=out)
+
+
+def kld_array(p, q, axis=0, out=None, check=True):
+    """Kullback-Leiber divergence of two arrays of probability distributions
+
+    Parameters
+    ----------
+    p : numpy.array
+        An (nbins, n_features) array, or (nbins,) array
+    q : numpy.array
+        An array of the same shape as ``p``
+    axis : int, optional (default=0)
+        Axis of the bins
+    out : numpy.array, optional (default=None)
+        A preallocated (n_features,) array to store the output in
+    check : bool, optional (default=True)
+        If True, check that ``p`` and ``q`` are probability distributions
+
+    Returns
+    -------
+    kld : numpy.array
+        An (n_features,) array of the Kullback-Leiber divergence of each
+        column of p and q
+
+    Raises
+    ------
+    ValueError
+        If ``check`` and the data provided is not a probability distribution
+    """
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    if check:
+        _check_prob_dist_array(p, axis)
+        _check_prob_dist_array(q, axis)
+    return _sum_p_log2_ratio(p, q, axis, out)
+
+
+def jsd_array(p, q, axis=0, out=None, check=True):
+    """Jensen-Shannon divergence of two arrays of probability distributions
+
+    Parameters
+    ----------
+    p : numpy.array
+        An (nbins, n_features) array, or (nbins,) array
+    q : numpy.array
+        An array of the same shape as ``p``
+    axis : int, optional (default=0)
+        Axis of the bins
+    out : numpy.array, optional (default=None)
+        A preallocated (n_features,) array to store the output in
+    check : bool, optional (default=True)
+        If True, check that ``p`` and ``q`` are probability distributions
+
+    Returns
+    -------
+    jsd : numpy.array
+        An (n_features,) array of the Jensen-Shannon divergence of each
+        column of p and q
+
+    Raises
+    ------
+    ValueError
+        If ``check`` and the data provided is not a probability distribution
+    """
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    if check:
+        _check_prob_dist_array(p, axis)
+        _check_prob_dist_array(q, axis)
+    m = p + q
+    m *= 0.5
+
+    result = _sum_p_log2_ratio(p, m, axis, out)
+    result += _sum_p_log2_ratio(q, m, axis)
+    result *= 0.5
+    return result
+
+
+def entropy_array(binned, base=2, axis=0, out=None, check=True):
+    """Entropy of each column of an array of probability distributions
+
+    Parameters
+    ----------
+    binned : numpy.array
+        An (nbins, n_features) array, or (nbins,) array
+    base : numeric, optional (default=2)
+        The log-base of the entropy
+    axis : int, optional (default=0)
+        Axis of the bins
+    out : numpy.array, optional (default=None)
+        A preallocated (n_features,) array to store the output in
+    check : bool, optional (default=True)
+        If True, check that ``binned`` is a probability distribution
+
+    Returns
+    -------
+    entropy : numpy.array
+        An (n_features,) array of the entropy of each column
+
+    Raises
+    ------
+    ValueError
+        If ``check`` and the data provided is not a probability distribution
+    """
+    binned = np.asarray(binned, dtype=float)
+    if check:
+        _check_prob_dist_array(binned, axis)
+    valid = binned > 0
+    terms = np.log(binned, out=np.zeros(binned.shape), where=valid)
+    np.multiply(terms, binned, out=terms, where=valid)
+    result = terms.sum(axis=axis, out=out)
+    result *= -1. / np.log(base)
+    return result
+
+
+def _wrap_array_result(values, p, q=None):
+    """Label the per-column result of an array function like ``p``
+
+    Columns where either of the aligned ``p`` and ``q`` has no finite
+    values, e.g. because it is only in one of them, are NA, as in
+    :py:func:`_jsd_arrays`.
+    """
+    missing = ~np.isfinite(p.values).any(axis=0)
+    if q is not None:
+        missing |= ~np.isfinite(q.values).any(axis=0)
+    if isinstance(p, pd.DataFrame):
+        values[missing] = np.nan
+        return pd.Series(values, index=p.columns)
+    return np.nan if missing else values
 
 
 def kld(p, q):
@@ -96,7 +303,8 @@ def kld(p, q):
     Notes
     -----
     The input to this function must be probability distributions, not raw
-    values. Otherwise, the output makes no sense.
+    values. Otherwise, the output makes no sense. This is a wrapper around
+    :py:func:`kld_array`.
     """
     try:
         _check_prob_dist(p)
@@ -105,10 +313,9 @@ def kld(p, q):
         return np.nan
     # If one of them is zero, then the other should be considered to be 0.
     # In this problem formulation, log0 = 0
-    p = p.replace(0, np.nan)
-    q = q.replace(0, np.nan)
-
-    return (np.log2(p / q) * p).sum(axis=0)
+    p, q = p.align(q)
+    return _wrap_array_result(kld_array(p.values, q.values, check=False),
+                              p, q)
 
 
 def jsd(p, q):
@@ -136,17 +343,19 @@ def jsd(p, q):
     ValueError
         If the data provided is not a probability distribution, i.e. it has
         negative values or its columns do not sum to 1, raise ValueError
+
+    Notes
+    -----
+    This is a wrapper around :py:func:`jsd_array`.
     """
     try:
         _check_prob_dist(p)
         _check_prob_dist(q)
     except ValueError:
         return np.nan
-    weight = 0.5
-    m = weight * (p + q)
-
-    result = weight * kld(p, m) + (1 - weight) * kld(q, m)
-    return result
+    p, q = p.align(q)
+    return _wrap_array_result(jsd_array(p.values, q.values, check=False),
+                              p, q)
 
 
 def entropy(binned, base=2):
@@ -171,12 +380,17 @@ def entropy(binned, base=2):
     ValueError
         If the data provided is not a probability distribution, i.e. it has
         negative values or its columns do not sum to 1, raise ValueError
+
+    Notes
+    -----
+    This is a wrapper around :py:func:`entropy_array`.
     """
     try:
         _check_prob_dist(binned)
     except ValueError:
         np.nan
-    return -((np.log(binned) / np.log(base)) * binned).sum(axis=0)
+    return _wrap_array_result(
+        entropy_array(binned.values, base=base, check=False), binned)
 
 
 def binify_and_jsd(df1, df2, pair, bins):
@@ -190,9 +404,122 @@ def binify_and_jsd(df1, df2, pair, bins):
     return series
 
 
-def cross_phenotype_jsd(data, groupby, bins, n_iter=100):
+def _weighted_histograms(index, n_bins, weights):
+    """Normalized histograms of every feature, for many weightings of samples
+
+    Parameters
+    ----------
+    index : numpy.array
+        A (n_samples, n_features) array of bin indices from
+        :py:func:`bin_indices`
+    n_bins : int
+        Number of bins
+    weights : numpy.array
+        A (n_weights, n_samples) array of how many times each sample is
+        counted in each histogram
+
+    Returns
+    -------
+    histograms : numpy.array
+        A (n_weights, n_bins, n_features) array of histograms, each summing to
+        1, or NA if no samples of the feature fall into the bins
+    """
+    n_samples, n_features = index.shape
+    valid = index >= 0
+    rows = np.nonzero(valid)[0]
+    columns = (index + np.arange(n_features) * n_bins)[valid]
+
+    # A sparse one-hot encoding of the bins turns every weighting's
+    # histograms into one matrix product
+    onehot = sparse.csr_matrix((np.ones(rows.shape[0]), (rows, columns)),
+                               shape=(n_samples, n_features * n_bins))
+    counts = np.asarray(onehot.T.dot(weights.T)).T
+    counts = counts.reshape(weights.shape[0], n_features, n_bins)
+    counts = counts.transpose(0, 2, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts / counts.sum(axis=1)[:, np.newaxis, :]
+
+
+def _jsd_arrays(p, q):
+    """Per-feature JSD of histogram arrays, NA where a histogram is NA
+
+    Parameters
+    ----------
+    p, q : numpy.array
+        (..., n_bins, n_features) arrays of probability distributions
+
+    Returns
+    -------
+    jsd : numpy.array
+        (..., n_features) array of Jensen-Shannon divergences
+    """
+    jsd = jsd_array(p, q, axis=-2, check=False)
+    missing = np.isnan(p).any(axis=-2) | np.isnan(q).any(axis=-2)
+    jsd[missing] = np.nan
+    return jsd
+
+
+def _bootstrap_weights(n, n_iter, random_state, train_size=0.5):
+    """Bootstrap two disjoint halves of n samples, n_iter times
+
+    Each iteration, the samples are randomly split into a train and test
+    set, and each set is then resampled with replacement, as in
+    ``sklearn.cross_validation.Bootstrap``.
+
+    Returns
+    -------
+    weights1, weights2 : numpy.array
+        (n_iter, n) arrays of how many times each sample was drawn into the
+        first and second half in each iteration
+    """
+    n_train = int(np.ceil(train_size * n))
+    n_test = n - n_train
+    permutations = np.argsort(random_state.rand(n_iter, n), axis=1)
+    iterations = np.arange(n_iter)[:, np.newaxis]
+
+    weights = []
+    for start, size in ((0, n_train), (n_train, n_test)):
+        draws = start + random_state.randint(max(size, 1),
+                                             size=(n_iter, size))
+        drawn = permutations[iterations, draws] + iterations * n
+        weights.append(np.bincount(drawn.ravel(), minlength=n_iter * n)
+                       .reshape(n_iter, n).astype(float))
+    return weights
+
+
+def _within_phenotype_jsd(index, n_bins, n_iter, seed):
+    """Mean JSD between bootstrapped halves of one phenotype's samples
+
+    Features are compared in blocks of at most ``JSD_BLOCK_SIZE`` histogram
+    bins over all iterations, so the histograms don't grow with the number
+    of features.
+    """
+    weights1, weights2 = _bootstrap_weights(index.shape[0], n_iter,
+                                            np.random.RandomState(seed))
+    n_features = index.shape[1]
+    block = max(JSD_BLOCK_SIZE // max(n_iter * n_bins, 1), 1)
+    mean_jsd = np.empty(n_features)
+    for start in xrange(0, n_features, block):
+        block_index = index[:, start:start + block]
+        p = _weighted_histograms(block_index, n_bins, weights1)
+        q = _weighted_histograms(block_index, n_bins, weights2)
+        jsd = np.sqrt(_jsd_arrays(p, q))
+        with warnings.catch_warnings():
+            # Features with no values in any iteration are NA
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            mean_jsd[start:start + block] = np.nanmean(jsd, axis=0)
+    return mean_jsd
+
+
+def cross_phenotype_jsd(data, groupby, bins, n_iter=100, n_jobs=1,
+                        random_state=None):
     """Jensen-Shannon divergence of features across phenotypes
 
+    The bin of every value is found once. The histograms of each phenotype
+    are then computed once for all between-phenotype comparisons, and all
+    ``n_iter`` bootstrap replicates of a within-phenotype comparison are
+    computed together as weighted counts of those bins.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -204,6 +531,11 @@ def cross_phenotype_jsd(data, groupby, bins, n_iter=100):
         within-group comparisons
     n_bins : int
         Number of bins to binify the singles data on
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the within-phenotype bootstraps across.
+        If -1, use all CPUs
+    random_state : int or None, optional (default=None)
+        Seed for the bootstrap resampling
 
     Returns
     -------
@@ -211,34 +543,214 @@ def cross_phenotype_jsd(data, groupby, bins, n_iter=100):
         A (n_features, n_phenotypes^2) dataframe of the JSD between each
         feature between and within phenotypes
     """
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.shape[0] - 1
+    index = bin_indices(data.values, bins)
+
     grouped = data.groupby(groupby)
-    jsds = []
+    group_to_rows = grouped.indices
+    phenotypes = [phenotype for phenotype, df in grouped]
+
+    histograms = dict(
+        (phenotype, _weighted_histograms(
+            index[group_to_rows[phenotype]], n_bins,
+            np.ones((1, len(group_to_rows[phenotype]))))[0])
+        for phenotype in phenotypes)
+
+    seeds = np.random.RandomState(random_state).randint(
+        np.iinfo(np.int32).max, size=len(phenotypes))
+    within = Parallel(n_jobs=n_jobs)(
+        delayed(_within_phenotype_jsd)(index[group_to_rows[phenotype]],
+                                       n_bins, n_iter, seed)
+        for phenotype, seed in zip(phenotypes, seeds))
+    within = dict(zip(phenotypes, within))
 
+    jsds = []
     seen = set([])
 
-    for phenotype1, df1 in grouped:
-        for phenotype2, df2 in grouped:
+    for phenotype1 in phenotypes:
+        for phenotype2 in phenotypes:
             pair = tuple(sorted([phenotype1, phenotype2]))
             if pair in seen:
                 continue
             seen.add(pair)
 
             if phenotype1 == phenotype2:
-                seriess = []
-                bs = cross_validation.Bootstrap(df1.shape[0], n_iter=n_iter,
-                                                train_size=0.5)
-                for i, (ind1, ind2) in enumerate(bs):
-                    df1_subset = df1.iloc[ind1, :]
-                    df2_subset = df2.iloc[ind2, :]
-                    seriess.append(
-                        binify_and_jsd(df1_subset, df2_subset, None, bins))
-                series = pd.concat(seriess, axis=1, names=None).mean(axis=1)
-                series.name = pair
-                jsds.append(series)
+                values = within[phenotype1]
             else:
-                series = binify_and_jsd(df1, df2, pair, bins)
-                jsds.append(series)
-    return pd.concat(jsds, axis=1)
+                values = np.sqrt(_jsd_arrays(histograms[phenotype1],
+                                             histograms[phenotype2]))
+            jsds.append(pd.Series(values, index=data.columns, name=pair))
+    return pd.concat(jsds, axis=1).dropna(how='all')
+
+
+def _label_histograms(rows, flat, labels, n_groups, n_bins, n_features):
+    """Normalized histograms of every feature in every group of samples
+
+    Parameters
+    ----------
+    rows : numpy.array
+        The sample of each binned value
+    flat : numpy.array
+        The feature * n_bins + bin index of each binned value
+    labels : numpy.array
+        A (n_samples,) array of the group of each sample, from 0 to n_groups
+
+    Returns
+    -------
+    histograms : numpy.array
+        A (n_groups, n_bins, n_features) array of histograms, NA where no
+        samples of the group have values of the feature within the bins
+    """
+    size = n_features * n_bins
+    counts = np.bincount(labels[rows] * size + flat, minlength=n_groups * size)
+    counts = counts.reshape(n_groups, n_features, n_bins).transpose(0, 2, 1)
+    counts = counts.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts / counts.sum(axis=1)[:, np.newaxis, :]
+
+
+def _pairs_jsd(histograms, pairs):
+    """Jensen-Shannon distance of every feature between pairs of groups
+
+    Pairs are compared in blocks of at most ``JSD_BLOCK_SIZE`` histogram
+    bins, so the temporary arrays don't grow with the number of pairs.
+
+    Parameters
+    ----------
+    histograms : numpy.array
+        A (n_groups, n_bins, n_features) array of histograms
+    pairs : numpy.array
+        A (n_pairs, 2) array of the groups to compare
+
+    Returns
+    -------
+    jsd : numpy.array
+        A (n_pairs, n_features) array of Jensen-Shannon distances
+    """
+    n_bins, n_features = histograms.shape[1:]
+    block = max(JSD_BLOCK_SIZE // max(n_bins * n_features, 1), 1)
+    jsd = np.empty((len(pairs), n_features))
+    for start in xrange(0, len(pairs), block):
+        block_pairs = pairs[start:start + block]
+        jsd[start:start + block] = _jsd_arrays(
+            histograms[block_pairs[:, 0]], histograms[block_pairs[:, 1]])
+    return np.sqrt(jsd, out=jsd)
+
+
+def _permutation_exceedances(rows, flat, labels, n_bins, n_features, pairs,
+                             observed, n_permutations, seed):
+    """Number of label permutations with at least the observed JSD"""
+    n_groups = labels.max() + 1
+    random_state = np.random.RandomState(seed)
+    exceedances = np.zeros(observed.shape)
+    for i in range(n_permutations):
+        histograms = _label_histograms(rows, flat,
+                                       random_state.permutation(labels),
+                                       n_groups, n_bins, n_features)
+        with np.errstate(invalid='ignore'):
+            exceedances += _pairs_jsd(histograms, pairs) >= observed
+    return exceedances
+
+
+def _benjamini_hochberg_qvalues(p_values):
+    """Benjamini-Hochberg adjusted p-values, ignoring NA p-values"""
+    p_values = np.asarray(p_values, dtype=float)
+    q_values = np.empty(p_values.shape)
+    q_values.fill(np.nan)
+
+    finite = np.flatnonzero(np.isfinite(p_values))
+    order = finite[np.argsort(p_values[finite])]
+    ranked = p_values[order] * len(order) / np.arange(1., len(order) + 1)
+    # Adjusted p-values can't be smaller than those of lower-ranked p-values
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return q_values
+
+
+def jsd_permutation_test(data, groupby, bins, n_permutations=1000, n_jobs=1,
+                         random_state=None):
+    """Permutation test of the JSD of features between phenotypes
+
+    The bin of every value is found once. For each permutation of the
+    phenotype labels, the histograms of all phenotypes are then a single
+    bincount of the bins offset by the permuted labels, and the pairs of
+    phenotypes are compared in blocks of at most ``JSD_BLOCK_SIZE`` bins.
+    Permutations are spread across ``n_jobs`` processes.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_features) Dataframe
+    groupby : mappable
+        A samples to phenotypes mapping
+    bins : iterable
+        Bin edges, including the final bin value
+    n_permutations : int, optional (default=1000)
+        Number of times to shuffle the phenotype labels
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the permutations across. If -1, use
+        all CPUs
+    random_state : int or None, optional (default=None)
+        Seed for the permutations
+
+    Returns
+    -------
+    jsd_test : pandas.DataFrame
+        A tidy dataframe with a row for each feature and pair of phenotypes,
+        and the columns "feature", "pair", "jsd" (the Jensen-Shannon
+        distance, as in :py:func:`cross_phenotype_jsd`), "p" (the fraction of
+        permutations with at least this JSD, counting the observed labels as
+        one permutation) and "q" (Benjamini-Hochberg adjusted p-values).
+        Pairs of phenotypes where either has no values of a feature are
+        not included.
+    """
+    group_to_rows = data.groupby(groupby).indices
+    phenotypes = sorted(group_to_rows.keys())
+    labels = np.concatenate([np.ones(len(group_to_rows[phenotype]), dtype=int)
+                             * i for i, phenotype in enumerate(phenotypes)])
+
+    # Samples without a phenotype are not binned
+    x = data.values[np.concatenate([group_to_rows[phenotype]
+                                    for phenotype in phenotypes])]
+    bins = np.asarray(bins, dtype=float)
+    n_bins = bins.shape[0] - 1
+    index = bin_indices(x, bins)
+    n_features = index.shape[1]
+    valid = index >= 0
+    rows = np.nonzero(valid)[0]
+    flat = (index + np.arange(n_features) * n_bins)[valid]
+
+    pairs = np.array([(i, j) for i in range(len(phenotypes))
+                      for j in range(i + 1, len(phenotypes))],
+                     dtype=int).reshape(-1, 2)
+    observed = _pairs_jsd(_label_histograms(
+        rows, flat, labels, len(phenotypes), n_bins, n_features), pairs)
+
+    n_workers = cpu_count() if n_jobs < 0 else max(n_jobs, 1)
+    chunks = [len(c) for c in np.array_split(np.arange(n_permutations),
+                                             n_workers) if len(c) > 0]
+    seeds = np.random.RandomState(random_state).randint(
+        np.iinfo(np.int32).max, size=len(chunks))
+    exceedances = Parallel(n_jobs=n_jobs)(
+        delayed(_permutation_exceedances)(rows, flat, labels, n_bins,
+                                          n_features, pairs, observed,
+                                          n_chunk, seed)
+        for n_chunk, seed in zip(chunks, seeds))
+    exceedances = np.sum(exceedances, axis=0)
+
+    p_values = (exceedances + 1) / (n_permutations + 1.)
+    p_values[np.isnan(observed)] = np.nan
+
+    pair_names = [(phenotypes[i], phenotypes[j]) for i, j in pairs]
+    jsd_test = pd.DataFrame(
+        {'feature': np.tile(data.columns.values, len(pairs)),
+         'pair': [pair for pair in pair_names for _ in range(n_features)],
+         'jsd': observed.ravel(), 'p': p_values.ravel()},
+        columns=['feature', 'pair', 'jsd', 'p'])
+    jsd_test = jsd_test.dropna(subset=['jsd'])
+    jsd_test['q'] = _benjamini_hochberg_qvalues(jsd_test['p'].values)
+    return jsd_test.reset_index(drop=True)
+
 
 def jsd_df_to_2d(jsd_df):
     """Transform a tall JSD dataframe to a square matrix of mean JSDs
@@ -7,7 +7,7 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 
-from ..util import memoize
+from ..util import lru_memoize
 from ..visualize.color import dark2
 
 
@@ -64,7 +64,7 @@ class Networker(object):
             raise ValueError
         return wt
 
-    @memoize
+    @lru_memoize()
     def adjacency(self, data, use_pc_1=True, use_pc_2=True,
                   use_pc_3=True, use_pc_4=True, n_pcs=5):
         """Calculate the adjacency graph, i.e. connectedness between nodes
@@ -106,7 +106,7 @@ class Networker(object):
         return pd.DataFrame(np.tril(cov * - (np.identity(nrow) - 1)),
                             index=subset.index, columns=data.index)
 
-    @memoize
+    @lru_memoize()
     def graph(self, adjacency, cov_cut=0,
               node_color_mapper=None,
               node_size_mapper=None,
@@ -13,7 +13,7 @@ from sklearn.ensemble import ExtraTreesClassifier, ExtraTreesRegressor, \
 from sklearn.preprocessing import LabelEncoder
 import pandas.util.testing as pdt
 
-from ..util import memoize, timestamp
+from ..util import lru_memoize, timestamp
 from .decomposition import DataFramePCA, DataFrameNMF
 
 
@@ -115,7 +115,7 @@ class PredictorConfig(object):
             "{}\tAdded {} to default predictors\n".format(timestamp(),
                                                           self.predictor_name))
 
-    @memoize
+    @lru_memoize()
     def parameters(self, n_features):
         """Given a number of features, return the appropriately scaled keyword
         arguments
@@ -401,7 +401,7 @@ class PredictorConfigManager(object):
         self.predictor_configs[name] = predictor
         return predictor
 
-    @memoize
+    @lru_memoize()
     def new_predictor_config(self, name, obj=None,
                              predictor_scoring_fun=None,
                              score_cutoff_fun=None,
@@ -571,7 +571,7 @@ class PredictorDataSet(object):
         if hasattr(self, '_predictors'):
             return self._predictors
 
-    @memoize
+    @lru_memoize()
     def predictor(self, name, **kwargs):
         """A single, initialized PredictorConfig instance
 
@@ -692,7 +692,7 @@ class PredictorDataSetManager(object):
 
         return dataset
 
-    @memoize
+    @lru_memoize()
     def new_dataset(self, data_name, trait_name,
                     categorical_trait=False,
                     data=None, trait=None,
@@ -904,7 +904,7 @@ class PredictorBase(object):
         self.scores_ = pd.Series(index=self.X.columns, data=scores)
         self.has_been_scored = True
 
-    @memoize
+    @lru_memoize()
     def predict(self, other):
         """Predict
 
@@ -1009,12 +1009,12 @@ class PredictorBase(object):
         """Get the number of good features"""
         return np.sum(self.important_features_)
 
-    @memoize
+    @lru_memoize()
     def pca(self):
         """Perform PCA on the top-performing features"""
         return DataFramePCA(self.subset_)
 
-    @memoize
+    @lru_memoize()
     def nmf(self):
         """Perform NMF on the top-performing features"""
         return DataFrameNMF(self.subset_)
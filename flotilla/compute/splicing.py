@@ -3,16 +3,27 @@ Calculate modalities of splicing events.
 """
 
 from collections import Iterable
+import sys
+import time
+import warnings
 
 import numpy as np
 import pandas as pd
 from scipy import stats
 from scipy.misc import logsumexp
+from scipy.special import betaln
+from joblib import Parallel, delayed, cpu_count
+
+from ..util import lru_memoize
 
 
 MODALITIES_NAMES = ['excluded', 'middle', 'included', 'bimodal',
                     'uniform']
 
+# Maximum number of log-likelihoods, of every parameter of a model in every
+# bootstrap replicate, to evaluate at once for a chunk of events
+BOOTSTRAP_MAX_LOGLIKS = 2 ** 22
+
 
 
 class ModalityModel(object):
@@ -52,7 +63,60 @@ class ModalityModel(object):
 
     def logsumexp_logliks(self, x):
         return logsumexp(self.logliks(x))
-    
+
+    def logliks_matrix(self, n, sum_log_x, sum_log_1mx):
+        """Log-likelihoods of many events at once, from sufficient statistics
+
+        The beta log-pdf is linear in log(x) and log(1-x), so the summed
+        log-likelihood of an event only depends on the number of observed
+        values and the sums of their logs. This evaluates every parameter
+        pair of the model against every event as one matrix operation.
+
+        Parameters
+        ----------
+        n : numpy.array
+            A (n_events,) array of the number of finite values per event.
+            May also be (n_replicates, n_events), e.g. for bootstraps
+        sum_log_x : numpy.array
+            Sum of log(x) per event, the same shape as ``n``
+        sum_log_1mx : numpy.array
+            Sum of log(1-x) per event, the same shape as ``n``
+
+        Returns
+        -------
+        logliks : numpy.array
+            A (n_parameters, n_events) array of log-likelihoods, equivalent to
+            calling :py:meth:`ModalityModel.logliks` on each event, or
+            (n_parameters, n_replicates, n_events) for 2D inputs
+        """
+        shape = (-1,) + (1,) * np.ndim(n)
+        alphas = np.asarray(self.alphas, dtype=float).reshape(shape)
+        betas = np.asarray(self.betas, dtype=float).reshape(shape)
+        log_prob = np.log(self.prob_parameters).reshape(shape)
+        return log_prob + (alphas - 1) * sum_log_x \
+            + (betas - 1) * sum_log_1mx - betaln(alphas, betas) * n
+
+    def logpdf_table(self, grid):
+        """Log-pdf of each parameter pair of the model, evaluated on a grid
+
+        Parameters
+        ----------
+        grid : numpy.array
+            A (n_grid,) array of PSI values between 0 and 1. As in
+            :py:meth:`ModalityModel.logliks`, 0 and 1 are replaced with 0.001
+            and 0.999
+
+        Returns
+        -------
+        table : numpy.array
+            A (n_parameters, n_grid) array of log-pdf values
+        """
+        grid = np.array(grid, dtype=float)
+        grid[grid == 0] = 0.001
+        grid[grid == 1] = 0.999
+        return np.array([rv.logpdf(grid) for rv in self.rvs])
+
+
 class ModalityEstimator(object):
     """Use Bayesian methods to estimate modalities of splicing events"""
 
@@ -60,7 +124,7 @@ class ModalityEstimator(object):
     #     zip(['excluded', 'middle', 'included', 'bimodal', 'uniform'],
     #         sns.color_palette('deep', n_colors=5)))
     
-    def __init__(self, step, vmax, logbf_thresh=3):
+    def __init__(self, step, vmax, logbf_thresh=3, psi_resolution=None):
         """Initialize an object with models to estimate splicing modality
 
         Parameters
@@ -72,10 +136,28 @@ class ModalityEstimator(object):
         logbf_thresh : float
             Minimum threshold at which the bayes factor difference is defined
             to be significant
+        psi_resolution : float, optional (default=None)
+            If provided, e.g. 1e-3, the log-pdf of every model is tabulated
+            once on a grid of PSI values this far apart, and events are
+            scored by counting their quantized PSI values and summing over
+            the table, instead of evaluating the log-pdf on the raw values.
+
+        Notes
+        -----
+        With ``psi_resolution``, each PSI value x is moved by at most
+        ``psi_resolution / 2``, so the error of its log-pdf is at most
+        ``psi_resolution / 2 * |(alpha - 1) / x - (beta - 1) / (1 - x)|``.
+        For the default ``vmax=20`` and ``psi_resolution=1e-3``, that is
+        below 0.1 per observation for 0.1 <= x <= 0.9. Values closer than
+        ``psi_resolution / 2`` to 0 or 1, where the log-pdfs are steepest,
+        are not quantized but evaluated exactly. Leave it as None to
+        evaluate all log-likelihoods exactly.
         """
         self.step = step
         self.vmax = vmax
         self.logbf_thresh = logbf_thresh
+        self.psi_resolution = psi_resolution
+        self.events_per_second = None
 
         self.parameters = np.arange(2, self.vmax + self.step,
                                     self.step).astype(float)
@@ -90,6 +172,16 @@ class ModalityEstimator(object):
                   'bimodal': self.bimodal_model,
                   'middle': self.middle_model}
 
+        if self.psi_resolution is not None:
+            n_grid = int(np.round(1. / self.psi_resolution)) + 1
+            self.psi_grid = np.linspace(0, 1, n_grid)
+            self.logpdf_tables = dict(
+                (name, m.logpdf_table(self.psi_grid))
+                for name, m in self.models.iteritems())
+        else:
+            self.psi_grid = None
+            self.logpdf_tables = None
+
     def _loglik(self, event):
         """Calculate log-likelihoods of an event, given the modality models"""
         return dict((name, m.logliks(event))
@@ -111,14 +203,20 @@ class ModalityEstimator(object):
         """
         return logsumexps.idxmax()
 
-    def fit_transform(self, data):
+    def fit_transform(self, data, verbose=False):
         """Get the modality assignments of each splicing event in the data
 
+        The log-likelihoods of all events are calculated at once, and the
+        throughput of the last call is stored in ``events_per_second``.
+
         Parameters
         ----------
         data : pandas.DataFrame
             A (n_samples, n_events) dataframe of splicing events' PSI scores.
             Must be psi scores which range from 0 to 1
+        verbose : bool, optional (default=False)
+            If True, output the number of events per second that were
+            assigned a modality
 
         Returns
         -------
@@ -134,11 +232,322 @@ class ModalityEstimator(object):
         assert np.all(data.values.flat[np.isfinite(data.values.flat)] <= 1)
         assert np.all(data.values.flat[np.isfinite(data.values.flat)] >= 0)
 
-        logsumexp_logliks = data.apply(lambda x:
-                                       pd.Series({k: v.logsumexp_logliks(x)
-                                       for k, v in self.models.iteritems()}), axis=0)
+        t0 = time.time()
+        logsumexp_logliks = self._logsumexp_logliks_matrix(data)
         logsumexp_logliks.ix['uniform'] = self.logbf_thresh
-        return logsumexp_logliks.idxmax()
+        assignments = logsumexp_logliks.idxmax()
+
+        elapsed = time.time() - t0
+        self.events_per_second = data.shape[1] / elapsed if elapsed > 0 \
+            else np.inf
+        if verbose:
+            sys.stderr.write('Assigned modalities to {} events ({:.1f} events '
+                             'per second)\n'.format(data.shape[1],
+                                                    self.events_per_second))
+        return assignments
+
+    def grouped_fit_transform(self, data, groupby, n_jobs=1, chunksize=None):
+        """Modality assignments of each group of samples, in parallel
+
+        Equivalent to ``data.groupby(groupby).apply(self.fit_transform)``,
+        but every (group, chunk of events) pair is assigned in a separate
+        job. The PSI matrix is handed to the workers once as a read-only
+        memory map instead of being copied to every job.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            A (n_samples, n_events) dataframe of splicing events' PSI scores
+        groupby : mappable
+            A sample id to phenotype group mapping
+        n_jobs : int, optional (default=1)
+            Number of processes to use. If -1, use all CPUs
+        chunksize : int, optional (default=None)
+            Number of events per job. If None, split the events of each group
+            evenly across ``n_jobs``
+
+        Returns
+        -------
+        modality_assignments : pandas.DataFrame
+            A (n_groups, n_events) dataframe of the estimated modality of
+            each splicing event in each group
+        """
+        grouped = data.groupby(groupby)
+        group_to_rows = grouped.indices
+        names = sorted(group_to_rows.keys())
+
+        n_events = data.shape[1]
+        if chunksize is None:
+            n_workers = cpu_count() if n_jobs < 0 else max(n_jobs, 1)
+            chunksize = int(np.ceil(n_events / float(n_workers)))
+        chunksize = max(chunksize, 1)
+        starts = np.arange(0, n_events, chunksize)
+
+        x = data.values
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_transform_chunk)(self, x, group_to_rows[name], start,
+                                          start + chunksize)
+            for name in names for start in starts)
+
+        results = iter(results)
+        assignments = [np.concatenate([next(results) for _ in starts])
+                       for name in names]
+        index = pd.Index(names, name=getattr(groupby, 'name', None))
+        return pd.DataFrame(assignments, index=index, columns=data.columns)
+
+    def bootstrap_fit_transform(self, data, n_iter=100, random_state=0,
+                                n_jobs=1, chunksize=None):
+        """Frequency of each modality assignment over bootstrapped samples
+
+        Samples are resampled with replacement ``n_iter`` times. Rather than
+        calling :py:meth:`ModalityEstimator.fit_transform` once per replicate,
+        the resampled indices are drawn once and turned into a
+        (n_iter, n_samples) matrix of how often each sample was drawn, so the
+        sufficient statistics of every replicate are a single matrix product
+        and all replicates' log-likelihoods are evaluated at once. Events are
+        assigned in chunks, so at most ``BOOTSTRAP_MAX_LOGLIKS``
+        log-likelihoods are held in memory per job.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            A (n_samples, n_events) dataframe of splicing events' PSI scores.
+            Must be psi scores which range from 0 to 1
+        n_iter : int, optional (default=100)
+            Number of bootstrap resampling iterations
+        random_state : int or None, optional (default=0)
+            Seed for drawing the resampled indices
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the chunks of events across. If -1,
+            use all CPUs
+        chunksize : int, optional (default=None)
+            Number of events per chunk. If None, split the events evenly
+            across ``n_jobs``. Never more than fit in
+            ``BOOTSTRAP_MAX_LOGLIKS``
+
+        Returns
+        -------
+        frequencies : pandas.DataFrame
+            A (n_modalities, n_events) dataframe of the fraction of
+            bootstrap replicates in which each event was assigned to each
+            modality
+
+        Notes
+        -----
+        Log-likelihoods are always evaluated exactly, even if
+        ``psi_resolution`` was given.
+        """
+        assert np.all(data.values.flat[np.isfinite(data.values.flat)] <= 1)
+        assert np.all(data.values.flat[np.isfinite(data.values.flat)] >= 0)
+
+        n_samples, n_events = data.shape
+        random_state = np.random.RandomState(random_state)
+        indices = random_state.randint(n_samples, size=(n_iter, n_samples))
+
+        # Offset each replicate so a single bincount counts them all at once
+        indices += np.arange(n_iter)[:, np.newaxis] * n_samples
+        weights = np.bincount(indices.ravel(),
+                              minlength=n_iter * n_samples).reshape(
+            n_iter, n_samples).astype(float)
+
+        n_parameters = max(len(m.alphas) for m in self.models.values())
+        max_chunksize = max(BOOTSTRAP_MAX_LOGLIKS // (n_parameters * n_iter),
+                            1)
+        if chunksize is None:
+            n_workers = cpu_count() if n_jobs < 0 else max(n_jobs, 1)
+            chunksize = int(np.ceil(n_events / float(n_workers)))
+        chunksize = max(min(chunksize, max_chunksize), 1)
+        starts = np.arange(0, n_events, chunksize)
+
+        x = data.values
+        counts = Parallel(n_jobs=n_jobs)(
+            delayed(_bootstrap_counts_chunk)(self, x, weights, start,
+                                             start + chunksize)
+            for start in starts)
+
+        names = sorted(self.models.keys()) + ['uniform']
+        counts = np.concatenate(counts, axis=1) if len(counts) > 0 \
+            else np.zeros((len(names), 0))
+        return pd.DataFrame(counts / float(n_iter), index=names,
+                            columns=data.columns)
+
+    def _bootstrap_counts(self, x, weights):
+        """Number of bootstrap replicates assigned to each modality
+
+        Parameters
+        ----------
+        x : numpy.array
+            A (n_samples, n_events) array of PSI scores
+        weights : numpy.array
+            A (n_iter, n_samples) array of how many times each sample was
+            drawn in each replicate
+
+        Returns
+        -------
+        counts : numpy.array
+            A (n_modalities, n_events) array of the number of replicates
+            assigned to each modality, in the order of the sorted modality
+            names followed by "uniform"
+        """
+        n_iter = weights.shape[0]
+        n, sum_log_x, sum_log_1mx = beta_sufficient_statistics(x, weights)
+        names = sorted(self.models.keys())
+        logsumexps = [logsumexp(self.models[name].logliks_matrix(
+            n, sum_log_x, sum_log_1mx), axis=0) for name in names]
+        logsumexps.append(np.ones((n_iter, x.shape[1])) * self.logbf_thresh)
+
+        # Ties go to the first modality, as with pandas' idxmax
+        assignments = np.argmax(np.array(logsumexps), axis=0)
+        return np.array([(assignments == i).sum(axis=0)
+                         for i in range(len(logsumexps))])
+
+    def _logsumexp_logliks_matrix(self, data):
+        """Logsumexp'd log-likelihoods of all events under each modality
+
+        Instead of calling :py:meth:`ModalityModel.logsumexp_logliks` once per
+        event, evaluate all models' parameters on all events at once with
+        :py:meth:`ModalityEstimator._logliks_matrix`.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            A (n_samples, n_events) dataframe of PSI scores
+
+        Returns
+        -------
+        logsumexp_logliks : pandas.DataFrame
+            A (n_modalities, n_events) dataframe of the logsumexp'd
+            log-likelihoods of each event in each modality
+        """
+        logliks = self._logliks_matrix(data.values)
+        logsumexps = dict((name, logsumexp(loglik, axis=0))
+                          for name, loglik in logliks.iteritems())
+        return pd.DataFrame(logsumexps, index=data.columns).T
+
+    def _logliks_matrix(self, x):
+        """Log-likelihoods of every event under every model's parameters
+
+        Without ``psi_resolution``, the (n_samples, n_events) matrix is
+        reduced to per-event sufficient statistics. NA values are masked
+        out, exactly as :py:meth:`ModalityModel.logliks` ignores non-finite
+        values. With ``psi_resolution``, the quantized PSI values of each
+        event are counted and multiplied with the precomputed log-pdf tables,
+        and only values within half a grid step of 0 or 1 are evaluated
+        exactly.
+
+        Parameters
+        ----------
+        x : numpy.array
+            A (n_samples, n_events) array of PSI scores
+
+        Returns
+        -------
+        logliks : dict
+            A modality name to (n_parameters, n_events) array mapping of
+            log-likelihoods
+        """
+        if self.logpdf_tables is not None:
+            x = np.asarray(x, dtype=float)
+            n_grid = self.psi_grid.shape[0]
+            half_step = 0.5 / (n_grid - 1)
+            with np.errstate(invalid='ignore'):
+                tails = (x < half_step) | (x > 1 - half_step)
+            counts = quantized_psi_counts(np.where(tails, np.nan, x), n_grid)
+            n, sum_log_x, sum_log_1mx = beta_sufficient_statistics(
+                np.where(tails, x, np.nan))
+            return dict(
+                (name, table.dot(counts) + self.models[name].logliks_matrix(
+                    n, sum_log_x, sum_log_1mx))
+                for name, table in self.logpdf_tables.iteritems())
+
+        n, sum_log_x, sum_log_1mx = beta_sufficient_statistics(x)
+        return dict((name, model.logliks_matrix(n, sum_log_x, sum_log_1mx))
+                    for name, model in self.models.iteritems())
+
+
+def quantized_psi_counts(x, n_grid):
+    """Count the PSI values of each column on an evenly spaced grid
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_samples, n_events) array of values between 0 and 1
+    n_grid : int
+        Number of evenly spaced grid points from 0 to 1, inclusive
+
+    Returns
+    -------
+    counts : numpy.array
+        A (n_grid, n_events) array of the number of finite values of each
+        column that are nearest to each grid point
+    """
+    x = np.asarray(x, dtype=float)
+    n_events = x.shape[1]
+    finite = np.isfinite(x)
+
+    index = np.zeros(x.shape, dtype=int)
+    index[finite] = np.round(x[finite] * (n_grid - 1)).astype(int)
+
+    # Offset each column so a single bincount counts every event at once
+    index += np.arange(n_events) * n_grid
+    counts = np.bincount(index[finite], minlength=n_grid * n_events)
+    return counts.reshape(n_events, n_grid).T.astype(float)
+
+
+def _fit_transform_chunk(estimator, x, rows, start, stop):
+    """Assign modalities to a block of a PSI matrix, in a worker process"""
+    chunk = pd.DataFrame(x[rows, start:stop])
+    return estimator.fit_transform(chunk).values
+
+
+def _bootstrap_counts_chunk(estimator, x, weights, start, stop):
+    """Bootstrapped modality counts of a block of events, in a worker
+    process"""
+    return estimator._bootstrap_counts(x[:, start:stop], weights)
+
+
+def beta_sufficient_statistics(x, weights=None):
+    """Per-column sufficient statistics of beta-distributed data
+
+    As in :py:meth:`ModalityModel.logliks`, values of exactly 0 and 1 are
+    replaced with 0.001 and 0.999, and non-finite values are ignored.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_samples, n_events) array of values between 0 and 1
+    weights : numpy.array, optional (default=None)
+        A (n_replicates, n_samples) array of how many times each sample is
+        counted in each replicate, e.g. of a bootstrap. If None, every
+        sample is counted once
+
+    Returns
+    -------
+    n : numpy.array
+        A (n_events,) array of the number of finite values in each column,
+        or (n_replicates, n_events) if ``weights`` is given
+    sum_log_x : numpy.array
+        A (n_events,) array of the sum of log(x) of each column,
+        or (n_replicates, n_events) if ``weights`` is given
+    sum_log_1mx : numpy.array
+        A (n_events,) array of the sum of log(1-x) of each column,
+        or (n_replicates, n_events) if ``weights`` is given
+    """
+    x = np.array(x, dtype=float)
+    x[x == 0] = 0.001
+    x[x == 1] = 0.999
+    finite = np.isfinite(x)
+
+    # Fill the masked values with something whose log is finite, then zero
+    # out their contribution
+    x[~finite] = 0.5
+    if weights is not None:
+        return weights.dot(finite), weights.dot(np.log(x) * finite), \
+            weights.dot(np.log(1 - x) * finite)
+    n = finite.sum(axis=0).astype(float)
+    sum_log_x = (np.log(x) * finite).sum(axis=0)
+    sum_log_1mx = (np.log(1 - x) * finite).sum(axis=0)
+    return n, sum_log_x, sum_log_1mx
 
 
 def switchy_score(array):
@@ -166,6 +575,31 @@ def switchy_score(array):
     return variance * mean_value
 
 
+def switchy_scores(x):
+    """Switchy scores of every column of a 2D array of data scores at once
+
+    Vectorized, NA-aware equivalent of applying :py:func:`switchy_score` to
+    each column.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A 2-D numpy array in the shape [n_samples, n_events]
+
+    Returns
+    -------
+    switchy_scores : numpy.array
+        A 1-D array of the switchy score of each column
+    """
+    x = np.asarray(x, dtype=float) * np.pi
+    with warnings.catch_warnings():
+        # All-NA columns get a NA score, as with switchy_score
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        variance = 1 - np.nanstd(np.sin(x), axis=0)
+        mean_value = -np.nanmean(np.cos(x), axis=0)
+    return variance * mean_value
+
+
 def get_switchy_score_order(x):
     """Apply switchy scores to a 2D array of data scores
 
@@ -179,5 +613,32 @@ def get_switchy_score_order(x):
     score_order : numpy.array
         A 1-D array of the ordered indices, in switchy score order
     """
-    switchy_scores = np.apply_along_axis(switchy_score, axis=0, arr=x)
-    return np.argsort(switchy_scores)
+    return np.argsort(switchy_scores(x))
+
+
+@lru_memoize()
+def _switchy_score_order(x):
+    """Switchy score order of an array, memoized on its contents"""
+    return get_switchy_score_order(x)
+
+
+def cached_switchy_score_order(x):
+    """Switchy score order of a 2D array, remembered by the array's contents
+
+    The same PSI scores are often ordered again and again, e.g. when
+    redrawing lavalamp plots of several phenotypes sorted on the same
+    events. The order is memoized with :py:func:`flotilla.util.lru_memoize`,
+    keyed on the contents of the array, so it is only calculated once.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A 2-D numpy array in the shape [n_samples, n_events]
+
+    Returns
+    -------
+    score_order : numpy.array
+        A 1-D array of the ordered indices, in switchy score order
+    """
+    # A copy, so the remembered order can't be modified
+    return _switchy_score_order(np.asarray(x, dtype=float)).copy()
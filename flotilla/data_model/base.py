@@ -2,16 +2,19 @@
 Base data class for all data types. All data types in flotilla inherit from
 this, or a child object (like ExpressionData).
 """
+import os
 import sys
+import tempfile
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-from sklearn.preprocessing import StandardScaler
 
 from ..compute.decomposition import DataFramePCA, DataFrameNMF
-from ..compute.infotheory import binify, cross_phenotype_jsd, jsd_df_to_2d
+from ..compute.generic import FeatureStats, Standardizer
+from ..compute.infotheory import binify, cross_phenotype_jsd, \
+    jsd_df_to_2d, jsd_permutation_test
 from ..compute.predict import PredictorConfigManager, PredictorDataSetManager, \
     CLASSIFIER
 from ..visualize.decomposition import DecompositionViz
@@ -19,12 +22,16 @@ from ..visualize.generic import violinplot, nmf_space_transitions, \
     simple_twoway_scatter
 from ..visualize.network import NetworkerViz
 from ..visualize.predict import ClassifierViz
-from ..util import memoize, cached_property
+from ..util import lru_memoize, cached_property, content_hash, \
+    stored_result, RenameIndex, SubsetIndex
 from ..compute.outlier import OutlierDetection
 from scipy.cluster.vq import whiten
 
 MINIMUM_FEATURE_SUBSET = 20
 
+# Rows copied at a time when writing or scanning memory-mapped data
+MEMMAP_BLOCK_ROWS = 1024
+
 
 class BaseData(object):
     """Base class for biological data measurements.
@@ -74,6 +81,17 @@ class BaseData(object):
 
     """
 
+    # If set to a flotilla.util.ResultStore, e.g. by Study.use_result_store,
+    # expensive results like reductions and classifiers are saved to and
+    # loaded from disk
+    result_store = None
+
+    # Assigning any of these bumps :py:attr:`BaseData.data_version`
+    _versioned_attributes = frozenset(
+        ['data', 'data_original', 'feature_data', 'thresh',
+         'minimum_samples', 'technical_outliers', 'pooled_samples',
+         'outlier_samples', 'single_samples', 'feature_rename_col'])
+
     def __init__(self, data, thresh=-np.inf,
                  minimum_samples=0,
                  feature_data=None,
@@ -83,7 +101,7 @@ class BaseData(object):
                  outliers=None,
                  pooled=None,
                  predictor_config_manager=None,
-                 data_type=None):
+                 data_type=None, memmap_dir=None):
         """Abstract base class for biological measurements
 
         Parameters
@@ -131,6 +149,11 @@ class BaseData(object):
         data_type : str, optional (default=None)
             A string indicating what kind of data this is, e.g. "expression" or
             "splicing"
+        memmap_dir : str, optional (default=None)
+            If provided, keep ``data`` and ``data_original`` as float32
+            files in this folder, memory-mapped instead of in RAM. Only the
+            index and columns are held in memory, and subsets like
+            :py:attr:`singles` read only the rows and columns they need.
 
         Notes
         -----
@@ -143,12 +166,21 @@ class BaseData(object):
             raise ValueError('flotilla does not currently support '
                              'multi-indexed dataframes')
 
-        self.data = data
-        self.data_original = self.data.copy()
+        self.data_type = data_type
+        self.memmap_dir = memmap_dir
+        self._memmaps = {}
+        if self.memmap_dir is not None:
+            if not os.path.exists(self.memmap_dir):
+                os.makedirs(self.memmap_dir)
+            self.data_original = self._memmap_take(data,
+                                                   name='data_original')
+            self.data = self.data_original
+        else:
+            self.data = data
+            self.data_original = self.data.copy()
         self.thresh = thresh if thresh is not None else -np.inf
         self.minimum_samples = minimum_samples if minimum_samples \
                                                   is not None else 0
-        self.data_type = data_type
         self.technical_outliers = technical_outliers
 
         if self.technical_outliers is not None and len(self.technical_outliers) > 0:
@@ -156,7 +188,10 @@ class BaseData(object):
                              "in {0}:\n\t{1}\n".format(
                 self.data_type, ", ".join(self.technical_outliers)))
             good_samples = ~self.data.index.isin(self.technical_outliers)
-            self.data = self.data.ix[good_samples]
+            if self.memmap_dir is not None:
+                self.data = self._memmap_take(self.data, rows=good_samples)
+            else:
+                self.data = self.data.ix[good_samples]
 
         self.pooled_samples = pooled if pooled is not None else []
         self.outlier_samples = outliers if outliers is not None else []
@@ -165,10 +200,25 @@ class BaseData(object):
 
         if self.thresh > -np.inf or self.minimum_samples > 0:
             # self.data_original = self.data.copy()
-            if not self.singles.empty:
-                self.data = self._threshold(self.data, self.singles)
+            feature_stats = self.feature_stats
+            if len(self._partition_rows['singles']) > 0:
+                other_stats = self._singles_feature_stats
+            else:
+                other_stats = feature_stats
+            enough_samples = other_stats.n_above >= self.minimum_samples
+            if self.memmap_dir is not None:
+                self.data = self._memmap_take(self.data,
+                                              columns=enough_samples)
             else:
-                self.data = self._threshold(self.data)
+                self.data = self.data.ix[:, enough_samples]
+            # Only features were removed, so keep their statistics
+            self.__dict__['_feature_stats'] = \
+                self.data_version, feature_stats.take(enough_samples)
+
+        if self.memmap_dir is not None and self.data is self.data_original:
+            # Don't share a file with data_original, as data may be
+            # modified in place, e.g. by ExpressionData's log_base
+            self.data = self._memmap_take(self.data)
 
         self.feature_data = feature_data
         self.feature_ignore_subset_cols = [] if feature_ignore_subset_cols is \
@@ -195,6 +245,61 @@ class BaseData(object):
 
         self.networks = NetworkerViz(self)
 
+    def __setattr__(self, name, value):
+        if name in self._versioned_attributes:
+            self.__dict__['_data_version'] = self.data_version + 1
+            if name not in ('data', 'thresh'):
+                # The values of the data are the same, e.g. only the
+                # outliers changed, so their statistics are still valid
+                version, stats = self.__dict__.get('_feature_stats',
+                                                   (None, None))
+                if version == self.data_version - 1:
+                    self.__dict__['_feature_stats'] = \
+                        self.data_version, stats
+        super(BaseData, self).__setattr__(name, value)
+
+    @property
+    def data_version(self):
+        """Number of times the data, samples or features have changed
+
+        Cached properties and memoized methods are recomputed when this
+        changes. It is incremented whenever e.g. ``data`` or
+        ``outlier_samples`` is assigned, but not when a dataframe is
+        modified in place, so call :py:meth:`BaseData.data_changed` after
+        doing that.
+        """
+        return self.__dict__.get('_data_version', 0)
+
+    @property
+    def data_content_hash(self):
+        """Hash of the data, the single, pooled and outlier samples, and
+        the feature data used to rename features
+
+        Used to key results stored on disk, so they are found again in
+        another session. Recomputed only when :py:attr:`data_version`
+        changes. The data and feature data are hashed again then, in case
+        they were modified in place before :py:meth:`data_changed`.
+        """
+        version, digest = self.__dict__.get('_data_content_hash',
+                                            (None, None))
+        if version != self.data_version:
+            feature_data = self.feature_data
+            if feature_data is not None:
+                feature_data = content_hash(feature_data, refresh=True)
+            digest = content_hash((type(self).__name__,
+                                   content_hash(self.data, refresh=True),
+                                   list(self.single_samples),
+                                   list(self.pooled_samples),
+                                   list(self.outlier_samples),
+                                   feature_data, self.feature_rename_col))
+            self.__dict__['_data_content_hash'] = self.data_version, digest
+        return digest
+
+    def data_changed(self):
+        """Mark the data as changed, e.g. after modifying it in place, so
+        cached results are recomputed"""
+        self.__dict__['_data_version'] = self.data_version + 1
+
     def _threshold(self, data, other=None):
         """Only take features with expression greater than the threshold,
         in at least the minimum number of samples.
@@ -215,24 +320,241 @@ class BaseData(object):
         """
         if other is None:
             other = data
-        filtered = data.ix[:, other[other > self.thresh].count() >=
-                              self.minimum_samples]
+        if other is self.data:
+            stats = self.feature_stats
+        else:
+            stats = self._compute_feature_stats(other)
+        enough_samples = pd.Series(stats.n_above >= self.minimum_samples,
+                                   index=other.columns)
+        filtered = data.ix[:, enough_samples]
         return filtered
 
+    def _compute_feature_stats(self, data, rows=None):
+        """:py:class:`.FeatureStats` of ``data``, in one pass over its rows
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data, either in memory or memory-mapped by this instance
+        rows : numpy.array, optional (default=None)
+            Positions of the rows of ``data`` to use. If None, use all.
+        """
+        values = self._memmap_values(data)
+        if values is None:
+            values = data.values
+        return FeatureStats.from_values(values, rows=rows, thresh=self.thresh,
+                                        index=data.columns,
+                                        block_rows=MEMMAP_BLOCK_ROWS)
+
+    @property
+    def feature_stats(self):
+        """Count, mean, variance, minimum, maximum and number of samples
+        above ``thresh`` of each feature in :py:attr:`data`
+
+        Computed in one pass, and only again when :py:attr:`data` or
+        ``thresh`` change, not when e.g. the outlier samples do.
+
+        Returns
+        -------
+        feature_stats : flotilla.compute.generic.FeatureStats
+        """
+        version, stats = self.__dict__.get('_feature_stats', (None, None))
+        if version != self.data_version:
+            stats = self._compute_feature_stats(self.data)
+            self.__dict__['_feature_stats'] = self.data_version, stats
+        return stats
+
+    @property
+    def _singles_feature_stats(self):
+        """:py:attr:`feature_stats` of only the single cells
+
+        The statistics of the pooled samples are removed from those of all
+        the samples, rather than reading all the single cells again.
+        """
+        version, stats = self.__dict__.get('_singles_feature_stats_cache',
+                                           (None, None))
+        if version != self.data_version:
+            pooled_rows = self._partition_rows['pooled']
+            stats = self.feature_stats
+            if len(pooled_rows) > 0:
+                values = self._memmap_values(self.data)
+                if values is None:
+                    values = self.data.values
+                single_rows = np.flatnonzero(~self.data.index.isin(
+                    self.data.index[pooled_rows]))
+                stats = stats.remove(
+                    self._compute_feature_stats(self.data, pooled_rows),
+                    values, single_rows)
+            self.__dict__['_singles_feature_stats_cache'] = \
+                self.data_version, stats
+        return stats
+
+    def _memmap_values(self, data):
+        """The memory-mapped array behind ``data``, or None if it isn't one
+        of the memory-mapped dataframes of this instance"""
+        for frame, values in self._memmaps.values():
+            if frame is data:
+                return values
+        return None
+
+    def _memmap_take(self, data, rows=None, columns=None, name='data'):
+        """Copy rows and columns of ``data`` into a memory-mapped file
+
+        The values are written as float32 to ``name`` in ``memmap_dir``, a
+        block of rows at a time, so the whole matrix is never in memory.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data to copy, either in memory or memory-mapped by this instance
+        rows, columns : boolean array, optional (default=None)
+            Which rows and columns of ``data`` to copy. If None, use all.
+        name : str, optional (default='data')
+            Name of the file, prefixed by the ``data_type``
+
+        Returns
+        -------
+        memmapped : pandas.DataFrame
+            The copied data, backed by the memory-mapped file
+        """
+        values = self._memmap_values(data)
+        if values is None:
+            values = data.values
+        rows = np.arange(values.shape[0]) if rows is None \
+            else np.flatnonzero(rows)
+        columns = np.arange(values.shape[1]) if columns is None \
+            else np.flatnonzero(columns)
+        shape = len(rows), len(columns)
+
+        if self.data_type is not None:
+            name = '{}_{}'.format(self.data_type, name)
+        filename = os.path.join(self.memmap_dir, '{}.float32'.format(name))
+
+        if 0 in shape:
+            # Empty files can't be memory-mapped
+            memmap = np.empty(shape, dtype=np.float32)
+        else:
+            # Write to a temporary file and then rename it, so a memmap that
+            # is already open on ``filename``, like ``values``, stays valid
+            fd, temp_filename = tempfile.mkstemp(dir=self.memmap_dir,
+                                                 suffix='.float32')
+            os.close(fd)
+            memmap = np.memmap(temp_filename, dtype=np.float32, mode='w+',
+                               shape=shape)
+            for start in range(0, len(rows), MEMMAP_BLOCK_ROWS):
+                block = rows[start:start + MEMMAP_BLOCK_ROWS]
+                memmap[start:start + len(block)] = values[block][:, columns]
+            memmap.flush()
+            os.rename(temp_filename, filename)
+
+        memmapped = pd.DataFrame(memmap, index=data.index[rows],
+                                 columns=data.columns[columns], copy=False)
+        self._memmaps[name] = memmapped, memmap
+        return memmapped
+
+    def _take(self, data, rows=None, columns=None):
+        """Copy these rows and columns of ``data``, by position, at once
+
+        Works the same for memory-mapped data, reading only these rows and
+        columns from disk.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data to copy, either in memory or memory-mapped by this instance
+        rows, columns : integer array, optional (default=None)
+            Positions of the rows and columns of ``data`` to copy. If None,
+            use all.
+
+        Returns
+        -------
+        taken : pandas.DataFrame
+            The copied rows and columns
+        """
+        values = self._memmap_values(data)
+        if values is None:
+            values = data.values
+        rows = np.arange(data.shape[0]) if rows is None else rows
+        columns = np.arange(data.shape[1]) if columns is None else columns
+        return pd.DataFrame(np.asarray(values[np.ix_(rows, columns)]),
+                            index=data.index[rows],
+                            columns=data.columns[columns])
+
+    @lru_memoize()
+    def _positions(self, index, ids):
+        """Positions of the ``ids`` in ``index``, in the order of ``index``
+
+        Ids which aren't in ``index`` are ignored. Memoized, so looking up
+        the same subset of the same data again is free.
+        """
+        return np.flatnonzero(index.isin(ids))
+
+    @cached_property()
+    def _partition_rows(self):
+        """Positions of the "singles", "pooled" and "outliers" samples in
+        :py:attr:`data`, in the order of those samples"""
+        index = self.data.index
+        partition_rows = {}
+        for name, sample_ids in (('singles', self.single_samples),
+                                 ('pooled', self.pooled_samples),
+                                 ('outliers', self.outlier_samples)):
+            if index.is_unique:
+                rows = index.get_indexer(sample_ids)
+                rows = rows[rows >= 0]
+            else:
+                rows = np.flatnonzero(index.isin(sample_ids))
+            partition_rows[name] = rows
+        return partition_rows
+
+    def _transform_data(self, func):
+        """Apply ``func`` to the values of ``data``
+
+        Memory-mapped data is transformed in place, a block of rows at a
+        time, instead of making a new copy.
+        """
+        values = self._memmap_values(self.data)
+        if values is None:
+            self.data = func(self.data)
+            return
+        for start in range(0, values.shape[0], MEMMAP_BLOCK_ROWS):
+            stop = start + MEMMAP_BLOCK_ROWS
+            values[start:stop] = func(values[start:stop])
+        if isinstance(values, np.memmap):
+            values.flush()
+        self.data_changed()
+
     def _feature_renamer(self, x):
         """Rename a feature from a crazy ID like 'ENSG00000100320' to 'RBFOX2'
         """
-        if x in self.feature_renamer_series.index:
-            rename = self.feature_renamer_series[x]
-            if isinstance(rename, pd.Series):
-                return rename.values[0]
-            else:
-                return rename
+        return self.feature_renamer_index.name(
+            x, missing=self._unrenamed_feature)
+
+    @staticmethod
+    def _unrenamed_feature(x):
+        """Name of a feature without a renamed id"""
+        if type(x) == str:
+            return x
         else:
-            if type(x) == str:
-                return x
-            else:
-                return '_'.join(x)
+            return '_'.join(x)
+
+    def rename_features(self, feature_ids):
+        """Rename many feature ids at once, like :py:attr:`feature_renamer`
+
+        Parameters
+        ----------
+        feature_ids : list-like
+            Feature ids, e.g. the columns of :py:attr:`data`
+
+        Returns
+        -------
+        renamed : list
+            Renamed, shortened feature ids
+        """
+        if self.feature_data is not None and self.feature_rename_col is not \
+                None:
+            feature_ids = self.feature_renamer_index.rename(
+                feature_ids, missing=self._unrenamed_feature)
+        return [self._shortener(x) for x in feature_ids]
 
     @staticmethod
     def _shortener(x, renamer=None, max_char_len=20):
@@ -267,17 +589,17 @@ class BaseData(object):
     @property
     def singles(self):
         """Data from only the single cells"""
-        return self.data.ix[self.single_samples]
+        return self._take(self.data, self._partition_rows['singles'])
 
     @property
     def pooled(self):
         """Data from only the pooled samples"""
-        return self.data.ix[self.pooled_samples]
+        return self._take(self.data, self._partition_rows['pooled'])
 
     @property
     def outliers(self):
         """Data from only the outlier samples"""
-        return self.data.ix[self.outlier_samples]
+        return self._take(self.data, self._partition_rows['outliers'])
 
     @cached_property()
     def feature_renamer_series(self):
@@ -292,6 +614,13 @@ class BaseData(object):
             return pd.Series(self.data_original.columns.values,
                              index=self.data_original.columns)
 
+    @cached_property()
+    def feature_renamer_index(self):
+        """:py:class:`.RenameIndex` of :py:attr:`feature_renamer_series`, to
+        look up renamed ids and the feature ids of gene symbols in constant
+        time"""
+        return RenameIndex(self.feature_renamer_series)
+
     def maybe_renamed_to_feature_id(self, feature_id):
         """To be able to give a simple gene name, e.g. "RBFOX2" and get the
         official ENSG ids or MISO ids
@@ -307,10 +636,8 @@ class BaseData(object):
         feature_id : str or list-like
             Valid Feature ID(s) that can be used to subset self.data
         """
-        if feature_id in self.feature_renamer_series.values:
-            feature_ids = self.feature_renamer_series[
-                self.feature_renamer_series ==
-                feature_id].index
+        feature_ids = self.feature_renamer_index.ids(feature_id)
+        if len(feature_ids) > 0:
             return self.data.columns.intersection(feature_ids)
         elif feature_id in self.data.columns:
             return feature_id
@@ -322,13 +649,15 @@ class BaseData(object):
     @property
     def _var_cut(self):
         """Variance cutoff, 2 std devs away from mean variance"""
-        return self.data.var().dropna().mean() + 2 * self.data.var() \
-            .dropna().std()
+        variance = pd.Series(self.feature_stats.variance).dropna()
+        return variance.mean() + 2 * variance.std()
 
     @property
     def variant(self):
         """Features whose variance is 2 std devs away from mean variance"""
-        return self.data.columns[self.data.var() > self._var_cut]
+        with np.errstate(invalid='ignore'):
+            is_variant = self.feature_stats.variance > self._var_cut
+        return self.data.columns[is_variant]
 
     # def drop_outliers(self, data, outliers):
     #     # assert 'outlier' din self.experiment_design_data.columns
@@ -338,37 +667,62 @@ class BaseData(object):
     #     outlier_data = data.ix[outliers]
     #     return data, outlier_data
 
+    @cached_property()
+    def feature_subset_index(self):
+        """:py:class:`.SubsetIndex` of the feature subsets, to look up and
+        combine them without grouping the feature data again
+
+        Aligned to the features of :py:attr:`feature_data`, followed by any
+        features of the data which have no feature data.
+        """
+        if self.feature_data is None:
+            index = self.data.columns
+        else:
+            index = self.feature_data.index
+            index = index.append(
+                self.data.columns[~self.data.columns.isin(index)])
+        feature_subset_index = subset_index_from_metadata(
+            self.feature_data, MINIMUM_FEATURE_SUBSET, 'features',
+            ignore=self.feature_ignore_subset_cols, index=index)
+        feature_subset_index.add('variant', index.isin(self.variant))
+        return feature_subset_index
+
     @property
     def feature_subsets(self):
         """Dict of feature subset names to their list of feature ids"""
-        feature_subsets = subsets_from_metadata(
-            self.feature_data, MINIMUM_FEATURE_SUBSET, 'features',
-            ignore=self.feature_ignore_subset_cols)
-        feature_subsets['variant'] = self.variant
-        return feature_subsets
+        return self.feature_subset_index.to_dict()
 
     def feature_subset_to_feature_ids(self, feature_subset, rename=True):
-        """Convert a feature subset name to a list of feature ids"""
+        """Convert a feature subset name, or a query combining them such as
+        "variant & ~gene_type: protein_coding", to a list of feature ids"""
         feature_ids = pd.Index([])
         if feature_subset is not None:
             try:
-                if feature_subset in self.feature_subsets:
-                    feature_ids = self.feature_subsets[feature_subset]
-                elif feature_subset.startswith('all'):
+                feature_ids = self.feature_subset_index.ids(feature_subset)
+            except (KeyError, ValueError):
+                if feature_subset.startswith('all'):
                     feature_ids = self.data.columns
             except TypeError:
                 if not isinstance(feature_subset, str):
                     feature_ids = feature_subset
                     n_custom = self.feature_data.columns.map(
                         lambda x: x.startswith('custom')).sum()
-                    self.feature_data['custom_{}'.format(n_custom + 1)] = \
+                    name = 'custom_{}'.format(n_custom + 1)
+                    self.feature_data[name] = \
                         self.feature_data.index.isin(feature_ids)
+                    feature_subset_index = self.feature_subset_index
+                    mask = feature_subset_index.index.isin(feature_ids)
+                    feature_subset_index.add(name, mask)
+                    feature_subset_index.add(
+                        'not ({})'.format(name),
+                        feature_subset_index.index.isin(
+                            self.feature_data.index) & ~mask)
                 else:
                     raise ValueError(
                         "There are no {} features in this data: "
                         "{}".format(feature_subset, self))
             if rename:
-                feature_ids = map(self.feature_renamer, feature_ids)
+                feature_ids = self.rename_features(feature_ids)
         else:
             feature_ids = self.data.columns
         return feature_ids
@@ -406,7 +760,15 @@ class BaseData(object):
     #     elif 'samples'.startswith(between):
     #         pass
 
-    def jsd_df(self, groupby=None, n_iter=100, n_bins=10):
+    def _singles_bins(self, n_bins):
+        """``n_bins`` evenly spaced edges from the minimum to the maximum
+        of the single cells"""
+        stats = self._singles_feature_stats
+        return np.linspace(np.nanmin(stats.minimum), np.nanmax(stats.maximum),
+                           n_bins)
+
+    @stored_result
+    def jsd_df(self, groupby=None, n_iter=100, n_bins=10, n_jobs=1):
         """Jensen-Shannon divergence of features across phenotypes
 
         Parameters
@@ -418,6 +780,9 @@ class BaseData(object):
             within-group comparisons
         n_bins : int
             Number of bins to binify the singles data on
+        n_jobs : int
+            Number of processes to spread the within-phenotype bootstraps
+            across. If -1, use all CPUs
 
         Returns
         -------
@@ -425,12 +790,38 @@ class BaseData(object):
             A (n_features, n_phenotypes^2) dataframe of the JSD between each
             feature between and within phenotypes
         """
-        bins = np.linspace(self.singles.min().min(), self.singles.max().max(),
-                           n_bins)
+        bins = self._singles_bins(n_bins)
         return cross_phenotype_jsd(self.singles, groupby=groupby,
-                                   bins=bins, n_iter=n_iter)
+                                   bins=bins, n_iter=n_iter, n_jobs=n_jobs)
+
+    def jsd_permutation_test(self, groupby=None, n_permutations=1000,
+                             n_bins=10, n_jobs=1):
+        """Significance of the JSD of features between phenotypes
+
+        Parameters
+        ----------
+        groupby : mappable
+            A samples to phenotypes mapping
+        n_permutations : int
+            Number of times to shuffle the phenotype labels
+        n_bins : int
+            Number of bins to binify the singles data on
+        n_jobs : int
+            Number of processes to spread the permutations across. If -1,
+            use all CPUs
 
-    def jsd_2d(self, groupby=None, n_iter=100, n_bins=10):
+        Returns
+        -------
+        jsd_test : pandas.DataFrame
+            A tidy dataframe with the columns "feature", "pair", "jsd", "p"
+            and "q" for each feature and pair of phenotypes
+        """
+        bins = self._singles_bins(n_bins)
+        return jsd_permutation_test(self.singles, groupby=groupby, bins=bins,
+                                    n_permutations=n_permutations,
+                                    n_jobs=n_jobs)
+
+    def jsd_2d(self, groupby=None, n_iter=100, n_bins=10, n_jobs=1):
         """Mean Jensen-Shannon divergence of features across phenotypes
 
         Parameters
@@ -442,6 +833,9 @@ class BaseData(object):
             within-group comparisons
         n_bins : int
             Number of bins to binify the singles data on
+        n_jobs : int
+            Number of processes to spread the within-phenotype bootstraps
+            across. If -1, use all CPUs
 
         Returns
         -------
@@ -450,7 +844,7 @@ class BaseData(object):
             between and within phenotypes
         """
         return jsd_df_to_2d(self.jsd_df(groupby=groupby, n_iter=n_iter,
-                                        n_bins=n_bins))
+                                        n_bins=n_bins, n_jobs=n_jobs))
 
 
     def plot_classifier(self, trait, sample_ids=None, feature_ids=None,
@@ -628,38 +1022,63 @@ class BaseData(object):
         Returns
         -------
         subset : pandas.DataFrame
-            The subset of data with only these sample ids and feature ides
+            The subset of data with only these sample ids and feature ides,
+            in the same order as in ``data``
         """
-        if feature_ids is None:
-            feature_ids = data.columns
-        else:
-            feature_ids = pd.Index(set(feature_ids).intersection(data.columns))
-        if sample_ids is None:
-            sample_ids = data.index
-        else:
-            sample_ids = pd.Index(set(sample_ids).intersection(data.index))
-
-
-        if len(sample_ids) == 1:
-            sample_ids = sample_ids[0]
-
-        if len(feature_ids) == 1:
-            feature_ids = feature_ids[0]
-            single_feature = True
-        else:
-            single_feature = False
+        rows = None if sample_ids is None \
+            else self._positions(data.index, self._as_ids(sample_ids))
+        return self._subset_rows(data, rows, feature_ids,
+                                 require_min_samples=require_min_samples)
 
-        subset = data.ix[sample_ids,:].ix[:, feature_ids]
-        # subset = subset.T.ix[feature_ids].T
+    @staticmethod
+    def _as_ids(ids):
+        """Make a set of ids into a list, which can be memoized on"""
+        if isinstance(ids, (set, frozenset)):
+            return list(ids)
+        return ids
+
+    def _subset_rows(self, data, rows=None, feature_ids=None,
+                     require_min_samples=True):
+        """Like :py:meth:`_subset`, with the positions of the samples in
+        ``data`` rather than their ids
+
+        The rows and columns are copied at once, rather than one after the
+        other.
+        """
+        columns = None if feature_ids is None \
+            else self._positions(data.columns, self._as_ids(feature_ids))
+        subset = self._take(data, rows, columns)
 
-        if require_min_samples and not single_feature:
-            subset = subset.ix[:, subset.count() >= self.minimum_samples]
+        if subset.shape[1] == 1:
+            subset = subset.iloc[:, 0]
+        elif require_min_samples:
+            enough_samples = (subset.count() >= self.minimum_samples).values
+            if not enough_samples.all():
+                subset = subset.iloc[:, np.flatnonzero(enough_samples)]
 
         if subset.empty:
             raise ValueError('This data subset is empty. Please double-check '
                              'that the gene ids are for the correct species!')
         return subset
 
+    def _partition_subset(self, partition, sample_ids=None, feature_ids=None,
+                          require_min_samples=True):
+        """Like ``self._subset(self.singles, ...)``, without copying all the
+        single cells first
+
+        Parameters
+        ----------
+        partition : "singles" | "pooled" | "outliers"
+            Which samples of the data to subset
+        sample_ids, feature_ids, require_min_samples
+            As for :py:meth:`_subset`
+        """
+        rows = self._partition_rows[partition]
+        if sample_ids is not None:
+            rows = rows[self.data.index[rows].isin(self._as_ids(sample_ids))]
+        return self._subset_rows(self.data, rows, feature_ids,
+                                 require_min_samples=require_min_samples)
+
     def _subset_singles_and_pooled(self, sample_ids=None,
                                    feature_ids=None, data=None,
                                    require_min_samples=True):
@@ -694,30 +1113,33 @@ class BaseData(object):
         # singles_ids = self.data.index.intersection(sample_ids)
         # pooled_ids = self.pooled.index.intersection(sample_ids)
         # import pdb; pdb.set_trace()
+        partition_rows = self._partition_rows
         if data is None:
-            singles = self._subset(self.singles, sample_ids, feature_ids,
-                                   require_min_samples=require_min_samples)
+            singles = self._partition_subset(
+                'singles', sample_ids, feature_ids,
+                require_min_samples=require_min_samples)
         else:
-            sample_ids = data.index.intersection(self.singles.index)
+            sample_ids = data.index.intersection(
+                self.data.index[partition_rows['singles']])
             singles = self._subset(data, sample_ids,
                                    require_min_samples=require_min_samples)
 
         try:
             # If the sample ids don't overlap with the pooled sample, assume you
             # want all the pooled samples
-            n_pooled_sample_ids = sum(self.pooled.index.isin(sample_ids))
-
-            if sample_ids is not None and n_pooled_sample_ids > 0:
+            pooled_ids = self.data.index[partition_rows['pooled']]
+            if sample_ids is not None and pooled_ids.isin(
+                    self._as_ids(sample_ids)).any():
                 pooled_sample_ids = sample_ids
             else:
                 pooled_sample_ids = None
 
             if data is None:
-                pooled = self._subset(self.pooled, pooled_sample_ids,
-                                      feature_ids,
-                                      require_min_samples=False)
+                pooled = self._partition_subset('pooled', pooled_sample_ids,
+                                                feature_ids,
+                                                require_min_samples=False)
             else:
-                sample_ids = data.index.intersection(self.pooled.index)
+                sample_ids = data.index.intersection(pooled_ids)
                 pooled = self._subset(data, sample_ids,
                                       require_min_samples=False)
 
@@ -755,9 +1177,9 @@ class BaseData(object):
                                 rename=False):
 
         """Take only the sample ids and feature ids from this data, require
-        at least some minimum samples, and standardize data using
-        scikit-learn. Will also fill na values with the mean of the feature
-        (column)
+        at least some minimum samples, and standardize data like
+        scikit-learn's StandardScaler. Will also fill na values with the mean
+        of the feature (column)
 
         Parameters
         ----------
@@ -771,7 +1193,7 @@ class BaseData(object):
             specified
         standardize : bool, optional (default=True)
             Whether or not to "whiten" (make all variables uncorrelated) and
-            mean-center via sklearn.preprocessing.StandardScaler
+            mean-center, like sklearn.preprocessing.StandardScaler
         return_means : bool, optional (default=False)
             If True, return a tuple of (subset, means), otherwise just return
             the subset
@@ -786,30 +1208,68 @@ class BaseData(object):
         means : pandas.DataFrame
             (Only if return_means=True) Mean values of the features (columns).
         """
-        # fill na with mean for each event
-        subset = self._subset(data, sample_ids, feature_ids)
-        means = subset.mean()
-        subset = subset.fillna(means).fillna(0)
-
-        if rename:
-            means = means.rename_axis(self.feature_renamer)
-            subset = subset.rename_axis(self.feature_renamer, 1)
-
-        # whiten, mean-center
-        if standardize:
-            data = StandardScaler().fit_transform(subset)
-        else:
-            data = subset
-
-        # "data" is a matrix so need to transform it back into a convenient
-        # dataframe
-        subset = pd.DataFrame(data, index=subset.index,
-                              columns=subset.columns)
+        subset, standardizer = self._standardize(
+            data, sample_ids, feature_ids, standardize=standardize,
+            rename=rename)
         if return_means:
+            means = pd.Series(standardizer.means, index=subset.columns)
             return subset, means
         else:
             return subset
 
+    def _standardize(self, data, sample_ids=None, feature_ids=None,
+                     standardize=True, rename=False):
+        """Subset, fill NAs with the mean and standardize, in one buffer
+
+        The same as :py:meth:`_subset_and_standardize`, but the rows and
+        columns are copied only once, into the array of the returned
+        dataframe, which is then imputed and standardized in place by a
+        :py:class:`.Standardizer`. Float32 data, e.g. from a compact
+        study, stays float32.
+
+        Returns
+        -------
+        subset : pandas.DataFrame
+            Standardized subset of the data
+        standardizer : flotilla.compute.generic.Standardizer
+            The means and scales used, to standardize other data the same
+            way
+        """
+        values = self._memmap_values(data)
+        if values is None:
+            values = data.values
+        rows = np.arange(data.shape[0]) if sample_ids is None \
+            else self._positions(data.index, self._as_ids(sample_ids))
+        columns = np.arange(data.shape[1]) if feature_ids is None \
+            else self._positions(data.columns, self._as_ids(feature_ids))
+
+        # Like _subset, require the minimum samples for each feature
+        stats = FeatureStats.from_values(values, rows=rows, columns=columns,
+                                         block_rows=MEMMAP_BLOCK_ROWS)
+        enough_samples = stats.count >= self.minimum_samples
+        if not enough_samples.all():
+            columns = columns[enough_samples]
+            stats = stats.take(enough_samples)
+        if len(rows) == 0 or len(columns) == 0:
+            raise ValueError('This data subset is empty. Please double-check '
+                             'that the gene ids are for the correct species!')
+
+        # Keep e.g. compacted float32 data in its own precision, instead of
+        # upcasting it to float64
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) \
+            else np.float64
+        standardizer = Standardizer(standardize=standardize, dtype=dtype)
+        standardized = standardizer.fit_transform(
+            values, rows, columns, stats=stats, block_rows=MEMMAP_BLOCK_ROWS)
+
+        feature_ids = data.columns[columns]
+        if rename:
+            feature_ids = pd.Index(self.rename_features(feature_ids),
+                                   name=feature_ids.name)
+        subset = pd.DataFrame(standardized, index=data.index[rows],
+                              columns=feature_ids, copy=False)
+        return subset, standardizer
+
     # def plot_clusteredheatmap(self, sample_ids, feature_ids,
     #                           metric='euclidean',
     #                           linkage_method='average',
@@ -893,7 +1353,7 @@ class BaseData(object):
         #                       n_top_pc_features=50)
         #dv(show_point_labels=show_point_labels, title=outlier_detector.title)
 
-    # @memoize
+    @stored_result
     def reduce(self, sample_ids=None, feature_ids=None,
                featurewise=False,
                reducer=DataFramePCA,
@@ -932,10 +1392,9 @@ class BaseData(object):
 
         reducer_kwargs = {} if reducer_kwargs is None else reducer_kwargs
 
-        subset, means = self._subset_and_standardize(self.data,
-                                                     sample_ids, feature_ids,
-                                                     standardize,
-                                                     return_means=True)
+        subset, standardizer = self._standardize(self.data, sample_ids,
+                                                 feature_ids, standardize)
+        means = pd.Series(standardizer.means, index=subset.columns)
         if most_variant_features:
             var = subset.var()
             ind = var >= (var.mean() + std_multiplier*var.std())
@@ -951,9 +1410,13 @@ class BaseData(object):
 
         reducer_object = reducer(subset, **reducer_kwargs)
         reducer_object.means = means
+        reducer_object.standardizer = standardizer
         return reducer_object
 
-    @memoize
+    # Not kept in the result store: the classifier refers to the feature
+    # renamer and the predictor dataset manager, which can't be pickled, and
+    # it is only fit when it is plotted
+    @lru_memoize()
     def classify(self, trait, sample_ids, feature_ids,
                  standardize=True,
                  data_name='expression',
@@ -1035,8 +1498,8 @@ class BaseData(object):
                                                   linkage_method)
         return subset, row_linkage, col_linkage
 
-    def binify(self, data, bins=None):
-        return binify(data, bins).dropna(how='all', axis=1)
+    def binify(self, data, bins=None, dtype=float):
+        return binify(data, bins, dtype=dtype).dropna(how='all', axis=1)
 
 
     def _violinplot(self, feature_id, sample_ids=None,
@@ -1051,10 +1514,10 @@ class BaseData(object):
                                                               feature_id])
         outliers = None
         try:
-            outliers_in_data = self.outliers.index.intersection(sample_ids)
-            if len(outliers_in_data) > 0:
-                outliers = self._subset(self.outliers,
-                                        feature_ids=[feature_id])
+            outlier_ids = self.data.index[self._partition_rows['outliers']]
+            if outlier_ids.isin(sample_ids).any():
+                outliers = self._partition_subset('outliers',
+                                                  feature_ids=[feature_id])
         except AttributeError:
             pass
 
@@ -1076,7 +1539,7 @@ class BaseData(object):
         data = self._subset(self.data)
         return DataFrameNMF(self.binify(data).T, n_components=2)
 
-    @memoize
+    @lru_memoize()
     def binned_nmf_reduced(self, sample_ids=None, feature_ids=None,
                            data=None):
         if data is None:
@@ -1420,7 +1883,7 @@ class BaseData(object):
 
         col_colors = feature_colors
         row_colors = sample_colors
-        data.columns = data.columns.map(self.feature_renamer)
+        data.columns = self.rename_features(data.columns)
 
         if scale_fig_by_data:
             figsize = self._figsizer(data.shape)
@@ -1458,8 +1921,8 @@ class BaseData(object):
         corr = corr.fillna(data.mean())
 
         if featurewise:
-            corr.index = corr.index.map(self.feature_renamer)
-            corr.columns = corr.columns.map(self.feature_renamer)
+            corr.index = self.rename_features(corr.index)
+            corr.columns = self.rename_features(corr.columns)
 
         if scale_fig_by_data:
             figsize = self._figsizer(corr.shape)
@@ -1493,32 +1956,85 @@ def subsets_from_metadata(metadata, minimum, subset_type, ignore=None):
     subsets : dict
         A name: row_ids mapping of which samples correspond to which group
     """
-    subsets = {}
-    ignore = () if ignore is None else ignore
-    if metadata is not None:
-        for col in metadata:
-            if col in ignore:
-                continue
-            if metadata[col].dtype == bool:
-                sample_subset = metadata.index[metadata[col]]
-                subsets[col] = sample_subset
-            else:
-                grouped = metadata.groupby(col)
-                sizes = grouped.size()
-                filtered_sizes = sizes[sizes >= minimum]
-                for group in filtered_sizes.keys():
-                    if isinstance(group, bool):
-                        continue
-                    name = '{}: {}'.format(col, group)
-                    subsets[name] = grouped.groups[group]
-        for sample_subset in subsets.keys():
-            name = 'not ({})'.format(sample_subset)
-            if 'False' in name or 'True' in name:
-                continue
-            if name not in subsets:
-                in_features = metadata.index.isin(subsets[
-                    sample_subset])
-                subsets[name] = metadata.index[~in_features]
-        subsets['all {}'.format(subset_type)] = metadata.index
-    return subsets
+    return subset_index_from_metadata(metadata, minimum, subset_type,
+                                      ignore=ignore).to_dict()
+
+
+def subset_index_from_metadata(metadata, minimum, subset_type, ignore=None,
+                               index=None):
+    """Get subsets from metadata as a :py:class:`.SubsetIndex` of bitsets
+
+    The same subsets as :py:func:`subsets_from_metadata`, which can also be
+    combined with queries like ``"phenotype: neuron & ~pooled"``.
 
+    Parameters
+    ----------
+    metadata : pandas.DataFrame
+        The dataframe whose columns to use to create subsets of the rows
+    minimum : int
+        Minimum number of rows required for a column or group in the column
+        to be included
+    subset_type : str
+        The name of the kind of subset. e.g. "samples" or "features"
+    ignore : list-like
+        List of columns to ignore
+    index : pandas.Index, optional
+        Ids to align the subsets to, which must include all the rows of the
+        metadata. Default is the index of the metadata
+
+    Returns
+    -------
+    subset_index : flotilla.util.SubsetIndex
+        Bitsets of which rows correspond to which group
+    """
+    if index is None:
+        index = metadata.index if metadata is not None else pd.Index([])
+    subset_index = SubsetIndex(index)
+    if metadata is None:
+        return subset_index
+
+    ignore = () if ignore is None else ignore
+    # Position of each row of the metadata in the index
+    n_rows = len(metadata.index)
+    if index[:n_rows].equals(metadata.index):
+        # e.g. the feature data, followed by the features without any
+        positions = np.arange(n_rows)
+    elif index.is_unique:
+        positions = index.get_indexer(metadata.index)
+    else:
+        # Rows can't be told apart from their ids, so every copy of an id is
+        # in the subsets of its rows
+        positions = None
+
+    def to_mask(rows):
+        if positions is None:
+            return index.isin(metadata.index[rows])
+        mask = np.zeros(len(index), dtype=bool)
+        mask[positions[rows]] = True
+        return mask
+
+    in_metadata = to_mask(np.arange(n_rows))
+
+    for col in metadata:
+        if col in ignore:
+            continue
+        if metadata[col].dtype == bool:
+            subset_index.add(col, to_mask(metadata[col].values))
+        else:
+            grouped = metadata.groupby(col)
+            sizes = grouped.size()
+            filtered_sizes = sizes[sizes >= minimum]
+            for group in filtered_sizes.keys():
+                if isinstance(group, (bool, np.bool_)):
+                    continue
+                name = '{}: {}'.format(col, group)
+                rows = grouped.indices.get(group, np.array([], dtype=int))
+                subset_index.add(name, to_mask(rows))
+    for subset in subset_index.keys():
+        name = 'not ({})'.format(subset)
+        if 'False' in name or 'True' in name:
+            continue
+        if name not in subset_index:
+            subset_index.add(name, in_metadata & ~subset_index.mask(subset))
+    subset_index.add('all {}'.format(subset_type), in_metadata)
+    return subset_index
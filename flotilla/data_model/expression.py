@@ -2,12 +2,14 @@
 Data types related to gene expression, e.g. from RNA-Seq or microarrays.
 Included SpikeIn data.
 """
+import math
 import sys
 
 import numpy as np
+import pandas as pd
 
 from .base import BaseData
-from ..util import memoize, timestamp
+from ..util import lru_memoize, timestamp
 
 EXPRESSION_THRESH = -np.inf
 
@@ -18,10 +20,16 @@ class ExpressionData(BaseData):
                  feature_rename_col=None, feature_ignore_subset_cols=None,
                  outliers=None, log_base=None,
                  pooled=None, plus_one=False, minimum_samples=0,
-                 technical_outliers=None, predictor_config_manager=None):
+                 technical_outliers=None, predictor_config_manager=None,
+                 memmap_dir=None):
         """Object for holding and operating on expression data
 
-
+        Parameters
+        ----------
+        memmap_dir : str, optional (default=None)
+            If provided, keep the data memory-mapped in this folder instead
+            of in RAM, and apply ``plus_one`` and ``log_base`` in place.
+            See :py:class:`.BaseData`
         """
         sys.stdout.write("{}\tInitializing expression\n".format(timestamp()))
 
@@ -32,12 +40,13 @@ class ExpressionData(BaseData):
             thresh=thresh,
             outliers=outliers, pooled=pooled, minimum_samples=minimum_samples,
             predictor_config_manager=predictor_config_manager,
-            technical_outliers=technical_outliers, data_type='expression')
+            technical_outliers=technical_outliers, data_type='expression',
+            memmap_dir=memmap_dir)
         self.thresh_original = thresh
         self.plus_one = plus_one
 
         if plus_one:
-            self.data += 1
+            self._transform_data(lambda x: x + 1)
             self.thresh = self.thresh_original + 1
         # self.original_data = self.data
         # import pdb; pdb.set_trace()
@@ -45,7 +54,9 @@ class ExpressionData(BaseData):
         self.log_base = log_base
 
         if self.log_base is not None:
-            self.data = np.divide(np.log(self.data), np.log(self.log_base))
+            # Divide by a python float so float32 data stays float32
+            log_base = math.log(self.log_base)
+            self._transform_data(lambda x: np.divide(np.log(x), log_base))
 
         self.feature_data = feature_data
 
@@ -59,10 +70,22 @@ class ExpressionData(BaseData):
             standardize=standardize, metric=metric,
             linkage_method=linkage_method)
 
-    @memoize
+    @lru_memoize()
     def binify(self, data):
+        stats = self.feature_stats if data is self.data else None
         data = self._subset(data, require_min_samples=False)
-        data = (data - data.min()) / (data.max() - data.min())
+        if isinstance(data, pd.Series):
+            # Only one feature
+            minimum, maximum = data.min(), data.max()
+        else:
+            if stats is None:
+                stats = self._compute_feature_stats(data)
+            minimum = pd.Series(stats.minimum, index=stats.index)[
+                data.columns]
+            maximum = pd.Series(stats.maximum, index=stats.index)[
+                data.columns]
+        # Scale each feature to the range 0-1
+        data = (data - minimum) / (maximum - minimum)
         # vmax = data.abs().max().max()
         # vmin = -vmax
         # bins = np.linspace(vmin, vmax, 10)
@@ -5,7 +5,8 @@ import warnings
 import matplotlib as mpl
 import seaborn as sns
 
-from .base import BaseData, subsets_from_metadata
+from .base import BaseData, subset_index_from_metadata
+from ..util import cached_property
 from ..visualize.color import str_to_color
 
 
@@ -17,6 +18,9 @@ OUTLIER_COL = 'outlier'
 # Any informational data goes here
 
 class MetaData(BaseData):
+    _versioned_attributes = BaseData._versioned_attributes.union(
+        ['minimum_sample_subset'])
+
     def __init__(self, data, phenotype_order=None, phenotype_to_color=None,
                  phenotype_to_marker=None,
                  phenotype_col=PHENOTYPE_COL,
@@ -176,10 +180,17 @@ class MetaData(BaseData):
                     for sample_id, p in
                     self.sample_id_to_phenotype.iteritems())
 
+    @cached_property()
+    def sample_subset_index(self):
+        """:py:class:`.SubsetIndex` of the sample subsets, e.g. to query
+        "phenotype: neuron & ~pooled" """
+        return subset_index_from_metadata(self.data,
+                                          self.minimum_sample_subset,
+                                          'samples')
+
     @property
     def sample_subsets(self):
-        return subsets_from_metadata(self.data, self.minimum_sample_subset,
-                                     'samples')
+        return self.sample_subset_index.to_dict()
 
     @property
     def phenotype_series(self):
@@ -10,7 +10,7 @@ from .base import BaseData
 from ..compute.splicing import ModalityEstimator
 from ..compute.decomposition import DataFramePCA
 from ..visualize.splicing import ModalitiesViz
-from ..util import memoize, timestamp
+from ..util import lru_memoize, stored_result, timestamp
 from ..visualize.splicing import lavalamp, hist_single_vs_pooled_diff, \
     lavalamp_pooled_inconsistent
 
@@ -35,7 +35,7 @@ class SplicingData(BaseData):
                  excluded_max=0.2, included_min=0.8,
                  pooled=None, predictor_config_manager=None,
                  technical_outliers=None, minimum_samples=0,
-                 feature_expression_id_col=None):
+                 feature_expression_id_col=None, memmap_dir=None):
         """Instantiate a object for percent spliced in (PSI) scores
 
         Parameters
@@ -51,6 +51,9 @@ class SplicingData(BaseData):
             Maximum value for the "excluded" bin of psi scores. Default 0.2.
         included_max : float
             Minimum value for the "included" bin of psi scores. Default 0.8.
+        memmap_dir : str, optional (default=None)
+            If provided, keep the data memory-mapped in this folder instead
+            of in RAM. See :py:class:`.BaseData`
 
         Notes
         -----
@@ -65,7 +68,8 @@ class SplicingData(BaseData):
             outliers=outliers, pooled=pooled,
             technical_outliers=technical_outliers,
             predictor_config_manager=predictor_config_manager,
-            minimum_samples=minimum_samples, data_type='splicing')
+            minimum_samples=minimum_samples, data_type='splicing',
+            memmap_dir=memmap_dir)
         sys.stdout.write("{}\tDone initializing splicing\n".format(timestamp()))
 
         self.feature_expression_id_col = feature_expression_id_col \
@@ -83,9 +87,11 @@ class SplicingData(BaseData):
         #                                         included_min=included_min)
         self.modality_visualizer = ModalitiesViz()
 
-    @memoize
+    @lru_memoize()
+    @stored_result
     def modality_assignments(self, sample_ids=None, feature_ids=None,
-                             data=None, groupby=None, min_samples=0.5):
+                             data=None, groupby=None, min_samples=0.5,
+                             n_jobs=1, n_iter=None, random_state=0):
         """Assigned modalities for these samples and features.
 
         Parameters
@@ -97,15 +103,27 @@ class SplicingData(BaseData):
         data : pandas.DataFrame, optional
             If provided, use this dataframe instead of the sample_ids and
             feature_ids provided
+        n_jobs : int, optional
+            Number of processes to spread the phenotype groups and chunks of
+            events across. If -1, use all CPUs. Default 1.
+        n_iter : int, optional
+            If provided, resample the samples of each group this many times
+            and return how often each feature was assigned to each modality,
+            instead of a single assignment. Default None.
+        random_state : int or None, optional
+            Seed for the resampling when ``n_iter`` is provided. Each group
+            is resampled with its own seed drawn from it. Default 0.
 
         Returns
         -------
         modality_assignments : pandas.Series
-            The modality assignments of each feature given these samples
+            The modality assignments of each feature given these samples. If
+            ``n_iter`` is provided, a (n_groups * n_modalities, n_features)
+            dataframe of assignment frequencies instead
         """
         if data is None:
-            data = self._subset(self.singles, sample_ids, feature_ids,
-                                require_min_samples=False)
+            data = self._partition_subset('singles', sample_ids, feature_ids,
+                                          require_min_samples=False)
         else:
             if feature_ids is not None and sample_ids is not None:
                 raise ValueError('Can only specify `sample_ids` and '
@@ -124,13 +142,28 @@ class SplicingData(BaseData):
                             'not {}'.format(type(min_samples)))
         data = pd.concat([df.dropna(thresh=thresh(df), axis=1)
                          for name, df in grouped])
-        assignments = data.groupby(groupby).apply(
-            self.modality_estimator.fit_transform)
+        if n_iter is not None:
+            # A seed for each group, so groups of the same size are not
+            # resampled the same way
+            grouped = data.groupby(groupby)
+            names = [name for name, df in grouped]
+            seeds = np.random.RandomState(random_state).randint(
+                np.iinfo(np.int32).max, size=len(names))
+            assignments = pd.concat(
+                [self.modality_estimator.bootstrap_fit_transform(
+                    df, n_iter=n_iter, random_state=seed, n_jobs=n_jobs)
+                 for (name, df), seed in zip(grouped, seeds)], keys=names)
+        elif n_jobs == 1:
+            assignments = data.groupby(groupby).apply(
+                self.modality_estimator.fit_transform)
+        else:
+            assignments = self.modality_estimator.grouped_fit_transform(
+                data, groupby, n_jobs=n_jobs)
         return assignments
 
-    @memoize
+    @lru_memoize()
     def modality_counts(self, sample_ids=None, feature_ids=None, data=None,
-                          groupby=None, min_samples=0.5):
+                          groupby=None, min_samples=0.5, n_jobs=1):
         """Count the number of each modalities of these samples and features
 
         Parameters
@@ -142,6 +175,9 @@ class SplicingData(BaseData):
         data : pandas.DataFrame, optional
             If provided, use this dataframe instead of the sample_ids and
             feature_ids provided
+        n_jobs : int, optional
+            Number of processes to use for the modality assignments.
+            Default 1.
 
         Returns
         -------
@@ -149,7 +185,8 @@ class SplicingData(BaseData):
             The number of events detected in each modality
         """
         assignments = self.modality_assignments(sample_ids, feature_ids, data,
-                                                groupby, min_samples)
+                                                groupby, min_samples,
+                                                n_jobs=n_jobs)
         counts = assignments.apply(lambda x: x.groupby(x).size(), axis=1)
         return counts
 
@@ -158,7 +195,7 @@ class SplicingData(BaseData):
 
 
     def plot_modalities_reduced(self, sample_ids=None, feature_ids=None,
-                                data=None, ax=None, title=None):
+                                data=None, ax=None, title=None, n_jobs=1):
         """Plot events modality assignments in NMF space
 
         This will calculate modalities on all samples provided, without
@@ -178,10 +215,14 @@ class SplicingData(BaseData):
             Axes to plot on. If none, gets current axes
         title : str
             Title of the reduced space plot
+        n_jobs : int
+            Number of processes to use for the modality assignments.
+            Default 1.
         """
         groupby = pd.Series('all', self.data.index)
         modality_assignments = self.modality_assignments(sample_ids, feature_ids,
-                                                           data, groupby)
+                                                           data, groupby,
+                                                           n_jobs=n_jobs)
         modality_assignments = pd.Series(modality_assignments.values[0],
                                            index=modality_assignments.columns)
 
@@ -193,7 +234,7 @@ class SplicingData(BaseData):
 
     def plot_modalities_bars(self, sample_ids=None, feature_ids=None,
                              data=None, groupby=None, phenotype_to_color=None,
-                             percentages=False, ax=None):
+                             percentages=False, ax=None, n_jobs=1):
         """Make grouped barplots of the number of modalities per group
 
         Parameters
@@ -209,10 +250,13 @@ class SplicingData(BaseData):
             How much to offset the x-axis of each event. Useful if you want
             to plot the same event, but in several iterations with different
             celltypes or colors
+        n_jobs : int
+            Number of processes to use for the modality assignments.
+            Default 1.
         """
 
         counts = self.modality_counts(
-            sample_ids, feature_ids, data=data, groupby=groupby)
+            sample_ids, feature_ids, data=data, groupby=groupby, n_jobs=n_jobs)
 
         # make sure this is always a dataframe
         if isinstance(counts, pd.Series):
@@ -225,7 +269,7 @@ class SplicingData(BaseData):
 
     def plot_modalities_lavalamps(self, sample_ids=None, feature_ids=None,
                                   data=None, groupby=None,
-                                  phenotype_to_color=None):
+                                  phenotype_to_color=None, n_jobs=1):
         """Plot "lavalamp" scatterplot of each event
 
         Parameters
@@ -241,12 +285,15 @@ class SplicingData(BaseData):
             How much to offset the x-axis of each event. Useful if you want
             to plot the same event, but in several iterations with different
             celltypes or colors
+        n_jobs : int
+            Number of processes to use for the modality assignments.
+            Default 1.
         """
         if groupby is None:
             groupby = pd.Series('all', index=self.data.index)
 
         assignments = self.modality_assignments(
-            sample_ids, feature_ids, data=data, groupby=groupby)
+            sample_ids, feature_ids, data=data, groupby=groupby, n_jobs=n_jobs)
 
         # make sure this is always a dataframe
         if isinstance(assignments, pd.Series):
@@ -279,8 +326,8 @@ class SplicingData(BaseData):
                                        data=None,
                                        groupby=None, min_samples=0.5):
         if data is None:
-            data = self._subset(self.singles, sample_ids,
-                                require_min_samples=False)
+            data = self._partition_subset('singles', sample_ids,
+                                          require_min_samples=False)
         else:
             if sample_ids is not None:
                 raise ValueError('Can only specify `sample_ids` or `data`, but not both.')
@@ -305,7 +352,7 @@ class SplicingData(BaseData):
         self.modality_visualizer.event_estimation(event, logliks, logsumexps,
                                                   renamed=renamed)
 
-    @memoize
+    @lru_memoize()
     def _is_nmf_space_x_axis_excluded(self, phenotype_groupby):
         nmf_space_positions = self.nmf_space_positions(phenotype_groupby)
 
@@ -351,7 +398,7 @@ class SplicingData(BaseData):
                                                nmf_ylabel, nmf_space=nmf_space,
                                                fig=fig, axesgrid=axesgrid)
 
-    @memoize
+    @lru_memoize()
     def pooled_inconsistent(self, data, feature_ids=None,
                             fraction_diff_thresh=FRACTION_DIFF_THRESH):
         """Return splicing events which pooled samples are consistently
@@ -388,7 +435,7 @@ class SplicingData(BaseData):
             large_diff = None
         return singles, pooled, not_measured_in_pooled, large_diff
 
-    @memoize
+    @lru_memoize()
     def _diff_from_singles(self, data,
                            feature_ids=None, scaled=True, dropna=True):
         """Calculate the difference between pooled and singles' psis
@@ -2,11 +2,14 @@
 Data models for "studies" studies include attributes about the data and are
 heavier in terms of data load
 """
+import functools
 import json
 import os
 import sys
+import time
 import warnings
 
+from joblib import Parallel, delayed
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -24,13 +27,51 @@ from ..visualize.color import blue
 from ..visualize.ipython_interact import Interactive
 from ..datapackage import FLOTILLA_DOWNLOAD_DIR
 from ..util import load_csv, load_json, load_tsv, load_gzip_pickle_df, \
-    load_pickle_df, timestamp, cached_property
+    load_pickle_df, timestamp, cached_property, ResultStore, \
+    RESULT_STORE_DIRNAME, load_with_binary_cache, compact_dtypes, deep_nbytes
 
 
 SPECIES_DATA_PACKAGE_BASE_URL = 'https://s3-us-west-2.amazonaws.com/' \
                                 'flotilla-projects'
 DATAPACKAGE_RESOURCE_COMMON_KWS = ('url', 'path', 'format', 'compression',
-                                   'name')
+                                   'name', 'hash', 'content_hash')
+MEMMAP_DIRNAME = 'memmap'
+# Resources which Study.from_datapackage(lazy=True) reads on first access
+LAZY_RESOURCES = ('expression', 'splicing', 'spikein')
+
+
+def _load_resource(name, reader, filename, binary_cache=False, mmap=False,
+                   **kwargs):
+    """Read a single datapackage resource and report how long it took
+
+    Parameters
+    ----------
+    name : str
+        Name of the resource, e.g. "expression"
+    reader : function
+        Function to read the file into a dataframe, e.g. ``load_csv``
+    filename : str
+        Location of the file on your system
+    binary_cache : bool
+        If True, read it using :py:func:`flotilla.util.load_with_binary_cache`
+    mmap : bool
+        If True, memory-map the binary copy
+    kwargs : other keyword arguments
+        Passed to ``reader``
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The loaded resource
+    """
+    t0 = time.time()
+    if binary_cache:
+        df = load_with_binary_cache(reader, filename, mmap=mmap, **kwargs)
+    else:
+        df = reader(filename, **kwargs)
+    sys.stdout.write('{}\tLoaded {} in {:.2f} seconds\n'.format(
+        timestamp(), name, time.time() - t0))
+    return df
 
 
 class Study(object):
@@ -95,7 +136,8 @@ class Study(object):
                  metadata_outlier_col=OUTLIER_COL,
                  license=None, title=None, sources=None,
                  default_sample_subset="all_samples",
-                 default_feature_subset="variant"):
+                 default_feature_subset="variant",
+                 memmap_dir=None, lazy=False, compact=False):
         """Construct a biological study
 
         This class only accepts data, no filenames. All data must already
@@ -114,7 +156,7 @@ class Study(object):
             major.minor.patch format, as the "patch" number will be increased
             if you change something in the study and then study.save() it.
             (default "0.1.0")
-        expression_data : pandas.DataFrame
+        expression_data : pandas.DataFrame or function
             Samples x feature dataframe of gene expression measurements,
             e.g. from an RNA-Seq or a microarray experiment. Assumed to be
             log-transformed, i.e. you took the log of it. (default None)
@@ -137,7 +179,7 @@ class Study(object):
             Minimum (non log-transformed) expression value. (default -inf)
         expression_plus_one : bool
             Whether or not to add 1 to the expression data. (default False)
-        splicing_data : pandas.DataFrame
+        splicing_data : pandas.DataFrame or function
             Samples x feature dataframe of percent spliced in scores, e.g. as
             measured by the program MISO. Assumed that these values only fall
             between 0 and 1.
@@ -161,7 +203,7 @@ class Study(object):
             A column name in the mapping_stats_data which specifies the
             number of (uniquely or not) mapped reads. Default "Uniquely
             mapped reads number"
-        spikein_data : pandas.DataFrame
+        spikein_data : pandas.DataFrame or function
             samples x features DataFrame of spike-in expression values
         spikein_feature_data : pandas.DataFrame
             Features x other_features dataframe, e.g. of the molecular
@@ -178,6 +220,19 @@ class Study(object):
         metadata_pooled_col : str
             Column in metadata_data which specifies as a boolean
             whether or not this sample was pooled.
+        memmap_dir : str
+            If provided, keep the expression and splicing data as
+            memory-mapped float32 files in this folder instead of in RAM.
+        lazy : bool
+            If True, don't create the expression, splicing and spikein data
+            until they are first accessed, e.g. as ``study.expression``. Any
+            of ``expression_data``, ``splicing_data`` and ``spikein_data``
+            can also be a function with no arguments that returns the
+            dataframe, which is then only called on first access.
+        compact : bool
+            If True, store the expression, splicing and spikein data as
+            float32, and string columns of the metadata and feature data
+            with repeated values as categoricals, to use less memory.
 
         Note
         ----
@@ -199,6 +254,11 @@ class Study(object):
 
         self.species = species
         self.gene_ontology_data = gene_ontology_data
+        self.compact = compact
+
+        # Data types which are created on first access, as
+        # {name: (class, data, keyword arguments)}
+        self._data_type_loaders = {}
 
         self.license = license
         self.title = title
@@ -206,6 +266,9 @@ class Study(object):
         self.version = version
 
         sys.stdout.write('{}\tLoading metadata\n'.format(timestamp()))
+        if self.compact:
+            sample_metadata = self._compact('metadata', sample_metadata,
+                                            float32=False)
         self.metadata = MetaData(
             sample_metadata, metadata_phenotype_order,
             metadata_phenotype_to_color,
@@ -285,49 +348,109 @@ class Study(object):
                     'splicing_feature_rename_col', None)
 
         if expression_data is not None:
-            sys.stdout.write(
-                "{}\tLoading expression data\n".format(timestamp()))
-            self.expression = ExpressionData(
-                expression_data,
-                feature_data=expression_feature_data,
-                thresh=expression_thresh,
-                feature_rename_col=expression_feature_rename_col,
-                outliers=outliers, plus_one=expression_plus_one,
-                log_base=expression_log_base, pooled=pooled,
-                predictor_config_manager=self.predictor_config_manager,
-                technical_outliers=self.technical_outliers,
-                minimum_samples=metadata_minimum_samples,
-                feature_ignore_subset_cols=expression_feature_ignore_subset_cols)
-            self.default_feature_set_ids.extend(self.expression.feature_subsets
-                                                .keys())
+            self._data_type_loaders['expression'] = (
+                ExpressionData, expression_data, dict(
+                    feature_data=expression_feature_data,
+                    thresh=expression_thresh,
+                    feature_rename_col=expression_feature_rename_col,
+                    outliers=outliers, plus_one=expression_plus_one,
+                    log_base=expression_log_base, pooled=pooled,
+                    predictor_config_manager=self.predictor_config_manager,
+                    technical_outliers=self.technical_outliers,
+                    minimum_samples=metadata_minimum_samples,
+                    feature_ignore_subset_cols=(
+                        expression_feature_ignore_subset_cols),
+                    memmap_dir=memmap_dir))
         if splicing_data is not None:
-            sys.stdout.write("{}\tLoading splicing data\n".format(
-                timestamp()))
-            self.splicing = SplicingData(
-                splicing_data, feature_data=splicing_feature_data,
-                feature_rename_col=splicing_feature_rename_col,
-                outliers=outliers, pooled=pooled,
-                predictor_config_manager=self.predictor_config_manager,
-                technical_outliers=self.technical_outliers,
-                minimum_samples=metadata_minimum_samples,
-                feature_ignore_subset_cols=splicing_feature_ignore_subset_cols,
-                feature_expression_id_col=splicing_feature_expression_id_col)
+            self._data_type_loaders['splicing'] = (
+                SplicingData, splicing_data, dict(
+                    feature_data=splicing_feature_data,
+                    feature_rename_col=splicing_feature_rename_col,
+                    outliers=outliers, pooled=pooled,
+                    predictor_config_manager=self.predictor_config_manager,
+                    technical_outliers=self.technical_outliers,
+                    minimum_samples=metadata_minimum_samples,
+                    feature_ignore_subset_cols=(
+                        splicing_feature_ignore_subset_cols),
+                    feature_expression_id_col=(
+                        splicing_feature_expression_id_col),
+                    memmap_dir=memmap_dir))
 
         if spikein_data is not None:
-            self.spikein = SpikeInData(
-                spikein_data, feature_data=spikein_feature_data,
-                technical_outliers=self.technical_outliers,
-                predictor_config_manager=self.predictor_config_manager)
+            self._data_type_loaders['spikein'] = (
+                SpikeInData, spikein_data, dict(
+                    feature_data=spikein_feature_data,
+                    technical_outliers=self.technical_outliers,
+                    predictor_config_manager=self.predictor_config_manager))
+
+        if not lazy:
+            for name in ('expression', 'splicing', 'spikein'):
+                if name in self._data_type_loaders:
+                    self._load_data_type(name)
         sys.stdout.write("{}\tSuccessfully initialized a Study "
                          "object!\n".format(timestamp()))
 
     def __setattr__(self, key, value):
         """Check if the attribute already exists and warns on overwrite.
         """
-        if hasattr(self, key):
+        # Don't create a data type just to overwrite it
+        loaders = self.__dict__.get('_data_type_loaders', {})
+        if loaders.pop(key, None) is not None or hasattr(self, key):
             warnings.warn('Over-writing attribute {}'.format(key))
         super(Study, self).__setattr__(key, value)
 
+    def __getattr__(self, name):
+        """Create data types which haven't been loaded yet, on first access
+        """
+        if name not in self.__dict__.get('_data_type_loaders', {}):
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                type(self).__name__, name))
+        return self._load_data_type(name)
+
+    @staticmethod
+    def _compact(name, df, float32=True):
+        """Store a resource in less memory, and report how much was saved
+
+        See :py:func:`flotilla.util.compact_dtypes`
+        """
+        before = deep_nbytes(df)
+        df = compact_dtypes(df, float32=float32)
+        sys.stdout.write('{}\tCompacted {}, saving {} bytes\n'.format(
+            timestamp(), name, before - deep_nbytes(df)))
+        return df
+
+    def _load_data_type(self, name):
+        """Read and create the data type ``name``, e.g. "expression"
+
+        Parameters
+        ----------
+        name : str
+            One of "expression", "splicing" or "spikein"
+
+        Returns
+        -------
+        data_type : BaseData
+            The created data type, which is now also an attribute
+        """
+        cls, data, kwargs = self._data_type_loaders.pop(name)
+        sys.stdout.write("{}\tLoading {} data\n".format(timestamp(), name))
+        if callable(data):
+            data = data()
+        if self.compact:
+            data = self._compact(name, data)
+            if kwargs.get('feature_data') is not None:
+                kwargs['feature_data'] = self._compact(
+                    '{}_feature'.format(name), kwargs['feature_data'],
+                    float32=False)
+        data_type = cls(data, **kwargs)
+        data_type.result_store = self.__dict__.get('_result_store')
+        super(Study, self).__setattr__(name, data_type)
+
+        if name == 'expression':
+            self.default_feature_set_ids.extend(
+                self.expression.feature_subset_index.keys())
+        return data_type
+
     @property
     def phenotype_col(self):
         return self.metadata.phenotype_col
@@ -364,7 +487,7 @@ class Study(object):
     def default_sample_subsets(self):
         # move default_sample_subset to the front of the list, sort the rest
         sorted_sample_subsets = list(sorted(list(set(
-            self.metadata.sample_subsets.keys()).difference(
+            self.metadata.sample_subset_index.keys()).difference(
             set(self.default_sample_subset)))))
         sorted_sample_subsets.insert(0, self.default_sample_subset)
         return sorted_sample_subsets
@@ -384,7 +507,9 @@ class Study(object):
     def from_datapackage_url(
             cls, datapackage_url,
             load_species_data=True,
-            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, n_jobs=-1, lazy=False,
+            compact=False):
         """Create a study from a url of a datapackage.json file
 
         Parameters
@@ -397,6 +522,21 @@ class Study(object):
         species_data_pacakge_base_url : str
             Base URL to fetch species-specific gene and splicing event
             metadata from. Default 'https://s3-us-west-2.amazonaws.com/flotilla-projects/'
+        binary_cache : bool
+            If True (default), keep a binary copy of each resource next to
+            it, and read that instead of parsing the resource on later loads
+        mmap : bool
+            If True, memory-map the binary copies instead of reading them
+            into memory. Default False.
+        n_jobs : int
+            Number of threads used to read the resources at the same time.
+            Default -1, which uses all the CPUs.
+        lazy : bool
+            If True, only read and create the expression, splicing and spikein
+            data the first time they are accessed. Default False.
+        compact : bool
+            If True, store the data as float32 and repeated strings as
+            categoricals. Default False.
 
         Returns
         -------
@@ -416,13 +556,17 @@ class Study(object):
         return cls.from_datapackage(
             datapackage, load_species_data=load_species_data,
             datapackage_dir=datapackage_dir,
-            species_datapackage_base_url=species_datapackage_base_url)
+            species_datapackage_base_url=species_datapackage_base_url,
+            binary_cache=binary_cache, mmap=mmap, n_jobs=n_jobs, lazy=lazy,
+            compact=compact)
 
     @classmethod
     def from_datapackage_file(
             cls, datapackage_filename,
             load_species_data=True,
-            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, n_jobs=-1, lazy=False,
+            compact=False):
         with open(datapackage_filename) as f:
             sys.stdout.write('{}\tReading datapackage from {}\n'.format(
                 timestamp(), datapackage_filename))
@@ -431,7 +575,9 @@ class Study(object):
         return cls.from_datapackage(
             datapackage, datapackage_dir=datapackage_dir,
             load_species_data=load_species_data,
-            species_datapackage_base_url=species_datapackage_base_url)
+            species_datapackage_base_url=species_datapackage_base_url,
+            binary_cache=binary_cache, mmap=mmap, n_jobs=n_jobs, lazy=lazy,
+            compact=compact)
 
     @staticmethod
     def _is_absolute_path(location):
@@ -441,13 +587,35 @@ class Study(object):
     def from_datapackage(
             cls, datapackage, datapackage_dir='./',
             load_species_data=True,
-            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, n_jobs=-1, lazy=False,
+            compact=False):
         """Create a study object from a datapackage dictionary
 
         Parameters
         ----------
         datapackage : dict
 
+        binary_cache : bool
+            If True (default), keep a binary copy of each resource next to
+            it, and read that instead of parsing the resource on later loads
+        mmap : bool
+            If True, memory-map the binary copies instead of reading them
+            into memory, and keep the expression and splicing data
+            memory-mapped in a "memmap" folder next to the datapackage.
+            Default False.
+        n_jobs : int
+            Number of threads used to read the resources, and the species
+            resources, at the same time. Default -1, which uses all the CPUs.
+        lazy : bool
+            If True, only read and create the expression, splicing and spikein
+            data the first time they are accessed, e.g. as
+            ``study.expression``. Default False.
+        compact : bool
+            If True, store the expression, splicing and spikein data as
+            float32, and repeated strings in the metadata and feature data as
+            categoricals, to use less memory. Default False.
+
 
         Returns
         -------
@@ -456,7 +624,7 @@ class Study(object):
         """
         sys.stdout.write('{}\tParsing datapackage to create a Study '
                          'object\n'.format(timestamp()))
-        dfs = {}
+        names, to_load = [], []
         kwargs = {}
         datapackage_name = datapackage['name']
 
@@ -466,12 +634,14 @@ class Study(object):
                 if not cls._is_absolute_path(resource_url):
                     resource_url = '{}/{}'.format(datapackage_dir,
                                                   resource_url)
-                filename = check_if_already_downloaded(resource_url,
-                                                       datapackage_name)
+                filename = check_if_already_downloaded(
+                    resource_url, datapackage_name,
+                    checksum=resource.get('hash'))
             else:
                 if resource['path'].startswith('http'):
-                    filename = check_if_already_downloaded(resource['path'],
-                                                           datapackage_name)
+                    filename = check_if_already_downloaded(
+                        resource['path'], datapackage_name,
+                        checksum=resource.get('hash'))
                 else:
                     filename = resource['path']
                     if not cls._is_absolute_path(filename):
@@ -494,19 +664,33 @@ class Study(object):
             header = resource.pop('header', 0)
             index_col = resource.pop('index_col', 0)
 
-            dfs[name] = reader(filename, compression=compression,
-                               header=header, index_col=index_col)
+            load = functools.partial(
+                _load_resource, name, reader, filename,
+                binary_cache=binary_cache, mmap=mmap, compression=compression,
+                header=header, index_col=index_col)
+            if lazy and name in LAZY_RESOURCES:
+                # Study reads it on first access of the data type
+                kwargs['{}_data'.format(name)] = load
+            else:
+                names.append(name)
+                to_load.append(delayed(load)())
 
             for key in set(resource.keys()).difference(
                     DATAPACKAGE_RESOURCE_COMMON_KWS):
                 kwargs['{}_{}'.format(name, key)] = resource[key]
 
+        # Parsing is mostly done with the GIL released, so threads are
+        # enough to read the resources at the same time
+        dfs = dict(zip(names, Parallel(n_jobs=n_jobs,
+                                       backend='threading')(to_load)))
+
         species_kws = {}
         species = None if 'species' not in datapackage else datapackage[
             'species']
         if load_species_data and species is not None:
             species_kws = cls.load_species_data(species, cls.readers,
-                                                species_datapackage_base_url)
+                                                species_datapackage_base_url,
+                                                n_jobs=n_jobs)
 
         try:
             sample_metadata = dfs.pop('metadata')
@@ -520,6 +704,9 @@ class Study(object):
             kwargs.pop(key)
         kwargs.update(species_kws)
         kwargs.update(dfs)
+        if mmap:
+            kwargs['memmap_dir'] = os.path.join(datapackage_dir,
+                                                MEMMAP_DIRNAME)
 
         license = None if 'license' not in datapackage else datapackage[
             'license']
@@ -536,18 +723,25 @@ class Study(object):
                 version))
         study = Study(
             sample_metadata=sample_metadata,
+            lazy=lazy,
+            compact=compact,
             species=species,
             license=license,
             title=title,
             sources=sources,
             version=version,
             **kwargs)
+        study.use_result_store(os.path.join(datapackage_dir,
+                                            RESULT_STORE_DIRNAME))
         return study
 
     @staticmethod
-    def load_species_data(species, readers,
-                          species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+    def load_species_data(
+            species, readers,
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            n_jobs=-1):
         dfs = {}
+        names, to_load = [], []
 
         try:
             species_data_url = '{}/{}/datapackage.json'.format(
@@ -558,8 +752,9 @@ class Study(object):
             for resource in species_datapackage['resources']:
                 if 'url' in resource:
                     resource_url = resource['url']
-                    filename = check_if_already_downloaded(resource_url,
-                                                           species)
+                    filename = check_if_already_downloaded(
+                        resource_url, species,
+                        checksum=resource.get('hash'))
                 else:
                     filename = resource['path']
 
@@ -568,14 +763,18 @@ class Study(object):
                 compression = None if 'compression' not in resource else \
                     resource['compression']
                 name = resource['name']
-                dfs[name] = reader(filename,
-                                   compression=compression)
+                names.append(name)
+                to_load.append(delayed(_load_resource)(
+                    name, reader, filename, compression=compression))
                 other_keys = set(resource.keys()).difference(
                     DATAPACKAGE_RESOURCE_COMMON_KWS)
                 name_no_data = name.rstrip('_data')
                 for key in other_keys:
                     new_key = '{}_{}'.format(name_no_data, key)
                     dfs[new_key] = resource[key]
+
+            dfs.update(zip(names, Parallel(n_jobs=n_jobs,
+                                           backend='threading')(to_load)))
         except (IOError, ValueError) as e:
             sys.stderr.write('Error loading species {} data '.format(species))
             pass
@@ -626,8 +825,43 @@ class Study(object):
 
         self.metadata.data[outlier_detector.title].update(
             outlier_detector.outliers)
+        self.metadata.data_changed()
         return reducer, outlier_detector
 
+    def use_result_store(self, directory):
+        """Save expensive results of every data type to this directory
+
+        Reductions, classifiers, modality assignments and JSDs are then
+        loaded from there instead of recomputed, including in later
+        sessions. Studies created from a datapackage use a "results" folder
+        in the datapackage directory.
+
+        Parameters
+        ----------
+        directory : str or None
+            Where to store results. If None, stop storing results.
+        """
+        store = ResultStore(directory) if directory is not None else None
+        # Data types which aren't loaded yet get the store when they are
+        self.__dict__['_result_store'] = store
+        for name in ('metadata', 'mapping_stats', 'expression', 'splicing',
+                     'spikein'):
+            data = self.__dict__.get(name)
+            if data is not None:
+                data.result_store = store
+
+    @property
+    def data_version(self):
+        """Versions of the data of each data type in this study
+
+        Cached properties of the study, like
+        :py:attr:`Study.tidy_splicing_with_expression`, are recomputed when
+        this changes.
+        """
+        return tuple(getattr(self.__dict__.get(name), 'data_version', None)
+                     for name in ('metadata', 'mapping_stats', 'expression',
+                                  'splicing', 'spikein'))
+
     def drop_outliers(self):
         """Assign samples marked as "outlier" in metadata, to other datas"""
         outliers = self.metadata.data['outlier'][
@@ -673,7 +907,8 @@ class Study(object):
             A string describing the data type, e.g. "expression"
         feature_subset : str
             A string describing the subset of data type (must be already
-            calculated)
+            calculated), or a query combining subsets, e.g.
+            "variant & ~(gene_type: protein_coding)"
 
         Returns
         -------
@@ -696,7 +931,8 @@ class Study(object):
         ----------
         phenotype_subset : str
             A valid string describing a boolean phenotype described in the
-            metadata data
+            metadata data, or a query combining sample subsets, e.g.
+            "phenotype: neuron & ~pooled"
 
         Returns
         -------
@@ -707,8 +943,8 @@ class Study(object):
         # IF this is a list of IDs
 
         try:
-            return self.metadata.sample_subsets[phenotype_subset]
-        except KeyError:
+            return self.metadata.sample_subset_index.ids(phenotype_subset)
+        except (KeyError, ValueError):
             pass
 
         ind = self.metadata.phenotype_series == phenotype_subset
@@ -914,7 +1150,7 @@ class Study(object):
         try:
             trait_data = self.metadata.data[trait]
         except KeyError:
-            trait_ids = self.metadata.sample_subsets[trait]
+            trait_ids = self.metadata.sample_subset_index.ids(trait)
             trait_data = self.metadata.data.index.isin(trait_ids)
         if all(trait_data == True) or all(trait_data == False) or len(
                 set(trait_data)) <= 1:
@@ -968,7 +1204,7 @@ class Study(object):
             self.splicing.plot_regressor(**kwargs)
 
     def modality_assignments(self, sample_subset=None, feature_subset=None,
-                   expression_thresh=-np.inf, min_samples=0.5):
+                   expression_thresh=-np.inf, min_samples=0.5, n_jobs=1):
         """Get modality assignments of splicing data
 
         Parameters
@@ -985,6 +1221,9 @@ class Study(object):
             Minimum expression value, of the original input. E.g. if the
             original input is already log-transformed, then this threshold is
             on the log values.
+        n_jobs : int, optional
+            Number of processes to spread the phenotypes and chunks of events
+            across. If -1, use all CPUs.
 
         Returns
         -------
@@ -1008,9 +1247,10 @@ class Study(object):
         return self.splicing.modality_assignments(sample_ids, feature_ids,
                                                   data=data,
                                         groupby=self.sample_id_to_phenotype,
-                                        min_samples=min_samples)
+                                        min_samples=min_samples,
+                                        n_jobs=n_jobs)
     def modality_counts(self, sample_subset=None, feature_subset=None,
-                   expression_thresh=-np.inf, min_samples=0.5):
+                   expression_thresh=-np.inf, min_samples=0.5, n_jobs=1):
         """Get number of splicing events in modality categories
 
         Parameters
@@ -1027,6 +1267,9 @@ class Study(object):
             Minimum expression value, of the original input. E.g. if the
             original input is already log-transformed, then this threshold is
             on the log values.
+        n_jobs : int, optional
+            Number of processes to spread the phenotypes and chunks of events
+            across. If -1, use all CPUs.
 
         Returns
         -------
@@ -1050,10 +1293,12 @@ class Study(object):
         return self.splicing.modality_assignments(sample_ids, feature_ids,
                                                   data=data,
                                         groupby=self.sample_id_to_phenotype,
-                                        min_samples=min_samples)
+                                        min_samples=min_samples,
+                                        n_jobs=n_jobs)
 
     def plot_modalities_bars(self, sample_subset=None, feature_subset=None,
-                             expression_thresh=-np.inf, percentages=True):
+                             expression_thresh=-np.inf, percentages=True,
+                             n_jobs=1):
         """Make grouped barplots of the number of modalities per phenotype
 
         Parameters
@@ -1071,6 +1316,8 @@ class Study(object):
             with expression at least this value
         percentages : bool
             If True, plot percentages instead of counts
+        n_jobs : int
+            Number of processes to use for the modality assignments
         """
         if expression_thresh > -np.inf:
             data = self.filter_splicing_on_expression(
@@ -1087,11 +1334,12 @@ class Study(object):
         self.splicing.plot_modalities_bars(sample_ids, feature_ids, data,
                                            self.sample_id_to_phenotype,
                                            self.phenotype_to_color,
-                                           percentages=percentages)
+                                           percentages=percentages,
+                                           n_jobs=n_jobs)
 
 
     def plot_modalities_reduced(self, sample_subset=None, feature_subset=None,
-                                expression_thresh=-np.inf):
+                                expression_thresh=-np.inf, n_jobs=1):
         """Plot splicing events with modality assignments in NMF space
 
         This will plot a separate NMF space for each celltype in the data, as well
@@ -1110,6 +1358,8 @@ class Study(object):
         expression_thresh : float
             If greater than -inf, then filter on splicing events in genes
             with expression at least this value
+        n_jobs : int
+            Number of processes to use for the modality assignments
         """
         if expression_thresh > -np.inf:
             data = self.filter_splicing_on_expression(
@@ -1133,7 +1383,8 @@ class Study(object):
         all_ax = axes[0]
         self.splicing.plot_modalities_reduced(sample_ids, feature_ids,
                                               data=data,
-                                              ax=all_ax, title='all samples')
+                                              ax=all_ax, title='all samples',
+                                              n_jobs=n_jobs)
         axes = axes[1:]
         for i, ((celltype, series), ax) in enumerate(zip(grouped, axes)):
             groups.append(celltype)
@@ -1142,7 +1393,8 @@ class Study(object):
             # legend = i == 0
             self.splicing.plot_modalities_reduced(samples, feature_ids,
                                                   data=data,
-                                                  ax=ax, title=celltype)
+                                                  ax=ax, title=celltype,
+                                                  n_jobs=n_jobs)
 
     def celltype_sizes(self, data_type='splicing'):
         if data_type == 'expression':
@@ -1180,7 +1432,7 @@ class Study(object):
 
     def plot_modalities_lavalamps(self, sample_subset=None,
                                   feature_subset=None,
-                                  expression_thresh=-np.inf):
+                                  expression_thresh=-np.inf, n_jobs=1):
         """Plot each modality in each celltype on a separate axes
 
         Parameters
@@ -1196,6 +1448,8 @@ class Study(object):
         expression_thresh : float
             If greater than -inf, then filter on splicing events in genes
             with expression at least this value
+        n_jobs : int
+            Number of processes to use for the modality assignments
         """
         if expression_thresh > -np.inf:
             data = self.filter_splicing_on_expression(
@@ -1212,7 +1466,8 @@ class Study(object):
         self.splicing.plot_modalities_lavalamps(
             groupby=self.sample_id_to_phenotype,
             phenotype_to_color=self.phenotype_to_color,
-            sample_ids=sample_ids, data=data, feature_ids=feature_ids)
+            sample_ids=sample_ids, data=data, feature_ids=feature_ids,
+            n_jobs=n_jobs)
 
     def plot_event_modality_estimation(self, event_id, sample_subset=None,
                                        expression_thresh=-np.inf):
@@ -1623,7 +1878,13 @@ class Study(object):
             return self.splicing.big_nmf_space_transitions(
                 self.sample_id_to_phenotype, phenotype_transitions, n=n)
 
-    def save(self, name, flotilla_dir=FLOTILLA_DOWNLOAD_DIR):
+    def save(self, name, flotilla_dir=FLOTILLA_DOWNLOAD_DIR, n_jobs=-1):
+        """Save this study as a datapackage
+
+        Only resources whose data changed since the last save with this
+        ``name`` are written again, ``n_jobs`` at a time. See
+        :py:func:`flotilla.datapackage.make_study_datapackage`
+        """
 
         metadata = self.metadata.data
 
@@ -1710,7 +1971,8 @@ class Study(object):
                                       title=self.title,
                                       sources=self.sources,
                                       version=version,
-                                      flotilla_dir=flotilla_dir)
+                                      flotilla_dir=flotilla_dir,
+                                      n_jobs=n_jobs)
 
     @staticmethod
     def _maybe_get_axis_name(df, axis=0, alt_name=None):
@@ -1762,9 +2024,8 @@ class Study(object):
         else:
             # Splicing ids are a multi-index, so the feature renamer will get
             # the name of the feature.
-            splicing_tidy[self._common_id] = [
-                self.splicing.feature_renamer(x)
-                for x in splicing_names.itertuples(index=False)]
+            splicing_tidy[self._common_id] = self.splicing.rename_features(
+                splicing_names.itertuples(index=False))
 
         splicing_tidy = splicing_tidy.dropna()
 
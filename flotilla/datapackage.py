@@ -9,11 +9,19 @@ import string
 import sys
 import urllib2
 
+from joblib import Parallel, delayed
 import pandas as pd
 import matplotlib as mpl
 
+from .util import BINARY_CACHE_SUFFIX, binary_cache_checksum, \
+    write_binary_df, file_checksum, content_hash
+
 
 FLOTILLA_DOWNLOAD_DIR = os.path.expanduser('~/flotilla_projects')
+DOWNLOAD_CHUNKSIZE = 2 ** 20
+PARTIAL_DOWNLOAD_SUFFIX = '.part'
+# Remembers the datapackage name and verified checksum of downloaded urls
+DOWNLOAD_RECORDS_FILENAME = 'downloads.json'
 
 
 def datapackage_url_to_dict(datapackage_url):
@@ -24,15 +32,149 @@ def datapackage_url_to_dict(datapackage_url):
     return datapackage
 
 
+def _read_download_records(download_dir):
+    """Urls downloaded to ``download_dir`` before, as {url: record}
+
+    A record has the ``datapackage_name`` the url was saved under, and the
+    ``checksum`` and ``stat`` (size and modification time) of the file
+    when it was last verified.
+    """
+    try:
+        with open(os.path.join(download_dir,
+                               DOWNLOAD_RECORDS_FILENAME)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_download_records(records, download_dir):
+    filename = os.path.join(download_dir, DOWNLOAD_RECORDS_FILENAME)
+    temp_filename = filename + PARTIAL_DOWNLOAD_SUFFIX
+    with open(temp_filename, 'w') as f:
+        json.dump(records, f, indent=2)
+    os.rename(temp_filename, filename)
+
+
+def _file_stat(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+def verify_checksum(filename, checksum):
+    """Check a file against the "hash" of a datapackage resource
+
+    Parameters
+    ----------
+    filename : str
+        Location of the file on your system
+    checksum : str
+        Hex digest of the file, prefixed by the algorithm, e.g.
+        'sha1:2fd4e1c6...'. Without a prefix, it is assumed to be md5.
+
+    Raises
+    ------
+    ValueError
+        If the file's digest is different
+    """
+    if ':' in checksum:
+        algorithm, expected = checksum.split(':', 1)
+    else:
+        algorithm, expected = 'md5', checksum
+    observed = file_checksum(filename, algorithm=algorithm)
+    if observed.lower() != expected.lower():
+        raise ValueError('{} has {} checksum {}, but {} was expected, so it '
+                         'is corrupted or incomplete'.format(
+                             filename, algorithm, observed, expected))
+
+
+def download(url, filename, checksum=None, chunksize=DOWNLOAD_CHUNKSIZE):
+    """Stream a url to a file, resuming an earlier partial download
+
+    The response is written a chunk at a time to ``filename`` plus
+    ".part", which is only renamed to ``filename`` when it is complete, so
+    an interrupted download is never mistaken for a finished one. The next
+    call then requests only the rest of the file, with an HTTP Range header.
+
+    Parameters
+    ----------
+    url : str
+        HTTP url of a file you want to download
+    filename : str
+        Where to save it
+    checksum : str, optional (default=None)
+        If provided, verify the download with :py:func:`verify_checksum`
+    chunksize : int, optional (default=DOWNLOAD_CHUNKSIZE)
+        Number of bytes to read at a time
+
+    Raises
+    ------
+    IOError
+        If the connection closed before the whole file was received. What
+        was received is kept, to resume from.
+    ValueError
+        If the download doesn't match ``checksum``. It is then deleted.
+    """
+    partial_filename = filename + PARTIAL_DOWNLOAD_SUFFIX
+    start = os.path.getsize(partial_filename) \
+        if os.path.isfile(partial_filename) else 0
+
+    req = urllib2.Request(url)
+    if start > 0:
+        req.add_header('Range', 'bytes={}-'.format(start))
+    opener = urllib2.build_opener()
+    try:
+        opened_url = opener.open(req)
+    except urllib2.HTTPError as e:
+        # "Requested range not satisfiable": we already have the whole file
+        if start == 0 or e.code != 416:
+            raise
+        opened_url = None
+
+    if opened_url is not None:
+        # Servers which don't support ranges send the whole file again
+        resume = start > 0 and opened_url.getcode() == 206
+        content_length = opened_url.info().getheader('Content-Length')
+        received = 0
+        with open(partial_filename, 'ab' if resume else 'wb') as f:
+            for chunk in iter(lambda: opened_url.read(chunksize), ''):
+                f.write(chunk)
+                received += len(chunk)
+        opened_url.close()
+        if content_length is not None and received < int(content_length):
+            raise IOError('Download of {} was interrupted after {} of {} '
+                          'bytes. Try again to resume it.'.format(
+                              url, received, content_length))
+
+    if checksum is not None:
+        try:
+            verify_checksum(partial_filename, checksum)
+        except ValueError:
+            os.remove(partial_filename)
+            raise
+    os.rename(partial_filename, filename)
+
+
 def check_if_already_downloaded(url,
                                 datapackage_name=None,
-                                download_dir=FLOTILLA_DOWNLOAD_DIR):
+                                download_dir=FLOTILLA_DOWNLOAD_DIR,
+                                checksum=None):
     """If a url filename has already been downloaded, don't download it again.
 
     Parameters
     ----------
     url : str
         HTTP url of a file you want to downlaod
+    datapackage_name : str, optional (default=None)
+        Name of the datapackage, whose folder in ``download_dir`` the file is
+        saved to. If None, ``url`` is assumed to be a datapackage.json file,
+        and the name is read from it, or from the download records of
+        an earlier call.
+    download_dir : str, optional (default=FLOTILLA_DOWNLOAD_DIR)
+        Where to save datapackages
+    checksum : str, optional (default=None)
+        The "hash" of the resource in the datapackage. If provided, the file
+        is verified with :py:func:`verify_checksum`, and downloaded again if
+        it doesn't match. A file is only verified again if it changed.
 
     Returns
     -------
@@ -46,11 +188,18 @@ def check_if_already_downloaded(url,
     except OSError:
         pass
 
+    records = _read_download_records(download_dir)
+    record = dict(records.get(url, {}))
+
+    content = None
+    if datapackage_name is None:
+        datapackage_name = record.get('datapackage_name')
     if datapackage_name is None:
         req = urllib2.Request(url)
         opener = urllib2.build_opener()
         opened_url = opener.open(req)
-        datapackage = json.loads(opened_url.read())
+        content = opened_url.read()
+        datapackage = json.loads(content)
         datapackage_name = datapackage['name']
 
     package_dir = '{}/{}'.format(download_dir, datapackage_name)
@@ -64,17 +213,67 @@ def check_if_already_downloaded(url,
     basename = url.rsplit('/', 1)[-1]
     filename = os.path.expanduser(os.path.join(package_dir, basename))
 
-    if not os.path.isfile(filename):
-        sys.stdout.write('{} has not been downloaded before.\n\tDownloading '
-                         'now to {}\n'.format(url, filename))
-        req = urllib2.Request(url)
-        opener = urllib2.build_opener()
-        opened_url = opener.open(req)
-        with open(filename, 'w') as f:
-            f.write(opened_url.read())
+    if os.path.isfile(filename) and checksum is not None and (
+            record.get('checksum') != checksum
+            or record.get('stat') != _file_stat(filename)):
+        try:
+            verify_checksum(filename, checksum)
+        except ValueError as e:
+            sys.stderr.write('{}\n\tDownloading it again\n'.format(e))
+            os.remove(filename)
+
+    partial_filename = filename + PARTIAL_DOWNLOAD_SUFFIX
+    if not os.path.isfile(filename) and content is not None:
+        # Already fetched the datapackage to find out its name
+        with open(partial_filename, 'wb') as f:
+            f.write(content)
+        os.rename(partial_filename, filename)
+    elif not os.path.isfile(filename):
+        if os.path.isfile(partial_filename):
+            sys.stdout.write('Resuming the download of {} to {}\n'.format(
+                url, filename))
+        else:
+            sys.stdout.write('{} has not been downloaded before.\n\t'
+                             'Downloading now to {}\n'.format(url, filename))
+        download(url, filename, checksum=checksum)
+
+    record['datapackage_name'] = datapackage_name
+    if checksum is not None:
+        record['checksum'] = checksum
+        record['stat'] = _file_stat(filename)
+    if record != records.get(url):
+        records[url] = record
+        _write_download_records(records, download_dir)
     return filename
 
 
+def _write_resource(data, data_filename, binary_cache=False, header=0,
+                    index_col=0):
+    """Write a resource as a gzipped csv, and maybe its binary copy
+
+    The csv is written to a temporary file which is then renamed, so an
+    interrupted save doesn't leave a truncated resource behind.
+
+    Returns
+    -------
+    checksum : str
+        md5 hex digest of the csv.gz file, for the resource's "hash"
+    """
+    temp_filename = data_filename + PARTIAL_DOWNLOAD_SUFFIX
+    with gzip.open(temp_filename, 'wb') as f:
+        data.to_csv(f)
+    os.rename(temp_filename, data_filename)
+
+    if binary_cache:
+        # Keyed the same way as util.load_with_binary_cache, which reads
+        # it instead of the csv
+        checksum = binary_cache_checksum(
+            data_filename, compression='gzip', header=header,
+            index_col=index_col)
+        write_binary_df(data, data_filename + BINARY_CACHE_SUFFIX, checksum)
+    return file_checksum(data_filename, algorithm='md5')
+
+
 def make_study_datapackage(name, metadata,
                            expression_data=None,
                            splicing_data=None,
@@ -94,8 +293,18 @@ def make_study_datapackage(name, metadata,
                            splicing_feature_data=None,
                            splicing_feature_kws=None,
                            host="https://s3-us-west-2.amazonaws.com/",
-                           host_destination='flotilla-projects/'):
+                           host_destination='flotilla-projects/',
+                           binary_cache=False, n_jobs=-1):
     """Example code for making a datapackage for a Study
+
+    If ``binary_cache`` is True, also write the binary copy of each resource
+    that :py:meth:`flotilla.Study.from_datapackage` reads instead of the
+    csv.gz file, so even the first load doesn't need to parse the csv.
+
+    The content hash of each resource is saved in the datapackage.json, and
+    a resource is only written again if its contents changed since the last
+    save to this directory. Changed resources are compressed at the same
+    time on ``n_jobs`` threads.
     """
     if ' ' in name:
         raise ValueError("Datapackage name cannot have any spaces")
@@ -124,7 +333,16 @@ def make_study_datapackage(name, metadata,
                  'splicing_feature': (splicing_feature_data,
                                       splicing_feature_kws)}
 
+    filename = '{}/datapackage.json'.format(datapackage_dir)
+    try:
+        with open(filename) as f:
+            saved_resources = dict((resource['name'], resource) for resource
+                                   in json.load(f)['resources'])
+    except (IOError, ValueError, KeyError):
+        saved_resources = {}
+
     datapackage['resources'] = []
+    to_write = []
     for resource_name, (data, kws) in resources.items():
         if data is None:
             continue
@@ -134,13 +352,27 @@ def make_study_datapackage(name, metadata,
 
         basename = '{}.csv.gz'.format(resource_name)
         data_filename = '{}/{}'.format(datapackage_dir, basename)
-        with gzip.open(data_filename, 'wb') as f:
-            data.to_csv(f)
 
+        header, index_col = 0, 0
         if isinstance(data.columns, pd.MultiIndex):
-            resource['header'] = range(len(data.columns.levels))
+            header = resource['header'] = range(len(data.columns.levels))
         if isinstance(data.index, pd.MultiIndex):
-            resource['index_col'] = range(len(data.index.levels))
+            index_col = resource['index_col'] = range(len(data.index.levels))
+
+        # Hash the data again, in case it was modified in place, e.g. by
+        # marking outliers in the metadata
+        resource['content_hash'] = content_hash(data, refresh=True)
+        saved = saved_resources.get(resource_name, {})
+        unchanged = saved.get('content_hash') == resource['content_hash'] \
+            and 'hash' in saved and os.path.isfile(data_filename) \
+            and (not binary_cache or
+                 os.path.isdir(data_filename + BINARY_CACHE_SUFFIX))
+        if unchanged:
+            resource['hash'] = saved['hash']
+        else:
+            to_write.append((resource, delayed(_write_resource)(
+                data, data_filename, binary_cache=binary_cache,
+                header=header, index_col=index_col)))
         # try:
         # # TODO: only transmit data if it has been updated
         # subprocess.call(
@@ -161,7 +393,12 @@ def make_study_datapackage(name, metadata,
                                  for k,v in value.iteritems())
                 resource[key] = value
 
-    filename = '{}/datapackage.json'.format(datapackage_dir)
+    # gzip releases the GIL while compressing, so threads are enough
+    checksums = Parallel(n_jobs=n_jobs, backend='threading')(
+        write for resource, write in to_write)
+    for (resource, write), checksum in zip(to_write, checksums):
+        resource['hash'] = checksum
+
     with open(filename, 'w') as f:
         json.dump(datapackage, f, indent=2)
     sys.stdout.write('Wrote datapackage to {}'.format(filename))
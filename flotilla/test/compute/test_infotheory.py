@@ -56,6 +56,34 @@ def test_binify(bins, df1):
     pdt.assert_frame_equal(binned, true_binned)
 
 
+def test_binify_with_na(bins, df1):
+    from flotilla.compute.infotheory import bin_range_strings, binify
+
+    df1 = df1.copy()
+    df1.iloc[:3, 0] = np.nan
+    df1.iloc[:, 1] = np.nan
+    df1.iloc[4, 2] = bins[-1]
+    df1.iloc[5, 2] = bins[-1] + 1
+    binned = binify(df1, bins)
+
+    true_binned = df1.apply(
+        lambda x: pd.Series(np.histogram(x.dropna(), bins=bins)[0]))
+    true_binned.index = bin_range_strings(bins)
+    true_binned = true_binned / true_binned.sum().astype(float)
+
+    pdt.assert_frame_equal(binned, true_binned)
+
+
+def test_binify_dtype(bins, df1):
+    from flotilla.compute.infotheory import binify
+
+    binned = binify(df1, bins, dtype=np.float32)
+    true_binned = binify(df1, bins)
+
+    npt.assert_equal(binned.values.dtype, np.float32)
+    npt.assert_array_almost_equal(binned.values, true_binned.values)
+
+
 def test_kld(p, q):
     from flotilla.compute.infotheory import kld
 
@@ -80,6 +108,20 @@ def test_jsd(p, q):
     pdt.assert_series_equal(result, true_result)
 
 
+def test_kld_jsd_unaligned(p, q):
+    from flotilla.compute.infotheory import jsd, kld
+
+    # Columns in only one of the dataframes can't be compared
+    p = p.iloc[:, :15]
+    q = q.iloc[:, 5:]
+    for function in (kld, jsd):
+        result = function(p, q)
+
+        assert result[:5].isnull().all()
+        assert result[15:].isnull().all()
+        assert result[5:15].notnull().all()
+
+
 @pytest.fixture(params=[None, 2, 10])
 def base(request):
     return request.param
@@ -96,4 +138,117 @@ def test_entropy(p, base):
 
     true_result = -((np.log(p) / np.log(base)) * p).sum(axis=0)
 
-    pdt.assert_series_equal(result, true_result)
\ No newline at end of file
+    pdt.assert_series_equal(result, true_result)
+
+
+@pytest.mark.parametrize('block_size', [None, 1])
+def test_cross_phenotype_jsd(bins, df1, df2, block_size, monkeypatch):
+    import flotilla.compute.infotheory as infotheory
+    from flotilla.compute.infotheory import binify_and_jsd, \
+        cross_phenotype_jsd, _bootstrap_weights
+
+    if block_size is not None:
+        # One feature at a time
+        monkeypatch.setattr(infotheory, 'JSD_BLOCK_SIZE', block_size)
+
+    data = pd.concat([df1, df2], ignore_index=True)
+    groupby = pd.Series(['a'] * df1.shape[0] + ['b'] * df2.shape[0],
+                        index=data.index)
+    n_iter = 10
+    jsd_df = cross_phenotype_jsd(data, groupby, bins, n_iter=n_iter,
+                                 random_state=0)
+
+    true_between = binify_and_jsd(df1, df2, ('a', 'b'), bins)
+
+    npt.assert_equal(list(jsd_df.columns),
+                     [('a', 'a'), ('a', 'b'), ('b', 'b')])
+    pdt.assert_series_equal(jsd_df[('a', 'b')], true_between)
+
+    # One bootstrap iteration at a time, binning the same resampled halves
+    seeds = np.random.RandomState(0).randint(np.iinfo(np.int32).max, size=2)
+    for (phenotype, df), seed in zip(data.groupby(groupby), seeds):
+        weights = _bootstrap_weights(df.shape[0], n_iter,
+                                     np.random.RandomState(seed))
+        jsds = []
+        for weights1, weights2 in zip(*weights):
+            rows = np.arange(df.shape[0])
+            half1 = df.iloc[np.repeat(rows, weights1.astype(int))]
+            half2 = df.iloc[np.repeat(rows, weights2.astype(int))]
+            jsds.append(binify_and_jsd(half1, half2, None, bins))
+        true_within = pd.concat(jsds, axis=1).mean(axis=1)
+        npt.assert_array_almost_equal(
+            jsd_df[(phenotype, phenotype)].values,
+            true_within.reindex(jsd_df.index).values)
+
+
+def test_kld_array(p, q):
+    from flotilla.compute.infotheory import kld, kld_array
+
+    out = np.empty(p.shape[1])
+    result = kld_array(p.values, q.values, out=out)
+
+    assert result is out
+    npt.assert_array_almost_equal(result, kld(p, q).values)
+
+
+def test_jsd_array(p, q):
+    from flotilla.compute.infotheory import jsd, jsd_array
+
+    result = jsd_array(p.values, q.values)
+
+    npt.assert_array_almost_equal(result, jsd(p, q).values)
+
+
+def test_jsd_array_not_prob_dist(p, q):
+    from flotilla.compute.infotheory import jsd_array
+
+    with pytest.raises(ValueError):
+        jsd_array(p.values * 2, q.values)
+
+
+def test_entropy_array(p, base):
+    from flotilla.compute.infotheory import entropy, entropy_array
+
+    if base is None:
+        base = 2
+    result = entropy_array(p.values, base=base)
+
+    npt.assert_array_almost_equal(result, entropy(p, base=base).values)
+
+
+def test_jsd_permutation_test(bins, df1, df2):
+    from flotilla.compute.infotheory import binify_and_jsd, \
+        jsd_permutation_test
+
+    data = pd.concat([df1, df2 / 2], ignore_index=True)
+    groupby = pd.Series(['a'] * df1.shape[0] + ['b'] * df2.shape[0],
+                        index=data.index)
+    n_permutations = 20
+    jsd_test = jsd_permutation_test(data, groupby, bins,
+                                    n_permutations=n_permutations,
+                                    random_state=0)
+
+    true_jsd = binify_and_jsd(df1, df2 / 2, ('a', 'b'), bins)
+
+    npt.assert_equal(list(jsd_test.columns),
+                     ['feature', 'pair', 'jsd', 'p', 'q'])
+    npt.assert_array_almost_equal(jsd_test['jsd'].values, true_jsd.values)
+    assert np.all(jsd_test['p'] >= 1. / (n_permutations + 1))
+    assert np.all(jsd_test['p'] <= 1)
+    assert np.all(jsd_test['q'] >= jsd_test['p'])
+
+
+def test__pairs_jsd_blocks(p, q, monkeypatch):
+    import flotilla.compute.infotheory as infotheory
+
+    histograms = np.array([p.values, q.values, (p.values + q.values) / 2])
+    pairs = np.array([(0, 1), (0, 2), (1, 2)])
+    true_jsd = infotheory._pairs_jsd(histograms, pairs)
+
+    # One pair at a time
+    monkeypatch.setattr(infotheory, 'JSD_BLOCK_SIZE', 1)
+    test_jsd = infotheory._pairs_jsd(histograms, pairs)
+
+    npt.assert_array_equal(test_jsd, true_jsd)
+    npt.assert_array_almost_equal(test_jsd[0], np.sqrt(
+        infotheory.jsd_array(p.values, q.values)))
@@ -84,6 +84,25 @@ class TestModalityModel(object):
         npt.assert_array_equal(test_logsumexp_logliks,
                                logsumexp(model.logliks(x)))
 
+    def test_logliks_matrix(self, x, model):
+        from flotilla.compute.splicing import beta_sufficient_statistics
+
+        n, sum_log_x, sum_log_1mx = beta_sufficient_statistics(
+            x[:, np.newaxis])
+        test_logliks = model.logliks_matrix(n, sum_log_x, sum_log_1mx)
+
+        true_logliks = model.logliks(x)
+        npt.assert_array_almost_equal(test_logliks[:, 0], true_logliks)
+
+    def test_logpdf_table(self, x, model):
+        test_table = model.logpdf_table(x)
+
+        true_x = x.copy()
+        true_x[true_x == 0] = 0.001
+        true_x[true_x == 1] = 0.999
+        true_table = np.array([rv.logpdf(true_x) for rv in model.rvs])
+        npt.assert_array_equal(test_table, true_table)
+
     def test_eq(self, alphas, betas):
         from flotilla.compute.splicing import ModalityModel
 
@@ -185,6 +204,85 @@ class TestModalityEstimator(object):
 
         pdt.assert_equal(test_guess_modality, true_guess_modality)
 
+    def test_logsumexp_logliks_matrix(self, estimator, splicing_data_fixed):
+        test_logsumexp_logliks = estimator._logsumexp_logliks_matrix(
+            splicing_data_fixed)
+
+        true_logsumexp_logliks = splicing_data_fixed.apply(
+            lambda x: pd.Series({k: v.logsumexp_logliks(x)
+                                 for k, v in estimator.models.iteritems()}),
+            axis=0)
+        pdt.assert_frame_equal(test_logsumexp_logliks, true_logsumexp_logliks)
+
+    def test_fit_transform_events_per_second(self, estimator,
+                                             splicing_data_no_na):
+        estimator.fit_transform(splicing_data_no_na)
+        assert estimator.events_per_second > 0
+
+    def test_init_psi_resolution(self, step, vmax):
+        from flotilla.compute.splicing import ModalityEstimator
+
+        estimator = ModalityEstimator(step, vmax, psi_resolution=1e-3)
+
+        true_psi_grid = np.linspace(0, 1, 1001)
+        npt.assert_array_almost_equal(estimator.psi_grid, true_psi_grid)
+        for name, model in estimator.models.iteritems():
+            npt.assert_array_equal(estimator.logpdf_tables[name],
+                                   model.logpdf_table(true_psi_grid))
+
+    def test_fit_transform_psi_resolution(self, step, vmax,
+                                          splicing_data_fixed):
+        from flotilla.compute.splicing import ModalityEstimator
+
+        exact = ModalityEstimator(step, vmax)
+        lookup = ModalityEstimator(step, vmax, psi_resolution=1e-3)
+
+        test_fit_transform = lookup.fit_transform(splicing_data_fixed)
+        true_fit_transform = exact.fit_transform(splicing_data_fixed)
+
+        pdt.assert_series_equal(test_fit_transform, true_fit_transform)
+
+    @pytest.mark.parametrize('n_jobs', [1, 2])
+    def test_grouped_fit_transform(self, estimator, splicing_data_fixed,
+                                   n_jobs):
+        groupby = pd.Series(
+            np.arange(splicing_data_fixed.shape[0]) % 3,
+            index=splicing_data_fixed.index, name='phenotype')
+        test_grouped = estimator.grouped_fit_transform(
+            splicing_data_fixed, groupby, n_jobs=n_jobs, chunksize=7)
+        true_grouped = splicing_data_fixed.groupby(groupby).apply(
+            estimator.fit_transform)
+
+        pdt.assert_frame_equal(test_grouped, true_grouped)
+
+    def test_bootstrap_fit_transform(self, estimator, splicing_data_fixed):
+        n_iter = 10
+        test_frequencies = estimator.bootstrap_fit_transform(
+            splicing_data_fixed, n_iter=n_iter, random_state=0)
+
+        n_samples = splicing_data_fixed.shape[0]
+        random_state = np.random.RandomState(0)
+        indices = random_state.randint(n_samples, size=(n_iter, n_samples))
+        assignments = pd.DataFrame(
+            [estimator.fit_transform(splicing_data_fixed.iloc[i])
+             for i in indices])
+        true_frequencies = assignments.apply(
+            lambda x: x.value_counts() / float(n_iter)).fillna(0)
+        true_frequencies = true_frequencies.reindex(
+            test_frequencies.index).fillna(0)
+
+        pdt.assert_frame_equal(test_frequencies, true_frequencies)
+
+    @pytest.mark.parametrize('n_jobs', [1, 2])
+    def test_bootstrap_fit_transform_chunked(self, estimator,
+                                             splicing_data_fixed, n_jobs):
+        test_chunked = estimator.bootstrap_fit_transform(
+            splicing_data_fixed, n_iter=10, n_jobs=n_jobs, chunksize=7)
+        true_chunked = estimator.bootstrap_fit_transform(
+            splicing_data_fixed, n_iter=10)
+
+        pdt.assert_frame_equal(test_chunked, true_chunked)
+
     def test_fit_transform_with_na(self, estimator, splicing_data_fixed):
         test_fit_transform = estimator.fit_transform(splicing_data_fixed)
 
@@ -211,6 +309,34 @@ class TestModalityEstimator(object):
         pdt.assert_series_equal(test_fit_transform, true_fit_transform)
 
 
+def test_beta_sufficient_statistics(splicing_data_fixed):
+    from flotilla.compute.splicing import beta_sufficient_statistics
+
+    test_n, test_sum_log_x, test_sum_log_1mx = beta_sufficient_statistics(
+        splicing_data_fixed.values)
+
+    x = splicing_data_fixed.copy()
+    x[x == 0] = 0.001
+    x[x == 1] = 0.999
+    npt.assert_array_equal(test_n, x.count().values)
+    npt.assert_array_almost_equal(test_sum_log_x, np.log(x).sum().values)
+    npt.assert_array_almost_equal(test_sum_log_1mx,
+                                  np.log(1 - x).sum().values)
+
+
+def test_quantized_psi_counts(splicing_data_fixed):
+    from flotilla.compute.splicing import quantized_psi_counts
+
+    n_grid = 11
+    test_counts = quantized_psi_counts(splicing_data_fixed.values, n_grid)
+
+    true_counts = splicing_data_fixed.apply(
+        lambda x: pd.Series(np.round(x.dropna() * (n_grid - 1))
+                            .value_counts(),
+                            index=np.arange(n_grid, dtype=float))).fillna(0)
+    npt.assert_array_equal(test_counts, true_counts.values)
+
+
 @pytest.fixture(params=['list', 'array', 'nan'])
 def array(request):
     x = np.arange(0, 1.1, .1)
@@ -233,6 +359,7 @@ def test_switchy_score(array):
 
     npt.assert_array_equal(test_switchy_score, true_switchy_score)
 
+
 def test_get_switchy_score_order(splicing_data_fixed):
     from flotilla.compute.splicing import get_switchy_score_order, switchy_score
 
@@ -243,3 +370,28 @@ def test_get_switchy_score_order(splicing_data_fixed):
     true_score_order = np.argsort(switchy_scores)
 
     npt.assert_array_equal(test_score_order, true_score_order)
+
+
+def test_switchy_scores(splicing_data_fixed):
+    from flotilla.compute.splicing import switchy_scores, switchy_score
+
+    test_switchy_scores = switchy_scores(splicing_data_fixed)
+
+    true_switchy_scores = np.apply_along_axis(switchy_score, axis=0,
+                                              arr=splicing_data_fixed)
+
+    npt.assert_array_almost_equal(test_switchy_scores, true_switchy_scores)
+
+
+def test_cached_switchy_score_order(splicing_data_fixed):
+    from flotilla.compute.splicing import cached_switchy_score_order, \
+        get_switchy_score_order, _switchy_score_order
+
+    test_score_order = cached_switchy_score_order(splicing_data_fixed)
+    test_score_order_cached = cached_switchy_score_order(
+        splicing_data_fixed.copy())
+    true_score_order = get_switchy_score_order(splicing_data_fixed)
+
+    npt.assert_array_equal(test_score_order, true_score_order)
+    npt.assert_array_equal(test_score_order_cached, true_score_order)
+    assert _switchy_score_order.cache.hits >= 1
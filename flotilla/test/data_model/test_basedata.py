@@ -59,6 +59,25 @@ class TestBaseData:
         assert isinstance(base_data.predictor_config_manager, PredictorConfigManager)
         assert isinstance(base_data.predictor_dataset_manager, PredictorDataSetManager)
 
+    def test_data_version(self, expression_data_no_na):
+        from flotilla.data_model.base import BaseData
+
+        base_data = BaseData(expression_data_no_na)
+        version = base_data.data_version
+        renamer_series = base_data.feature_renamer_series
+
+        base_data.outlier_samples = expression_data_no_na.index[:2]
+        assert base_data.data_version == version + 1
+
+        base_data.data = expression_data_no_na.ix[:, :5]
+        base_data.data_original = base_data.data
+        assert base_data.data_version == version + 3
+        assert len(base_data.feature_renamer_series) == 5
+        assert len(renamer_series) == expression_data_no_na.shape[1]
+
+        base_data.data_changed()
+        assert base_data.data_version == version + 4
+
     def test__init_technical_outliers(self, expression_data_no_na,
                                       technical_outliers):
         from flotilla.data_model.base import BaseData
@@ -133,6 +152,68 @@ class TestBaseData:
                                 feature_renamer_series)
         pdt.assert_dict_equal(base_data.feature_subsets, feature_subsets)
 
+    def test_feature_subset_index_duplicate_ids(self, expression_data_no_na,
+                                                expression_feature_data):
+        from flotilla.data_model.base import subset_index_from_metadata
+
+        # The same feature twice in the feature data, and data columns
+        # without feature data
+        feature_data = expression_feature_data.iloc[
+            [0] + range(len(expression_feature_data))]
+        index = feature_data.index[::-1].append(pd.Index(['no_metadata']))
+        subset_index = subset_index_from_metadata(feature_data, 1,
+                                                  'features', index=index)
+
+        all_features = subset_index.mask('all features')
+        npt.assert_array_equal(all_features, index.isin(feature_data.index))
+        for ids in subset_index.to_dict().values():
+            assert set(ids) <= set(feature_data.index)
+
+    def test__init_memmap(self, expression_data, expression_thresh,
+                          metadata_minimum_samples, pooled, tmpdir):
+        from flotilla.data_model.base import BaseData
+
+        kwargs = dict(thresh=expression_thresh,
+                      minimum_samples=metadata_minimum_samples, pooled=pooled)
+        base_data = BaseData(expression_data, **kwargs)
+        memmapped = BaseData(expression_data, memmap_dir=tmpdir.strpath,
+                             **kwargs)
+        sample_ids = expression_data.index[::2]
+        feature_ids = base_data.data.columns[:10]
+
+        assert isinstance(memmapped._memmap_values(memmapped.data),
+                          np.memmap)
+        assert memmapped.data.values.dtype == np.float32
+        pdt.assert_frame_equal(memmapped.data_original,
+                               expression_data.astype(np.float32))
+        pdt.assert_frame_equal(memmapped.data,
+                               base_data.data.astype(np.float32))
+        pdt.assert_frame_equal(memmapped.singles,
+                               base_data.singles.astype(np.float32))
+        pdt.assert_frame_equal(
+            memmapped._subset(memmapped.data, sample_ids, feature_ids),
+            base_data._subset(base_data.data, sample_ids,
+                              feature_ids).astype(np.float32))
+
+    def test_rename_features(self, expression_data_no_na,
+                             expression_feature_data,
+                             expression_feature_rename_col):
+        from flotilla.data_model.base import BaseData
+
+        base_data = BaseData(expression_data_no_na,
+                             feature_data=expression_feature_data,
+                             feature_rename_col=expression_feature_rename_col)
+        feature_ids = base_data.data.columns
+        renamer_series = base_data.feature_renamer_series
+        name = renamer_series.iloc[0]
+        true_feature_ids = feature_ids.intersection(
+            renamer_series.index[renamer_series == name])
+
+        assert base_data.rename_features(feature_ids) == \
+            [base_data.feature_renamer(x) for x in feature_ids]
+        pdt.assert_array_equal(base_data.maybe_renamed_to_feature_id(name),
+                               true_feature_ids)
+
     @pytest.mark.xfail
     def test__init_multiindex(self, df_norm):
         from flotilla.data_model.base import BaseData
@@ -153,9 +234,37 @@ class TestBaseData:
         var_cut = var.mean() + 2*var.std()
         variant = expression_data.columns[var > var_cut]
 
-        pdt.assert_equal(base_data._var_cut, var_cut)
+        pdt.assert_almost_equal(base_data._var_cut, var_cut)
         pdt.assert_array_equal(base_data.variant, variant)
 
+    def test_feature_stats(self, expression_data, pooled):
+        from flotilla.data_model.base import BaseData
+
+        thresh = 0.5
+        base_data = BaseData(expression_data, thresh=thresh, pooled=pooled)
+        stats = base_data.feature_stats
+        data = base_data.data
+
+        npt.assert_array_equal(stats.count, data.count())
+        npt.assert_allclose(stats.mean, data.mean())
+        npt.assert_allclose(stats.variance, data.var())
+        npt.assert_array_equal(stats.minimum, data.min())
+        npt.assert_array_equal(stats.maximum, data.max())
+        npt.assert_array_equal(stats.n_above, data[data > thresh].count())
+
+        # Removing the pooled samples is the same as only using the singles
+        singles = base_data.singles
+        singles_stats = base_data._singles_feature_stats
+        npt.assert_array_equal(singles_stats.count, singles.count())
+        npt.assert_allclose(singles_stats.mean, singles.mean())
+        npt.assert_allclose(singles_stats.variance, singles.var())
+        npt.assert_array_equal(singles_stats.minimum, singles.min())
+        npt.assert_array_equal(singles_stats.maximum, singles.max())
+
+        # Changing the outliers doesn't change the data
+        base_data.outlier_samples = data.index[:2]
+        assert base_data.feature_stats is stats
+
     def test__subset(self, expression_data_no_na, sample_ids, feature_ids):
         from flotilla.data_model.base import BaseData
 
@@ -165,17 +274,25 @@ class TestBaseData:
         data = base_data.data
         if feature_ids is None:
             feature_ids = data.columns
-        else:
-            feature_ids = pd.Index(set(feature_ids).intersection(data.columns))
         if sample_ids is None:
             sample_ids = data.index
-        else:
-            sample_ids = pd.Index(set(sample_ids).intersection(data.index))
 
-        true_subset = data.ix[sample_ids, feature_ids]
+        true_subset = data.ix[data.index.isin(sample_ids),
+                              data.columns.isin(feature_ids)]
 
         pdt.assert_frame_equal(subset, true_subset)
 
+    def test__partition_subset(self, expression_data_no_na, pooled,
+                               sample_ids, feature_ids):
+        from flotilla.data_model.base import BaseData
+
+        base_data = BaseData(expression_data_no_na, pooled=pooled)
+        singles = base_data._partition_subset('singles', sample_ids,
+                                              feature_ids)
+        true_singles = base_data._subset(base_data.singles, sample_ids,
+                                         feature_ids)
+        pdt.assert_frame_equal(singles, true_singles)
+
     def test__subset_and_standardize(self, expression_data_no_na,
                                      standardize, feature_ids,
                                      sample_ids):
@@ -245,6 +362,95 @@ class TestBaseData:
         pdt.assert_series_equal(test_reduced.means,
                                 true_reduced.means)
 
+    def test_reduce_float32(self, expression_data_no_na):
+        from flotilla.data_model.base import BaseData
+
+        expression = BaseData(expression_data_no_na.astype(np.float32),
+                              thresh=0.5, minimum_samples=5)
+        subset = expression._subset_and_standardize(expression.data)
+        reduced = expression.reduce()
+
+        assert (expression.data.dtypes == np.float32).all()
+        assert (subset.dtypes == np.float32).all()
+        assert (reduced.X.dtypes == np.float32).all()
+
+    def test_data_content_hash(self, expression_data_no_na,
+                               expression_feature_data):
+        from flotilla.data_model.base import BaseData
+
+        base_data = BaseData(expression_data_no_na.copy(),
+                             feature_data=expression_feature_data.copy())
+        digest = base_data.data_content_hash
+
+        base_data.data.iloc[0, 0] += 1
+        base_data.data_changed()
+        assert base_data.data_content_hash != digest
+        digest = base_data.data_content_hash
+
+        base_data.feature_data.iloc[0, 0] = 'another_name'
+        base_data.data_changed()
+        assert base_data.data_content_hash != digest
+        digest = base_data.data_content_hash
+
+        base_data.feature_rename_col = expression_feature_data.columns[0]
+        assert base_data.data_content_hash != digest
+
+    def test_jsd_df_result_store(self, expression_data_no_na, groupby,
+                                 tmpdir, monkeypatch):
+        import flotilla.data_model.base
+        from flotilla.data_model.base import BaseData
+        from flotilla.util import ResultStore
+
+        calls = []
+        cross_phenotype_jsd = flotilla.data_model.base.cross_phenotype_jsd
+
+        def counted(*args, **kwargs):
+            calls.append(1)
+            return cross_phenotype_jsd(*args, **kwargs)
+        monkeypatch.setattr(flotilla.data_model.base, 'cross_phenotype_jsd',
+                            counted)
+
+        base_data = BaseData(expression_data_no_na)
+        base_data.result_store = ResultStore(tmpdir.strpath)
+        jsd_df = base_data.jsd_df(groupby, n_iter=2)
+
+        # A new instance with the same data reads the result from disk
+        base_data = BaseData(expression_data_no_na)
+        base_data.result_store = ResultStore(tmpdir.strpath)
+        pdt.assert_frame_equal(base_data.jsd_df(groupby, n_iter=2), jsd_df)
+        assert len(calls) == 1
+
+    def test_classify_result_store(self, expression_data_no_na, groupby,
+                                   tmpdir):
+        from flotilla.data_model.base import BaseData
+        from flotilla.util import ResultStore
+
+        trait = pd.Series(groupby, name='phenotype').reindex(
+            expression_data_no_na.index)
+        base_data = BaseData(expression_data_no_na)
+        base_data.result_store = ResultStore(tmpdir.strpath)
+        classifier = base_data.classify(trait, None, None)
+
+        # Remembered in memory, but nothing is pickled to the store
+        assert base_data.classify(trait, None, None) is classifier
+        assert tmpdir.listdir() == []
+        assert classifier.trait_name == 'phenotype'
+
+    def test__standardize(self, expression_data):
+        from flotilla.data_model.base import BaseData
+
+        base_data = BaseData(expression_data)
+        subset, standardizer = base_data._standardize(base_data.data)
+
+        data = base_data.data
+        true_subset = StandardScaler().fit_transform(
+            data.fillna(data.mean()).fillna(0))
+
+        npt.assert_allclose(subset.values, true_subset, atol=1e-10)
+        npt.assert_allclose(standardizer.means, data.mean())
+        npt.assert_allclose(standardizer.transform(data.values),
+                            subset.values, atol=1e-10)
+
     def test_feature_subset_to_feature_ids(self, expression_data_no_na,
                                            expression_feature_data,
                                            feature_subset):
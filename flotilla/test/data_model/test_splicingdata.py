@@ -4,6 +4,7 @@ computation or visualization tests yet.
 """
 import matplotlib.pyplot as plt
 import numpy as np
+import numpy.testing as npt
 import pandas as pd
 import pandas.util.testing as pdt
 import pytest
@@ -234,6 +235,74 @@ class TestSplicingData:
 
         pdt.assert_frame_equal(test_modality_assignments, true_assignments)
 
+    def test_modality_assignments_n_jobs(self, splicing_fixed, groupby_fixed):
+        test_modality_assignments = splicing_fixed.modality_assignments(
+            groupby=groupby_fixed, n_jobs=2)
+        true_modality_assignments = splicing_fixed.modality_assignments(
+            groupby=groupby_fixed, n_jobs=1)
+
+        pdt.assert_frame_equal(test_modality_assignments,
+                               true_modality_assignments)
+
+    def test_modality_assignments_n_iter(self, splicing_fixed, groupby_fixed):
+        test_frequencies = splicing_fixed.modality_assignments(
+            groupby=groupby_fixed, n_iter=10)
+
+        npt.assert_array_almost_equal(
+            test_frequencies.groupby(level=0).sum().values, 1)
+
+    def test_modality_assignments_n_iter_random_state(self,
+                                                      splicing_data_fixed):
+        from flotilla.data_model.splicing import SplicingData
+
+        # The same samples twice, in two groups of the same size
+        copy = splicing_data_fixed.copy()
+        copy.index = ['copy_{}'.format(i) for i in copy.index]
+        data = pd.concat([splicing_data_fixed, copy])
+        groupby = pd.Series(['original'] * splicing_data_fixed.shape[0]
+                            + ['copy'] * copy.shape[0], index=data.index)
+        splicing = SplicingData(data)
+
+        frequencies = splicing.modality_assignments(
+            groupby=groupby, n_iter=10, random_state=0)
+        pdt.assert_frame_equal(
+            SplicingData(data).modality_assignments(
+                groupby=groupby, n_iter=10, random_state=0),
+            frequencies)
+
+        # Each group is resampled differently
+        assert not np.allclose(frequencies.ix['original'].values,
+                               frequencies.ix['copy'].values)
+
+    def test_modality_assignments_result_store(self, splicing_data_fixed,
+                                               groupby_fixed, tmpdir,
+                                               monkeypatch):
+        from flotilla.compute.splicing import ModalityEstimator
+        from flotilla.data_model.splicing import SplicingData
+        from flotilla.util import ResultStore
+
+        calls = []
+        fit_transform = ModalityEstimator.fit_transform
+
+        def counted(self, *args, **kwargs):
+            calls.append(1)
+            return fit_transform(self, *args, **kwargs)
+        monkeypatch.setattr(ModalityEstimator, 'fit_transform', counted)
+
+        splicing = SplicingData(splicing_data_fixed)
+        splicing.result_store = ResultStore(tmpdir.strpath)
+        modality_assignments = splicing.modality_assignments(
+            groupby=groupby_fixed)
+        n_calls = len(calls)
+
+        # A new instance with the same data reads the result from disk
+        splicing = SplicingData(splicing_data_fixed)
+        splicing.result_store = ResultStore(tmpdir.strpath)
+        pdt.assert_frame_equal(
+            splicing.modality_assignments(groupby=groupby_fixed),
+            modality_assignments)
+        assert len(calls) == n_calls
+
     @pytest.mark.xfail
     def test_modality_assignments_all_inputs_not_none(self, splicing_fixed,
                                                groupby_fixed):
@@ -92,6 +92,39 @@ class TestStudy(object):
         #         flotilla.embark(shalek2013_datapackage_path, load_species_data=False)
         #
 
+    def test_lazy(self, metadata_data_groups_fixed, metadata_kws_fixed,
+                  expression_data_no_na, expression_kws,
+                  splicing_data_fixed, splicing_kws, study_no_mapping_stats):
+        from flotilla.data_model import Study
+
+        kwargs = {}
+        kw_pairs = (('metadata', metadata_kws_fixed),
+                    ('expression', expression_kws),
+                    ('splicing', splicing_kws))
+        for data_type, kws in kw_pairs:
+            for kw_name, kw_value in kws.iteritems():
+                kwargs['{}_{}'.format(data_type, kw_name)] = kw_value
+        loaded = []
+
+        def expression_data():
+            loaded.append('expression')
+            return expression_data_no_na
+
+        study = Study(metadata_data_groups_fixed,
+                      expression_data=expression_data,
+                      splicing_data=splicing_data_fixed, lazy=True, **kwargs)
+        assert loaded == []
+        assert 'expression' not in study.__dict__
+        assert 'splicing' not in study.__dict__
+
+        pdt.assert_frame_equal(study.expression.data,
+                               study_no_mapping_stats.expression.data)
+        assert loaded == ['expression']
+        assert 'splicing' not in study.__dict__
+
+        study.expression.data
+        assert loaded == ['expression']
+
     def test_plot_pca(self, study_no_mapping_stats, color_samples_by):
         study_no_mapping_stats.plot_pca(color_samples_by=color_samples_by,
                                         feature_subset='all')
@@ -361,6 +394,19 @@ class TestStudy(object):
     #
     #     pdt.assert_frame_equal(test_positions, true_positions)
 
+
+@pytest.mark.parametrize('binary_cache', [False, True])
+def test__load_resource(expression_data_no_na, tmpdir, binary_cache):
+    from flotilla.data_model.study import _load_resource
+    from flotilla.util import load_csv
+
+    filename = tmpdir.join('expression.csv').strpath
+    expression_data_no_na.to_csv(filename)
+
+    df = _load_resource('expression', load_csv, filename,
+                        binary_cache=binary_cache, index_col=0)
+    pdt.assert_frame_equal(df, load_csv(filename, index_col=0))
+
 # def test_write_package(tmpdir):
 # from flotilla.data_model import StudyFactory
 #
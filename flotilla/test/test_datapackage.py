@@ -0,0 +1,199 @@
+"""Test making datapackages, and downloading their resources from a local
+HTTP server"""
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+
+CONTENT = ''.join(chr(i % 256) for i in range(100000))
+
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve ``server.files``, with "Range: bytes=start-" if
+    ``server.ranges``, cutting off responses after ``server.truncate``
+    bytes"""
+
+    def do_GET(self):
+        range_header = self.headers.getheader('Range')
+        self.server.requests.append((self.path, range_header))
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+
+        start = 0
+        if range_header is not None and self.server.ranges:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_error(416)
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:][:self.server.truncate])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(request):
+    httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    httpd.files = {'/expression.csv': CONTENT}
+    httpd.requests = []
+    httpd.ranges = True
+    httpd.truncate = None
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    request.addfinalizer(httpd.shutdown)
+    return httpd
+
+
+def test_check_if_already_downloaded(server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    url = server.url + '/expression.csv'
+    filename = check_if_already_downloaded(url, 'test',
+                                           download_dir=tmpdir.strpath)
+    with open(filename) as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(filename + '.part')
+
+    check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath)
+    assert len(server.requests) == 1
+
+
+@pytest.mark.parametrize('ranges', [True, False])
+def test_check_if_already_downloaded_resume(server, tmpdir, ranges):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    server.ranges = ranges
+    server.truncate = 1000
+    url = server.url + '/expression.csv'
+    with pytest.raises(IOError):
+        check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath)
+
+    filename = tmpdir.join('test', 'expression.csv').strpath
+    assert not os.path.exists(filename)
+    assert os.path.getsize(filename + '.part') == 1000
+
+    server.truncate = None
+    check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath)
+    with open(filename) as f:
+        assert f.read() == CONTENT
+    assert server.requests[-1] == ('/expression.csv', 'bytes=1000-')
+
+
+def test_check_if_already_downloaded_checksum(server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    url = server.url + '/expression.csv'
+    with pytest.raises(ValueError):
+        check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath,
+                                    checksum=hashlib.md5('wrong').hexdigest())
+    filename = tmpdir.join('test', 'expression.csv').strpath
+    assert not os.path.exists(filename)
+    assert not os.path.exists(filename + '.part')
+
+    checksum = 'sha1:{}'.format(hashlib.sha1(CONTENT).hexdigest())
+    check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath,
+                                checksum=checksum)
+    with open(filename) as f:
+        assert f.read() == CONTENT
+
+    # A corrupted file is downloaded again
+    with open(filename, 'w') as f:
+        f.write(CONTENT[:10])
+    check_if_already_downloaded(url, 'test', download_dir=tmpdir.strpath,
+                                checksum=checksum)
+    with open(filename) as f:
+        assert f.read() == CONTENT
+    assert len(server.requests) == 3
+
+
+def test_check_if_already_downloaded_datapackage_name(server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    datapackage = json.dumps({'name': 'test', 'resources': []})
+    server.files['/datapackage.json'] = datapackage
+    url = server.url + '/datapackage.json'
+
+    filename = check_if_already_downloaded(url, download_dir=tmpdir.strpath)
+    assert filename == tmpdir.join('test', 'datapackage.json').strpath
+    with open(filename) as f:
+        assert f.read() == datapackage
+
+    # The name is remembered, so there's no need to fetch it again
+    check_if_already_downloaded(url, download_dir=tmpdir.strpath)
+    assert len(server.requests) == 1
+
+
+def test_make_study_datapackage_unchanged(metadata_data_groups_fixed,
+                                          expression_data_no_na, tmpdir):
+    from flotilla.datapackage import make_study_datapackage
+
+    metadata = metadata_data_groups_fixed.copy()
+    make_study_datapackage('test', metadata, expression_data_no_na,
+                           flotilla_dir=tmpdir.strpath)
+    metadata_file = tmpdir.join('test', 'metadata.csv.gz').strpath
+    expression_file = tmpdir.join('test', 'expression.csv.gz').strpath
+    metadata_inode = os.stat(metadata_file).st_ino
+    expression_inode = os.stat(expression_file).st_ino
+
+    # Modified in place, like when marking outliers
+    metadata['outlier'] = True
+    make_study_datapackage('test', metadata, expression_data_no_na,
+                           flotilla_dir=tmpdir.strpath)
+
+    assert os.stat(metadata_file).st_ino != metadata_inode
+    assert os.stat(expression_file).st_ino == expression_inode
+    with open(tmpdir.join('test', 'datapackage.json').strpath) as f:
+        resources = json.load(f)['resources']
+    for resource in resources:
+        filename = tmpdir.join('test', resource['path']).strpath
+        assert resource['hash'] == hashlib.md5(
+            open(filename, 'rb').read()).hexdigest()
+
+
+def test_make_study_datapackage_binary_cache(metadata_data_groups_fixed,
+                                            expression_data_no_na, tmpdir):
+    from flotilla.datapackage import make_study_datapackage
+    from flotilla.data_model.study import _load_resource
+    from flotilla.util import load_csv
+    import pandas.util.testing as pdt
+
+    make_study_datapackage('test', metadata_data_groups_fixed,
+                           expression_data_no_na,
+                           flotilla_dir=tmpdir.strpath, binary_cache=True)
+
+    # Read the resource with the arguments from the json file, like
+    # Study.from_datapackage does, where strings are unicode
+    with open(tmpdir.join('test', 'datapackage.json').strpath) as f:
+        resources = json.load(f)['resources']
+    resource = [r for r in resources if r['name'] == 'expression'][0]
+    filename = tmpdir.join('test', resource['path']).strpath
+
+    calls = []
+
+    def reader(filename, **kwargs):
+        calls.append(filename)
+        return load_csv(filename, **kwargs)
+
+    test = _load_resource(
+        'expression', reader, filename, binary_cache=True,
+        compression=resource['compression'],
+        header=resource.get('header', 0),
+        index_col=resource.get('index_col', 0))
+
+    # The binary copy written with the datapackage was read, not the csv
+    assert calls == []
+    pdt.assert_frame_equal(test, expression_data_no_na, check_names=False)
@@ -1,5 +1,9 @@
 """Test utilities interfacing with external-facing modules, e.g. links to
 gene lists"""
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
 
 
 def test_link_to_list():
@@ -21,3 +25,302 @@ def test_link_to_list():
     #     .tolist()
     #
     # assert true_list == test_list
+
+
+def test_content_hash():
+    from flotilla.util import content_hash
+
+    df = pd.DataFrame(np.arange(12).reshape(3, 4))
+
+    assert content_hash(df) == content_hash(df.copy())
+    assert content_hash(df) != content_hash(df + 1)
+    assert content_hash(df) != content_hash(df.T)
+    assert content_hash((df, 1)) != content_hash((df, 2))
+    assert content_hash({'compression': 'gzip'}) == \
+        content_hash({u'compression': u'gzip'})
+
+
+def test_lru_cache():
+    from flotilla.util import LRUCache
+
+    cache = LRUCache(maxbytes=3 * np.zeros(10).nbytes)
+    for i in range(4):
+        cache.set(i, np.zeros(10))
+    cache.get(0)
+    cache.get(3)
+
+    assert 0 not in cache
+    assert len(cache) == 3
+    assert cache.stats() == dict(hits=1, misses=1, evictions=1, size=3,
+                                 currbytes=cache.currbytes,
+                                 maxbytes=cache.maxbytes)
+
+
+def test_memory_budget():
+    from flotilla.util import LRUCache, MemoryBudget
+
+    budget = MemoryBudget(maxbytes=3 * np.zeros(10).nbytes)
+    first = LRUCache(budget=budget)
+    second = LRUCache(budget=budget)
+    first.set(0, np.zeros(10))
+    second.set(0, np.zeros(10))
+    first.set(1, np.zeros(10))
+    second.get(0)
+    second.set(1, np.zeros(10))
+
+    # The least recently used value of either cache is evicted
+    assert 0 not in first
+    assert 0 in second
+    assert first.evictions == 1
+    assert budget.currbytes == first.currbytes + second.currbytes
+
+    budget.resize(np.zeros(10).nbytes)
+    assert len(first) + len(second) == 1
+
+
+def test_nbytes():
+    from flotilla.util import nbytes
+
+    class Fitted(object):
+        def __init__(self):
+            self.components_ = np.zeros((100, 100))
+
+    assert nbytes(Fitted()) > np.zeros((100, 100)).nbytes
+
+    df = pd.DataFrame({'a': np.zeros(100), 'b': ['x'] * 100})
+    assert nbytes(df) >= df.index.nbytes + np.zeros(100).nbytes
+
+    # Shared arrays are counted once
+    x = np.zeros(100)
+    assert nbytes([x, x]) < 2 * x.nbytes
+
+
+def test_content_hash_instance():
+    from flotilla.util import content_hash, _instance_tokens
+
+    class Thing(object):
+        pass
+
+    thing = Thing()
+    assert content_hash(thing) == content_hash(thing)
+    assert content_hash(thing) != content_hash(Thing())
+
+    key = id(thing)
+    del thing
+    assert key not in _instance_tokens
+
+
+def test_content_hash_not_weakrefable():
+    import datetime
+    from flotilla.util import content_hash, lru_memoize, ContentHashError, \
+        _instance_tokens
+
+    # Hashed by value, without being kept alive
+    n_tokens = len(_instance_tokens)
+    assert content_hash(np.dtype(float)) == content_hash(np.dtype(float))
+    assert content_hash(np.dtype(float)) != content_hash(np.dtype(int))
+    assert content_hash(datetime.date(2015, 1, 1)) == \
+        content_hash(datetime.date(2015, 1, 1))
+    assert len(_instance_tokens) == n_tokens
+
+    class Unhashable(object):
+        __slots__ = ()
+
+        def __reduce__(self):
+            raise TypeError('Can not pickle')
+
+    with pytest.raises(ContentHashError):
+        content_hash(Unhashable())
+
+    calls = []
+
+    @lru_memoize()
+    def identity(x):
+        calls.append(x)
+        return x
+
+    # Not remembered, rather than remembered wrongly
+    unhashable = Unhashable()
+    identity(unhashable)
+    identity(unhashable)
+    assert len(calls) == 2
+
+
+def test_lru_memoize():
+    from flotilla.util import lru_memoize
+
+    calls = []
+
+    @lru_memoize()
+    def total(df):
+        calls.append(df)
+        return df.sum().sum()
+
+    df = pd.DataFrame(np.arange(12).reshape(3, 4))
+    total(df)
+    total(df.copy())
+    total(df + 1)
+
+    assert len(calls) == 2
+    assert total.cache.hits == 1
+    assert total.cache.misses == 2
+
+
+def test_lru_memoize_data_version():
+    from flotilla.util import lru_memoize
+
+    class Data(object):
+        data_version = 0
+
+        @lru_memoize()
+        def value(self):
+            return self.data_version
+
+    data = Data()
+    data.value()
+    data.data_version += 1
+
+    assert data.value() == 1
+
+
+@pytest.fixture(params=['array', 'series', 'dataframe', 'object'])
+def result(request):
+    x = np.arange(12).reshape(3, 4).astype(float)
+    if request.param == 'array':
+        return x
+    elif request.param == 'series':
+        return pd.Series(x[0], index=list('abcd'), name='a')
+    elif request.param == 'dataframe':
+        return pd.DataFrame(x, index=list('abc'), columns=list('abcd'))
+    elif request.param == 'object':
+        return {'a': x}
+
+
+def test_result_store(tmpdir, result):
+    from flotilla.util import ResultStore, content_hash
+
+    store = ResultStore(str(tmpdir.join('results')))
+    key = store.key('test', result)
+
+    with pytest.raises(KeyError):
+        store.get(key)
+
+    store.set(key, result)
+    assert key in store
+    assert content_hash(store.get(key)) == content_hash(result)
+
+
+def test_stored_result(tmpdir):
+    from flotilla.util import ResultStore, stored_result
+
+    class Data(object):
+        result_store = None
+        calls = 0
+
+        @stored_result
+        def total(self, x, y=1):
+            self.calls += 1
+            return x + y
+
+    data = Data()
+    data.result_store = ResultStore(str(tmpdir))
+    data.total(1)
+    data.total(1, y=1)
+    data.total(2)
+
+    assert data.calls == 2
+
+
+@pytest.fixture(params=['numeric', 'mixed'])
+def df_to_cache(request):
+    df = pd.DataFrame(np.random.randn(5, 3), index=list('abcde'),
+                      columns=['x', 'y', 'z'])
+    if request.param == 'mixed':
+        df['z'] = list('vwxyz')
+    return df
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_binary_df(tmpdir, df_to_cache, mmap):
+    from flotilla.util import load_binary_df, write_binary_df
+
+    dirname = str(tmpdir.join('df'))
+    write_binary_df(df_to_cache, dirname)
+    test_df = load_binary_df(dirname, mmap=mmap)
+
+    pdt.assert_frame_equal(test_df, df_to_cache)
+
+
+def test_load_with_binary_cache(tmpdir, df_to_cache):
+    from flotilla.util import BINARY_CACHE_SUFFIX, load_csv, \
+        load_with_binary_cache
+
+    filename = str(tmpdir.join('df.csv'))
+    df_to_cache.to_csv(filename)
+
+    first = load_with_binary_cache(load_csv, filename, index_col=0)
+    assert tmpdir.join('df.csv' + BINARY_CACHE_SUFFIX).check(dir=True)
+    cached = load_with_binary_cache(load_csv, filename, index_col=0)
+    pdt.assert_frame_equal(cached, first)
+
+    # Changing the source invalidates the cache
+    (df_to_cache.iloc[:2]).to_csv(filename)
+    changed = load_with_binary_cache(load_csv, filename, index_col=0)
+    assert changed.shape[0] == 2
+
+
+def test_compact_dtypes():
+    from flotilla.util import compact_dtypes
+
+    df = pd.DataFrame({'phenotype': ['A', 'B'] * 5,
+                       'sample_id': ['sample_{}'.format(i)
+                                     for i in range(10)],
+                       'value': np.arange(10, dtype=float)})
+    compacted = compact_dtypes(df)
+
+    assert compacted['value'].dtype == np.float32
+    assert compacted['phenotype'].dtype.name == 'category'
+    assert compacted['sample_id'].dtype == object
+    pdt.assert_frame_equal(compacted.astype(object), df.astype(object),
+                           check_dtype=False)
+    assert compact_dtypes(df, float32=False)['value'].dtype == np.float64
+    assert (compact_dtypes(df[['value']]).dtypes == np.float32).all()
+
+
+def test_rename_index():
+    from flotilla.util import RenameIndex
+
+    renamer = pd.Series(['RBFOX2', 'RBFOX2', 'SRSF1', 'PTBP1'],
+                        index=['ENSG1', 'ENSG2', 'ENSG3', 'ENSG3'])
+    index = RenameIndex(renamer)
+
+    assert index.ids('RBFOX2') == ['ENSG1', 'ENSG2']
+    assert index.ids('ENSG1') == []
+    assert index.name('ENSG3') == 'SRSF1'
+    assert index.name('ENSG4') == 'ENSG4'
+    assert index.name('ENSG4', missing=str.lower) == 'ensg4'
+    assert index.rename(['ENSG2', 'ENSG4']) == ['RBFOX2', 'ENSG4']
+
+
+def test_subset_index():
+    from flotilla.util import SubsetIndex
+
+    index = pd.Index(['a', 'b', 'c', 'd', 'e'])
+    subsets = SubsetIndex(index, {
+        'pooled': [True, False, False, False, True],
+        'phenotype: neuron': [True, True, True, False, False],
+        'not (pooled)': [False, True, True, True, False]})
+
+    assert list(subsets.ids('pooled')) == ['a', 'e']
+    assert list(subsets.ids('phenotype: neuron & ~pooled')) == ['b', 'c']
+    assert list(subsets.ids('~(phenotype: neuron | pooled)')) == ['d']
+    assert list(subsets.ids('not (pooled) & ~phenotype: neuron')) == ['d']
+    assert subsets.mask('pooled | not (pooled)').all()
+    assert sorted(subsets.to_dict().keys()) == sorted(subsets.keys())
+
+    with pytest.raises(KeyError):
+        subsets.ids('pooled & outlier')
+    with pytest.raises(ValueError):
+        subsets.ids('(pooled & ~')
+    with pytest.raises(ValueError):
+        subsets.add('outlier', [True, False])
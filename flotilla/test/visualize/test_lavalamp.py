@@ -0,0 +1,72 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def psi():
+    x = np.random.uniform(size=(20, 50))
+    x[x < 0.1] = np.nan
+    return pd.DataFrame(x)
+
+
+def test__lavalamp_density(psi):
+    from flotilla.visualize.splicing import _lavalamp_density
+
+    n_event_bins, n_psi_bins = 10, 5
+    y = psi.values
+    counts = _lavalamp_density(y, n_event_bins, n_psi_bins)
+
+    n_samples, n_events = y.shape
+    x = np.tile(np.arange(n_events), (n_samples, 1))
+    finite = np.isfinite(y)
+    true_counts = np.histogram2d(y[finite], x[finite],
+                                 bins=(n_psi_bins, n_event_bins),
+                                 range=((0, 1), (0, n_events)))[0]
+
+    npt.assert_array_equal(counts, true_counts)
+
+
+@pytest.mark.parametrize('density', [None, True, False])
+def test_lavalamp(psi, density):
+    from flotilla.visualize.splicing import lavalamp
+
+    fig, ax = plt.subplots()
+    lavalamp(psi, ax=ax, density=density, max_points=100)
+
+    if density is False:
+        assert len(ax.images) == 0
+    else:
+        assert len(ax.images) == 1
+    plt.close('all')
+
+
+def test_lavalamp_density_marker_kws(psi):
+    from flotilla.visualize.splicing import lavalamp
+
+    fig, ax = plt.subplots()
+    plot_kws = {'alpha': 0.5, 'markeredgecolor': 'k',
+                'markerfacecolor': 'none', 'markeredgewidth': 1}
+    lavalamp(psi, ax=ax, density=True, plot_kws=plot_kws)
+
+    assert len(ax.images) == 1
+    assert 'cmap' not in plot_kws
+    plt.close('all')
+
+
+def test_lavalamp_pooled_inconsistent():
+    from flotilla.visualize.splicing import lavalamp_pooled_inconsistent
+
+    # Enough psi scores that both would be plotted as a density by default
+    singles = pd.DataFrame(np.random.uniform(size=(1100, 100)))
+    pooled = pd.DataFrame(np.random.uniform(size=(1100, 100)))
+    pooled_inconsistent = pooled.iloc[:, :10]
+    lavalamp_pooled_inconsistent(singles, pooled, pooled_inconsistent)
+
+    # The singles are a density, and the pooled samples markers on top
+    for ax in plt.gcf().axes:
+        assert len(ax.images) == 1
+        assert len(ax.lines) > 0
+    plt.close('all')
@@ -2,20 +2,29 @@
 General use utilities
 """
 
+import collections
 import datetime
 from functools import wraps
 import errno
+import hashlib
 import os
 import re
+import shutil
 import signal
 import sys
 import subprocess
 import functools
+import inspect
 import time
 import cPickle
 import gzip
+import itertools
 import tempfile
+import threading
+import types
+import weakref
 
+import numpy as np
 import pandas as pd
 
 
@@ -77,29 +86,645 @@ def install_development_package(package_location):
     os.chdir(original_location)
 
 
+MEMOIZE_MAXBYTES = 2 ** 30
+
+
+_content_hashes = {}
+_instance_tokens = {}
+_next_instance_token = itertools.count()
+
+
+class ContentHashError(TypeError):
+    """Raised when an object can be hashed neither by its contents nor by
+    its identity, so results computed from it can't be remembered"""
+    pass
+
+
+def content_hash(obj, refresh=False):
+    """A fast hash of the contents of numpy arrays and pandas objects
+
+    Arrays, Series and DataFrames are hashed on their values, index, columns
+    and dtypes, rather than on their (truncated) ``str``, so two different
+    objects only share a hash if their contents are equal. Lists, tuples and
+    dicts are hashed on their items, classes and named functions on their
+    module and name, and anything else that is not a string or number on
+    its identity, which is never shared with an object created after it was
+    garbage collected. Objects which can't be weakly referenced, such as
+    numpy dtypes or datetimes, are hashed on their pickle or ``repr``
+    instead. ``str`` and ``unicode`` strings of the same text share a
+    hash. The hash of an array or pandas object is
+    remembered as long as the object exists, so hashing the same object
+    again is free. Modifying an object in place does not change its
+    remembered hash, unless ``refresh`` is True.
+
+    Parameters
+    ----------
+    obj : object
+        Anything
+    refresh : bool, optional (default=False)
+        If True, hash the contents of an array or pandas object again even
+        if its hash is remembered, e.g. after it was modified in place
+
+    Returns
+    -------
+    hash : str
+        Hex digest of the contents of ``obj``
+
+    Raises
+    ------
+    ContentHashError
+        If ``obj`` can't be weakly referenced, pickled or told apart by its
+        ``repr``
+    """
+    if isinstance(obj, (np.ndarray, pd.Index, pd.Series, pd.DataFrame)):
+        key = id(obj)
+        try:
+            ref, digest = _content_hashes[key]
+            if ref() is obj and not refresh:
+                return digest
+        except KeyError:
+            pass
+        digest = _hash_pandas_or_array(obj)
+        try:
+            # Forget the hash once the object is garbage collected
+            ref = weakref.ref(obj, lambda r, key=key: _content_hashes.pop(
+                key, None))
+            _content_hashes[key] = ref, digest
+        except TypeError:
+            pass
+        return digest
+
+    if isinstance(obj, (list, tuple)):
+        contents = [type(obj).__name__] + [content_hash(x) for x in obj]
+    elif isinstance(obj, (set, frozenset)):
+        contents = ['set'] + sorted(content_hash(x) for x in obj)
+    elif isinstance(obj, dict):
+        contents = ['dict'] + ['{}:{}'.format(content_hash(k), content_hash(v))
+                               for k, v in sorted(obj.items())]
+    elif isinstance(obj, basestring):
+        # str and unicode with the same text, e.g. read from a json file or
+        # written in the code, hash the same
+        if isinstance(obj, unicode):
+            obj = obj.encode('utf-8')
+        contents = ['str', repr(obj)]
+    elif obj is None or isinstance(obj, (bool, int, long, float,
+                                         np.generic)):
+        contents = [type(obj).__name__, repr(obj)]
+    elif isinstance(obj, (type, types.ClassType)) or (
+            isinstance(obj, (types.FunctionType, types.BuiltinFunctionType))
+            and obj.__name__ != '<lambda>'):
+        # Named the same way in every session
+        contents = ['name', '{}.{}'.format(obj.__module__, obj.__name__)]
+    else:
+        token = _instance_token(obj)
+        if token is not None:
+            contents = [type(obj).__name__, 'instance', str(token)]
+        else:
+            contents = [type(obj).__name__, 'value', _value_hash(obj)]
+    return hashlib.sha1('|'.join(contents)).hexdigest()
+
+
+def _instance_token(obj):
+    """Number identifying an object for as long as it exists
+
+    Unlike ``id(obj)``, which is reused by new objects once ``obj`` is
+    garbage collected, the number is never given to another object. None if
+    the object can't be weakly referenced, since there is then no telling
+    when it is garbage collected.
+    """
+    key = id(obj)
+    try:
+        ref, token = _instance_tokens[key]
+        if ref() is obj:
+            return token
+    except KeyError:
+        pass
+    try:
+        # Forget the token once the object is garbage collected
+        ref = weakref.ref(obj, lambda r, key=key: _instance_tokens.pop(
+            key, None))
+    except TypeError:
+        return None
+    token = next(_next_instance_token)
+    _instance_tokens[key] = ref, token
+    return token
+
+
+def _value_hash(obj):
+    """Hash of an object by its pickle, or else by its ``repr``
+
+    Raises
+    ------
+    ContentHashError
+        If the object can't be pickled and its ``repr`` only shows its
+        address
+    """
+    try:
+        return hashlib.sha1(cPickle.dumps(
+            obj, cPickle.HIGHEST_PROTOCOL)).hexdigest()
+    except (cPickle.PicklingError, TypeError, AttributeError, ValueError):
+        pass
+    text = repr(obj)
+    if ' at 0x' in text:
+        raise ContentHashError('Can not hash {!r}'.format(type(obj)))
+    return hashlib.sha1(text).hexdigest()
+
+
+def _hash_pandas_or_array(obj):
+    """Hash the values, dtypes and labels of an array or pandas object"""
+    sha1 = hashlib.sha1(type(obj).__name__)
+    if isinstance(obj, pd.DataFrame):
+        sha1.update(content_hash(obj.index))
+        sha1.update(content_hash(obj.columns))
+        sha1.update(str(list(obj.dtypes)))
+        if len(set(obj.dtypes)) > 1:
+            # Hash a column at a time, rather than making an object array of
+            # all of them
+            for i in xrange(obj.shape[1]):
+                sha1.update(_hash_values(obj.iloc[:, i].values))
+            return sha1.hexdigest()
+        values = obj.values
+    elif isinstance(obj, pd.Series):
+        sha1.update(content_hash(obj.index))
+        sha1.update(str(obj.name))
+        values = obj.values
+    elif isinstance(obj, pd.Index):
+        sha1.update(str(obj.names))
+        values = np.asarray(obj)
+    else:
+        values = obj
+
+    sha1.update(_hash_values(values))
+    return sha1.hexdigest()
+
+
+def _hash_values(values):
+    """Hash the dtype, shape and contents of an array"""
+    values = np.asarray(values)
+    sha1 = hashlib.sha1(str(values.dtype) + str(values.shape))
+    if values.dtype.hasobject:
+        sha1.update(cPickle.dumps(values.tolist(), cPickle.HIGHEST_PROTOCOL))
+    else:
+        sha1.update(np.ascontiguousarray(values).view(np.uint8))
+    return sha1.hexdigest()
+
+
+def nbytes(obj, _seen=None):
+    """Approximate memory used by an object, counting numpy/pandas data
+
+    Containers, and the attributes of other objects such as fitted
+    reducers, are walked to count the arrays and dataframes they hold. Each
+    object is only counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, pd.Index):
+        return obj.nbytes
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        try:
+            return int(np.sum(obj.memory_usage(index=True)))
+        except (TypeError, AttributeError):
+            # pandas < 0.17 can't count the index, so count the dtypes'
+            # sizes rather than making an array of the values
+            itemsizes = obj.dtypes if isinstance(obj, pd.DataFrame) \
+                else [obj.dtype]
+            return len(obj) * sum(getattr(dtype, 'itemsize', 8)
+                                  for dtype in itemsizes) + \
+                obj.index.nbytes + \
+                getattr(obj, 'columns', pd.Index([])).nbytes
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(nbytes(x, _seen) for x in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(nbytes(k, _seen) + nbytes(v, _seen)
+                                        for k, v in obj.iteritems())
+    if isinstance(obj, (type, types.ClassType, types.ModuleType,
+                        types.FunctionType, types.MethodType)):
+        # Shared by everything, so not worth counting
+        return 0
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += nbytes(obj.__dict__, _seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if isinstance(slot, basestring):
+            size += nbytes(getattr(obj, slot, None), _seen)
+    return size
+
+
+def deep_nbytes(df):
+    """Memory used by a dataframe, including the strings in object columns
+    """
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except (TypeError, AttributeError):
+        # pandas < 0.17.1 can't count the strings
+        return nbytes(df)
+
+
+def compact_dtypes(df, float32=True, max_unique_fraction=0.5):
+    """Store a dataframe in less memory
+
+    float64 columns become float32, and string columns with repeated values
+    become categoricals.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to compact
+    float32 : bool, optional (default=True)
+        If False, leave float64 columns as they are
+    max_unique_fraction : float, optional (default=0.5)
+        Only make categoricals of string columns with at most this fraction
+        of unique values
+
+    Returns
+    -------
+    compacted : pandas.DataFrame
+        The same data with smaller dtypes
+    """
+    if float32 and (df.dtypes == np.float64).all():
+        return df.astype(np.float32)
+
+    compacted = df.copy()
+    for col in df:
+        series = df[col]
+        if float32 and series.dtype == np.float64:
+            compacted[col] = series.astype(np.float32)
+        elif series.dtype == object \
+                and series.nunique() <= max_unique_fraction * len(series) \
+                and all(isinstance(x, basestring) for x in series.dropna()):
+            try:
+                compacted[col] = series.astype('category')
+            except TypeError:
+                # pandas < 0.15 has no categoricals
+                pass
+    return compacted
+
+
+class MemoryBudget(object):
+    """Maximum total size of the values of one or more :py:class:`LRUCache`
+
+    When adding a value to any of the caches would exceed the budget, the
+    least recently used values of all of them are evicted first.
+
+    Parameters
+    ----------
+    maxbytes : int, optional
+        Maximum total size of the cached values, as measured by
+        :py:func:`nbytes`. If None, never evict.
+    """
+
+    def __init__(self, maxbytes=MEMOIZE_MAXBYTES):
+        self.maxbytes = maxbytes
+        self.currbytes = 0
+        self.lock = threading.RLock()
+        self._order = collections.OrderedDict()
+
+    def resize(self, maxbytes):
+        """Change the budget, evicting values until they fit"""
+        with self.lock:
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def _add(self, cache, key, size):
+        self._order[cache, key] = size
+        self.currbytes += size
+        self._evict()
+
+    def _touch(self, cache, key):
+        self._order[cache, key] = self._order.pop((cache, key))
+
+    def _remove(self, cache, key):
+        self.currbytes -= self._order.pop((cache, key))
+
+    def _evict(self):
+        while self.maxbytes is not None and self.currbytes > self.maxbytes:
+            (cache, key), size = self._order.popitem(last=False)
+            self.currbytes -= size
+            cache._evicted(key)
+
+
+# Shared by all functions decorated with lru_memoize(), so together they use
+# at most this much memory. Change it with MEMOIZE_BUDGET.resize(maxbytes)
+MEMOIZE_BUDGET = MemoryBudget(MEMOIZE_MAXBYTES)
+
+
+class LRUCache(object):
+    """Least-recently-used cache, bounded by the total size of its values
+
+    Parameters
+    ----------
+    maxbytes : int, optional
+        Maximum total size of the cached values, as measured by
+        :py:func:`nbytes`. When adding a value would exceed it, the least
+        recently used values are evicted. If None, never evict. Ignored if
+        ``budget`` is given.
+    budget : MemoryBudget, optional
+        Budget shared with other caches, such as ``MEMOIZE_BUDGET``. By
+        default, the cache has a budget of its own of ``maxbytes``.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Number of lookups that were found and not found, and number of
+        values evicted, since the cache was created or last cleared
+    currbytes : int
+        Total size of the values in this cache
+    """
+
+    def __init__(self, maxbytes=MEMOIZE_MAXBYTES, budget=None):
+        self.budget = MemoryBudget(maxbytes) if budget is None else budget
+        self._data = {}
+        self.currbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxbytes(self):
+        return self.budget.maxbytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self.budget.lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.budget._touch(self, key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = nbytes(value)
+        with self.budget.lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                # Never worth evicting everything else for
+                return
+            self._data[key] = value, size
+            self.currbytes += size
+            self.budget._add(self, key, size)
+
+    def _remove(self, key):
+        self.currbytes -= self._data.pop(key)[1]
+        self.budget._remove(self, key)
+
+    def _evicted(self, key):
+        """Forget a value the budget evicted"""
+        self.currbytes -= self._data.pop(key)[1]
+        self.evictions += 1
+
+    def clear(self):
+        with self.budget.lock:
+            for key in list(self._data):
+                self._remove(key)
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Hits, misses, evictions, number of values and bytes used"""
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, size=len(self._data),
+                    currbytes=self.currbytes, maxbytes=self.maxbytes)
+
+
+def lru_memoize(maxbytes=None):
+    """Remember the output of a function, keyed on the contents of its input
+
+    Arguments are keyed with :py:func:`content_hash`, so large dataframes
+    are cheap to key and different data never collides. For methods of
+    objects with a ``data_version``, such as
+    :py:class:`flotilla.data_model.BaseData`, the version is part of the key,
+    so results are recomputed after the data changes. The outputs are
+    kept in an :py:class:`LRUCache`, available as the ``cache`` attribute of
+    the decorated function. By default, the outputs of all memoized
+    functions share ``MEMOIZE_BUDGET``, and the least recently used of any
+    of them are evicted when it is full. If ``maxbytes`` is given, the
+    function has a budget of its own instead.
+
+    do_not_memoize : bool
+        IF this is a keyword argument (kwarg) in the function, and it is true,
+        then just evaluate the function and don't memoize it.
+
+    >>> @lru_memoize(maxbytes=2 ** 20)
+    ... def double(x):
+    ...     return 2 * x
+    >>> double(1), double(1)
+    (2, 2)
+    >>> double.cache.hits, double.cache.misses
+    (1, 1)
+    """
+    def decorator(obj):
+        budget = MEMOIZE_BUDGET if maxbytes is None else None
+        cache = obj.cache = LRUCache(maxbytes, budget=budget)
+        missing = object()
+
+        @functools.wraps(obj)
+        def memoizer(*args, **kwargs):
+            if 'do_not_memoize' in kwargs and kwargs['do_not_memoize']:
+                return obj(*args, **kwargs)
+            # Results of methods are only valid for the version of the data
+            # of the object they were computed on
+            version = getattr(args[0], 'data_version', None) if args \
+                else None
+            try:
+                key = content_hash((version, args, kwargs))
+            except ContentHashError:
+                return obj(*args, **kwargs)
+            value = cache.get(key, missing)
+            if value is missing:
+                value = obj(*args, **kwargs)
+                cache.set(key, value)
+            return value
+
+        memoizer.cache = cache
+        return memoizer
+
+    return decorator
+
+
 def memoize(obj):
     """'Memoize' aka remember the output from a function and return that,
     rather than recalculating
 
-    Stolen from:
-    https://wiki.python.org/moin/PythonDecoratorLibrary#CA-237e205c0d5bd1459c3663a3feb7f78236085e0a_1
+    Same as ``lru_memoize()``, kept for backwards compatibility.
 
     do_not_memoize : bool
         IF this is a keyword argument (kwarg) in the function, and it is true,
         then just evaluate the function and don't memoize it.
     """
-    cache = obj.cache = {}
+    return lru_memoize()(obj)
+
+
+RESULT_STORE_DIRNAME = 'results'
+
+
+class ResultStore(object):
+    """Store results of expensive computations on disk, between sessions
+
+    Results are keyed on a :py:func:`content_hash` of the flotilla version,
+    the name of the computation and its inputs. numpy arrays, and Series
+    and DataFrames of numbers, are saved as ``.npz`` files, and anything else
+    is pickled.
+
+    Parameters
+    ----------
+    directory : str
+        Where to save the results, e.g. a "results" folder in the datapackage
+        directory. Created if it doesn't exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+
+    def key(self, name, *inputs):
+        """Key of a computation called ``name`` on these inputs"""
+        from . import __version__
+        return content_hash((__version__, name, inputs))
+
+    def _filename(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def __contains__(self, key):
+        return any(os.path.isfile(self._filename(key, extension))
+                   for extension in ('.npz', '.pickle.gz'))
+
+    def get(self, key):
+        """Load a stored result
+
+        Raises
+        ------
+        KeyError
+            If no result is stored with this key
+        """
+        filename = self._filename(key, '.npz')
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                npz = np.load(f)
+                values = npz['values']
+                if 'labels' not in npz.files:
+                    return values
+                kind, labels = cPickle.loads(npz['labels'].tostring())
+            if kind == 'DataFrame':
+                index, columns = labels
+                return pd.DataFrame(values, index=index, columns=columns)
+            index, name = labels
+            return pd.Series(values, index=index, name=name)
+
+        filename = self._filename(key, '.pickle.gz')
+        if os.path.isfile(filename):
+            with gzip.open(filename, 'rb') as f:
+                return cPickle.load(f)
+        raise KeyError(key)
+
+    def set(self, key, value):
+        """Save a result. Results that can't be saved are skipped, with a
+        warning, since they can always be recomputed."""
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass
+
+        labels = None
+        if isinstance(value, pd.DataFrame):
+            labels = 'DataFrame', (value.index, value.columns)
+        elif isinstance(value, pd.Series):
+            labels = 'Series', (value.index, value.name)
+        values = np.asarray(value)
+
+        # Write to a temporary file first so a half-written result is never
+        # read back
+        try:
+            if isinstance(value, (np.ndarray, pd.Series, pd.DataFrame)) \
+                    and not values.dtype.hasobject:
+                filename = self._filename(key, '.npz')
+                arrays = {'values': values}
+                if labels is not None:
+                    arrays['labels'] = np.frombuffer(cPickle.dumps(
+                        labels, cPickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+                with tempfile.NamedTemporaryFile(dir=self.directory,
+                                                 delete=False) as f:
+                    np.savez(f, **arrays)
+            else:
+                filename = self._filename(key, '.pickle.gz')
+                with tempfile.NamedTemporaryFile(dir=self.directory,
+                                                 delete=False) as f:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+                        cPickle.dump(value, g, cPickle.HIGHEST_PROTOCOL)
+            os.rename(f.name, filename)
+        except (cPickle.PicklingError, TypeError, AttributeError,
+                IOError, OSError) as e:
+            sys.stderr.write('{}\tCould not store result {}: {}\n'.format(
+                timestamp(), key, e))
+            try:
+                os.remove(f.name)
+            except (NameError, OSError):
+                pass
+
+    def clear(self):
+        """Delete all stored results"""
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith(('.npz', '.pickle.gz')):
+                os.remove(os.path.join(self.directory, filename))
+
+
+def stored_result(obj):
+    """Check the object's ``result_store`` for the output of this method
 
+    If the object has a :py:class:`ResultStore` as its ``result_store``
+    attribute, the output is looked up there first, and saved there after
+    being computed. The key is made from the name of the method, every
+    argument including defaults, and the object's ``data_content_hash``
+    (or the object itself if it doesn't have one). If ``result_store`` is
+    None, the method is just called.
+
+    do_not_memoize : bool
+        IF this is a keyword argument (kwarg) in the function, and it is true,
+        then just evaluate the function and don't store it.
+    """
     @functools.wraps(obj)
-    def memoizer(*args, **kwargs):
-        if 'do_not_memoize' in kwargs and kwargs['do_not_memoize']:
-            return obj(*args, **kwargs)
-        key = str(args) + str(kwargs)
-        if key not in cache:
-            cache[key] = obj(*args, **kwargs)
-        return cache[key]
+    def wrapper(self, *args, **kwargs):
+        store = getattr(self, 'result_store', None)
+        if store is None or kwargs.get('do_not_memoize', False):
+            return obj(self, *args, **kwargs)
 
-    return memoizer
+        callargs = inspect.getcallargs(obj, self, *args, **kwargs)
+        callargs.pop(inspect.getargspec(obj).args[0])
+        try:
+            key = store.key('{}.{}'.format(type(self).__name__,
+                                           obj.__name__),
+                            getattr(self, 'data_content_hash', self),
+                            callargs)
+        except ContentHashError:
+            return obj(self, *args, **kwargs)
+        try:
+            return store.get(key)
+        except (KeyError, EOFError, IOError, ValueError,
+                cPickle.UnpicklingError):
+            # Not stored yet, or unreadable, so recompute
+            pass
+        result = obj(self, *args, **kwargs)
+        store.set(key, result)
+        return result
+
+    return wrapper
 
 
 class cached_property(object):
@@ -122,12 +747,18 @@ class cached_property(object):
     attribute value is a dictionary which has a key for every property of the
     object which is wrapped by this decorator. Each entry in the cache is
     created only when the property is accessed for the first time and is a
-    two-element tuple with the last computed property value and the last time
-    it was updated in seconds since the epoch.
+    three-element tuple with the last computed property value, the last time
+    it was updated in seconds since the epoch, and the instance's
+    ``data_version`` at that time (or None).
 
     The default time-to-live (TTL) is 300 seconds (5 minutes). Set the TTL to
     zero for the cached value to never expire.
 
+    If the instance has a ``data_version`` attribute, as
+    :py:class:`flotilla.data_model.BaseData` does, the version the value was
+    computed at is stored too, and the value is recomputed whenever the
+    version changes.
+
     To expire a cached property value manually just do::
 
         del instance._cache[<property name>]
@@ -149,20 +780,246 @@ class cached_property(object):
 
     def __get__(self, inst, owner):
         now = time.time()
+        version = getattr(inst, 'data_version', None)
         try:
-            value, last_update = inst._cache[self.__name__]
+            value, last_update, last_version = inst._cache[self.__name__]
             if self.ttl > 0 and now - last_update > self.ttl:
                 raise AttributeError
+            if last_version != version:
+                raise AttributeError
         except (KeyError, AttributeError):
             value = self.fget(inst)
             try:
                 cache = inst._cache
             except AttributeError:
                 cache = inst._cache = {}
-            cache[self.__name__] = (value, now)
+            cache[self.__name__] = (value, now, version)
         return value
 
 
+class RenameIndex(object):
+    """Hash index of renamed ids, e.g. gene symbols, in both directions
+
+    Looks up the name of an id, or all the ids with a name, in constant
+    time, instead of scanning a pandas Series for each lookup.
+
+    Parameters
+    ----------
+    renamer : pandas.Series
+        Renamed ids, indexed by the original ids. If an id appears more than
+        once, its first name is used.
+
+    Attributes
+    ----------
+    id_to_name : dict
+        Each original id to its name
+    name_to_ids : dict
+        Each name to the list of original ids with that name, in order
+    """
+
+    def __init__(self, renamer):
+        self.id_to_name = {}
+        self.name_to_ids = collections.defaultdict(list)
+        for feature_id, name in zip(renamer.index, renamer.values):
+            self.id_to_name.setdefault(feature_id, name)
+            self.name_to_ids[name].append(feature_id)
+        self.name_to_ids = dict(self.name_to_ids)
+
+    def name(self, feature_id, missing=None):
+        """Name of ``feature_id``
+
+        If it has no name, return ``missing(feature_id)``, or ``feature_id``
+        itself if ``missing`` is None.
+        """
+        try:
+            return self.id_to_name[feature_id]
+        except (KeyError, TypeError):
+            return feature_id if missing is None else missing(feature_id)
+
+    def ids(self, name):
+        """List of the ids with this ``name``, empty if there are none"""
+        try:
+            return self.name_to_ids.get(name, [])
+        except TypeError:
+            return []
+
+    def rename(self, feature_ids, missing=None):
+        """Names of many ids at once, as a list. See :py:meth:`name`"""
+        id_to_name = self.id_to_name
+        if missing is None:
+            return [id_to_name.get(x, x) for x in feature_ids]
+        return [self.name(x, missing) for x in feature_ids]
+
+
+SUBSET_QUERY_OPERATORS = '&|~()'
+
+
+class SubsetIndex(object):
+    """Named subsets of an axis, e.g. the samples, stored as packed bitsets
+
+    Subsets can be combined with a query such as
+    ``"phenotype: neuron & ~(pooled | outlier)"``, where
+    ``&`` is "and", ``|`` is "or", ``~`` is "not" and parentheses group.
+    Subset names may themselves contain spaces and parentheses, like
+    ``"not (pooled)"``, and the longest matching name is always used.
+
+    Parameters
+    ----------
+    index : pandas.Index
+        The ids of the axis, e.g. the samples or features of the data
+    masks : dict, optional
+        Subset names to boolean arrays the length of ``index``
+
+    Attributes
+    ----------
+    bitsets : dict
+        Subset names to their ``numpy.packbits`` bitset
+    """
+
+    def __init__(self, index, masks=None):
+        self.index = index
+        self.bitsets = {}
+        # Ids of queries already resolved, so the same query always returns
+        # the same object, which is cheap to hash and memoize on
+        self._ids = {}
+        for name, mask in (masks or {}).items():
+            self.add(name, mask)
+
+    def add(self, name, mask):
+        """Add (or replace) the subset ``name``, a boolean array the length
+        of the index"""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (len(self.index),):
+            raise ValueError('Subset "{}" has {} values, but there are {} '
+                             'ids'.format(name, mask.size, len(self.index)))
+        self.bitsets[name] = np.packbits(mask)
+        self.__dict__.pop('_names_by_length', None)
+        self._ids.clear()
+
+    def keys(self):
+        return self.bitsets.keys()
+
+    def __iter__(self):
+        return iter(self.bitsets)
+
+    def __len__(self):
+        return len(self.bitsets)
+
+    def __contains__(self, name):
+        return name in self.bitsets
+
+    def __getitem__(self, query):
+        return self.ids(query)
+
+    def to_dict(self):
+        """Subset names to their ids, like
+        :py:func:`flotilla.data_model.base.subsets_from_metadata`"""
+        return dict((name, self.ids(name)) for name in self.bitsets)
+
+    def ids(self, query):
+        """Ids of the subset, or combination of subsets, in ``query``"""
+        ids = self._ids.get(query)
+        if ids is None:
+            ids = self._ids[query] = self.index[self.mask(query)]
+        return ids
+
+    def mask(self, query):
+        """Boolean array of which ids are in ``query``
+
+        Raises
+        ------
+        KeyError
+            If a name in the query is not a subset
+        ValueError
+            If the query is not a valid expression
+        """
+        bitset = self.bitsets.get(query)
+        if bitset is None:
+            if not isinstance(query, basestring):
+                raise KeyError(query)
+            bitset = self._parse(query)
+        return np.unpackbits(bitset)[:len(self.index)].astype(bool)
+
+    @property
+    def _names_by_length(self):
+        names = self.__dict__.get('_names_by_length')
+        if names is None:
+            names = self.__dict__['_names_by_length'] = sorted(
+                self.bitsets, key=len, reverse=True)
+        return names
+
+    def _tokenize(self, query):
+        tokens = []
+        i = 0
+        while i < len(query):
+            if query[i].isspace():
+                i += 1
+                continue
+            for name in self._names_by_length:
+                if query.startswith(name, i):
+                    tokens.append(name)
+                    i += len(name)
+                    break
+            else:
+                if query[i] in SUBSET_QUERY_OPERATORS:
+                    tokens.append(query[i])
+                    i += 1
+                    continue
+                start = i
+                while i < len(query) and \
+                        query[i] not in SUBSET_QUERY_OPERATORS:
+                    i += 1
+                raise KeyError(query[start:i].strip())
+        return tokens
+
+    def _parse(self, query):
+        tokens = self._tokenize(query)
+        position = [0]
+
+        def peek():
+            if position[0] < len(tokens):
+                return tokens[position[0]]
+
+        def take(expected=None):
+            token = peek()
+            if token is None or (expected is not None and
+                                 token != expected):
+                raise ValueError('Invalid subset query: "{}"'.format(query))
+            position[0] += 1
+            return token
+
+        def union():
+            bitset = intersection()
+            while peek() == '|':
+                take()
+                bitset = bitset | intersection()
+            return bitset
+
+        def intersection():
+            bitset = negation()
+            while peek() == '&':
+                take()
+                bitset = bitset & negation()
+            return bitset
+
+        def negation():
+            token = take()
+            if token == '~':
+                return ~negation()
+            if token == '(':
+                bitset = union()
+                take(')')
+                return bitset
+            if token in SUBSET_QUERY_OPERATORS:
+                raise ValueError('Invalid subset query: "{}"'.format(query))
+            return self.bitsets[token]
+
+        bitset = union()
+        if peek() is not None:
+            raise ValueError('Invalid subset query: "{}"'.format(query))
+        return bitset
+
+
 def as_numpy(x):
     """Given either a pandas dataframe or a numpy array, always return a
     numpy array.
@@ -232,6 +1089,154 @@ def write_gzip_pickle_df(df, file_name):
     subprocess.call(['mv %s %s' % (tempfile, file_name)])
 
 
+BINARY_CACHE_SUFFIX = '.flotilla_cache'
+
+
+def file_checksum(filename, blocksize=2 ** 20, algorithm='sha1'):
+    """Hex digest of a file's contents, read a block at a time
+
+    ``algorithm`` is any name accepted by ``hashlib.new``, e.g. 'md5'
+    """
+    digest = hashlib.new(algorithm)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _np_load(filename, mmap_mode=None):
+    """np.load that allows pickled object arrays on every numpy version"""
+    try:
+        return np.load(filename, mmap_mode=mmap_mode, allow_pickle=True)
+    except TypeError:
+        return np.load(filename, mmap_mode=mmap_mode)
+
+
+def write_binary_df(df, dirname, checksum=''):
+    """Write a dataframe as native numpy arrays in a directory
+
+    A dataframe of a single numeric dtype is written as one 2D
+    ``values.npy`` array, which can be memory-mapped, and anything else as
+    one ``column_{i}.npy`` array per column. The index and columns are
+    pickled to ``labels.pickle``.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe to write
+    dirname : str
+        Directory to write to. Replaced if it already exists.
+    checksum : str, optional
+        Identifier of the source of this dataframe, e.g. from
+        :py:func:`file_checksum`, saved in a ``checksum`` file
+    """
+    parent = os.path.dirname(os.path.abspath(dirname))
+    # Write everything to a temporary directory first so a half-written
+    # cache is never read
+    tmpdir = tempfile.mkdtemp(dir=parent)
+    try:
+        dtypes = set(df.dtypes)
+        if len(dtypes) == 1 and not df.values.dtype.hasobject:
+            np.save(os.path.join(tmpdir, 'values.npy'), df.values)
+        else:
+            for i in range(df.shape[1]):
+                np.save(os.path.join(tmpdir, 'column_{}.npy'.format(i)),
+                        df.iloc[:, i].values)
+        with open(os.path.join(tmpdir, 'labels.pickle'), 'wb') as f:
+            cPickle.dump((df.index, df.columns), f, cPickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmpdir, 'checksum'), 'w') as f:
+            f.write(checksum)
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
+        os.rename(tmpdir, dirname)
+    finally:
+        if os.path.isdir(tmpdir):
+            shutil.rmtree(tmpdir)
+
+
+def load_binary_df(dirname, mmap=False):
+    """Load a dataframe written by :py:func:`write_binary_df`
+
+    Parameters
+    ----------
+    dirname : str
+        Directory the dataframe was written to
+    mmap : bool, optional (default=False)
+        If True, memory-map the values of a single-dtype dataframe instead
+        of reading them into memory. The values are copy-on-write, so
+        modifying the dataframe never changes the file.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The dataframe
+    """
+    with open(os.path.join(dirname, 'labels.pickle'), 'rb') as f:
+        index, columns = cPickle.load(f)
+
+    values_filename = os.path.join(dirname, 'values.npy')
+    if os.path.isfile(values_filename):
+        values = _np_load(values_filename, mmap_mode='c' if mmap else None)
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    df = pd.DataFrame(collections.OrderedDict(
+        (i, _np_load(os.path.join(dirname, 'column_{}.npy'.format(i))))
+        for i in range(len(columns))), index=index)
+    df.columns = columns
+    return df
+
+
+def binary_cache_checksum(filename, **kwargs):
+    """Identifier of a file's contents and the arguments used to read it"""
+    return '{}\n{}'.format(file_checksum(filename),
+                           content_hash(sorted(kwargs.items())))
+
+
+def load_with_binary_cache(reader, filename, mmap=False, **kwargs):
+    """Read a file, or its binary cache if it is up to date
+
+    The first time, the file is read with ``reader`` and the resulting
+    dataframe written next to it with :py:func:`write_binary_df`, in a
+    directory with the suffix ``BINARY_CACHE_SUFFIX``. Later, if the
+    checksum of the file and the reader's arguments still match, the cache
+    is read instead, which skips parsing the text entirely.
+
+    Parameters
+    ----------
+    reader : function
+        Function to read the file, e.g. :py:func:`load_csv`
+    filename : str
+        File to read
+    mmap : bool, optional (default=False)
+        If True, memory-map the cached values. See :py:func:`load_binary_df`
+    kwargs
+        Other keyword arguments are passed to ``reader``
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The data in the file
+    """
+    cache_dir = filename + BINARY_CACHE_SUFFIX
+    checksum = binary_cache_checksum(filename, **kwargs)
+    try:
+        with open(os.path.join(cache_dir, 'checksum')) as f:
+            if f.read() == checksum:
+                return load_binary_df(cache_dir, mmap=mmap)
+    except (IOError, OSError, EOFError, ValueError, cPickle.UnpicklingError):
+        # No cache yet, or an unreadable one, so read the original
+        pass
+
+    df = reader(filename, **kwargs)
+    if isinstance(df, pd.DataFrame):
+        try:
+            write_binary_df(df, cache_dir, checksum)
+        except (IOError, OSError) as e:
+            sys.stderr.write('{}\tCould not write binary cache of {}: {}\n'
+                             .format(timestamp(), filename, e))
+    return df
+
+
 def load_tsv(file_name, **kwargs):
     return pd.read_table(file_name, **kwargs)
 
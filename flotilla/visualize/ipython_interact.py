@@ -62,12 +62,14 @@ class Interactive(object):
 
         if 'expression' in data_types:
             try:
-                feature_subsets.extend(study.expression.feature_subsets.keys())
+                feature_subsets.extend(
+                    study.expression.feature_subset_index.keys())
             except AttributeError:
                 pass
         if 'splicing' in data_types:
             try:
-                feature_subsets.extend(study.splicing.feature_subsets.keys())
+                feature_subsets.extend(
+                    study.splicing.feature_subset_index.keys())
             except AttributeError:
                 pass
 
@@ -222,10 +224,10 @@ class Interactive(object):
 
             if data_type == 'expression':
                 assert (feature_subset in
-                        self.expression.feature_subsets.keys())
+                        self.expression.feature_subset_index.keys())
             if data_type == 'splicing':
                 assert (feature_subset in
-                        self.splicing.feature_subsets.keys())
+                        self.splicing.feature_subset_index.keys())
 
             self.plot_graph(data_type=data_type,
                             sample_subset=sample_subset,
@@ -421,8 +423,9 @@ class Interactive(object):
                     continue
                 sys.stdout.write('{} : {}\n'.format(k, v))
 
-            assert (feature_subset in self.splicing.feature_subsets.keys())
-            feature_ids = self.splicing.feature_subsets[feature_subset]
+            subset_index = self.splicing.feature_subset_index
+            assert (feature_subset in subset_index)
+            feature_ids = subset_index.ids(feature_subset)
 
             from sklearn.preprocessing import LabelEncoder
 
@@ -505,8 +508,9 @@ class Interactive(object):
                     continue
                 sys.stdout.write('{} : {}\n'.format(k, v))
 
-            assert (feature_subset in self.splicing.feature_subsets.keys())
-            feature_ids = self.splicing.feature_subsets[feature_subset]
+            subset_index = self.splicing.feature_subset_index
+            assert (feature_subset in subset_index)
+            feature_ids = subset_index.ids(feature_subset)
             sample_ids = self.sample_subset_to_sample_ids(sample_subset)
 
             color = str_to_color[color]
@@ -8,7 +8,7 @@ import numpy as np
 import seaborn as sns
 
 # from .color import red, blue, purple, grey, green
-from ..compute.splicing import get_switchy_score_order
+from ..compute.splicing import cached_switchy_score_order
 from ..util import as_numpy
 
 seaborn_colors = map(mpl.colors.rgb2hex, sns.color_palette('deep'))
@@ -191,9 +191,56 @@ class ModalitiesViz(object):
                      renamed=renamed)
         return plotter
 
+LAVALAMP_MAX_POINTS = 100000
+
+# Keyword arguments for plot() that only apply to markers and lines, and
+# which imshow() doesn't accept
+LAVALAMP_MARKER_KWS = ('color', 'marker', 'markersize', 'markeredgecolor',
+                       'markerfacecolor', 'markeredgewidth', 'linestyle',
+                       'linewidth')
+
+
+def _lavalamp_density(y, n_event_bins, n_psi_bins):
+    """Count the (event rank, psi) pairs of a lavalamp plot on a 2D grid
+
+    Parameters
+    ----------
+    y : numpy.array
+        A (n_samples, n_events) array of psi scores, with the events already
+        in plotting order
+    n_event_bins : int
+        Number of bins along the events
+    n_psi_bins : int
+        Number of bins of psi scores from 0 to 1
+
+    Returns
+    -------
+    counts : numpy.array
+        A (n_psi_bins, n_event_bins) array of the number of psi scores in
+        each bin. NA psi scores are not counted.
+    """
+    n_samples, n_events = y.shape
+    event_bins = np.arange(n_events) * n_event_bins // n_events
+    counts = np.zeros(n_psi_bins * n_event_bins, dtype=int)
+
+    # Bin a block of samples at a time so the temporary arrays stay small
+    # however many samples there are
+    block = max(1, 1000000 // max(n_events, 1))
+    for start in xrange(0, n_samples, block):
+        y_block = y[start:start + block]
+        finite = np.isfinite(y_block)
+        psi_bins = np.clip((y_block[finite] * n_psi_bins).astype(int), 0,
+                           n_psi_bins - 1)
+        events = event_bins[np.nonzero(finite)[1]]
+        counts += np.bincount(psi_bins * n_event_bins + events,
+                              minlength=n_psi_bins * n_event_bins)
+    return counts.reshape(n_psi_bins, n_event_bins)
+
+
 def lavalamp(psi, color=None, x_offset=0, title='', ax=None,
              switchy_score_psi=None, marker='o', plot_kws=None,
-             yticks=None):
+             yticks=None, density=None, max_points=LAVALAMP_MAX_POINTS,
+             density_bins=(1000, 100)):
     """Make a 'lavalamp' scatter plot of many splicing events
 
     Useful for visualizing many splicing events at once.
@@ -219,7 +266,20 @@ def lavalamp(psi, color=None, x_offset=0, title='', ax=None,
     marker : str
         A valid matplotlib marker. Default is 'd' (thin diamond)
     plot_kws : dict
-        Keyword arguments to supply to plot()
+        Keyword arguments to supply to plot(), or to imshow() if plotting
+        the density, in which case the marker and line arguments are ignored
+    density : bool or None
+        If True, instead of plotting every psi score as a marker, count the
+        psi scores of the events on a 2D grid and show it as an image, so
+        the memory and time to draw don't grow with the number of points.
+        If None (default), plot the density when there are more than
+        ``max_points`` psi scores.
+    max_points : int
+        Maximum number of psi scores to plot as markers when ``density`` is
+        None. Default 100000.
+    density_bins : tuple of int
+        Maximum number of bins along the events, and number of bins of psi
+        scores, of the density. Default (1000, 100)
 
     Returns
     -------
@@ -233,14 +293,7 @@ def lavalamp(psi, color=None, x_offset=0, title='', ax=None,
         fig, ax = plt.subplots(figsize=(16, 4))
 
     color = seaborn_colors[0] if color is None else color
-    plot_kws = {} if plot_kws is None else plot_kws
-    plot_kws.setdefault('color', color)
-    plot_kws.setdefault('alpha', 0.2)
-    plot_kws.setdefault('markersize', 10)
-    plot_kws.setdefault('marker', marker)
-    plot_kws.setdefault('linestyle', 'None')
-    plot_kws.setdefault('markeredgecolor', '#262626')
-    plot_kws.setdefault('markeredgewidth', .1)
+    plot_kws = {} if plot_kws is None else dict(plot_kws)
 
     y = as_numpy(psi.dropna(how='all', axis=1))
 
@@ -249,19 +302,46 @@ def lavalamp(psi, color=None, x_offset=0, title='', ax=None,
     else:
         switchy_score_y = y
 
-    order = get_switchy_score_order(switchy_score_y)
+    order = cached_switchy_score_order(switchy_score_y)
     y = y[:, order]
 
     n_samples, n_events = y.shape
-    # .astype(float) is to get rid of a deprecation warning
-    x = np.vstack((np.arange(n_events) for _ in xrange(n_samples)))
-    x = x.astype(float)
-    x += x_offset
-
-    # Add one so the last value is actually included instead of cut off
-    xmax = x.max() + 1
-
-    ax.plot(x, y, **plot_kws)
+    if density is None:
+        density = n_samples * n_events > max_points
+
+    if density:
+        n_event_bins = min(n_events, density_bins[0])
+        counts = _lavalamp_density(y, n_event_bins, density_bins[1])
+        for key in LAVALAMP_MARKER_KWS:
+            plot_kws.pop(key, None)
+        plot_kws.setdefault('cmap', mpl.colors.LinearSegmentedColormap
+                            .from_list('lavalamp', ['white', color]))
+        plot_kws.setdefault('aspect', 'auto')
+        plot_kws.setdefault('interpolation', 'nearest')
+        plot_kws.setdefault('origin', 'lower')
+        # Leave empty bins transparent so other plots show through
+        ax.imshow(np.ma.masked_equal(counts, 0),
+                  extent=(x_offset - 0.5, x_offset + n_events - 0.5, 0, 1),
+                  **plot_kws)
+        xmax = x_offset + n_events
+    else:
+        plot_kws.setdefault('color', color)
+        plot_kws.setdefault('alpha', 0.2)
+        plot_kws.setdefault('markersize', 10)
+        plot_kws.setdefault('marker', marker)
+        plot_kws.setdefault('linestyle', 'None')
+        plot_kws.setdefault('markeredgecolor', '#262626')
+        plot_kws.setdefault('markeredgewidth', .1)
+
+        # .astype(float) is to get rid of a deprecation warning
+        x = np.vstack((np.arange(n_events) for _ in xrange(n_samples)))
+        x = x.astype(float)
+        x += x_offset
+
+        # Add one so the last value is actually included instead of cut off
+        xmax = x.max() + 1
+
+        ax.plot(x, y, **plot_kws)
     sns.despine()
     ax.set_ylabel('$\Psi$')
     ax.set_xlabel('{} splicing events'.format(n_events))
@@ -322,10 +402,11 @@ def lavalamp_pooled_inconsistent(singles, pooled, pooled_inconsistent,
     try:
         singles_values = singles.ix[:, pooled_inconsistent.columns].values
         lavalamp(singles_values, color=color, ax=ax_inconsistent)
+        # Always as markers, so the singles' density shows through
         lavalamp(pooled.ix[:, pooled_inconsistent.columns], marker='o',
                  color='k',
                  switchy_score_psi=singles_values,
-                 ax=ax_inconsistent, plot_kws=pooled_plot_kws)
+                 ax=ax_inconsistent, plot_kws=pooled_plot_kws, density=False)
         title_suffix = '' if percent is None else ' ({:.1f}%){}'.format(
             percent, suffix)
         ax_inconsistent.set_title('Pooled splicing events inconsistent '
@@ -340,7 +421,7 @@ def lavalamp_pooled_inconsistent(singles, pooled, pooled_inconsistent,
     lavalamp(singles.ix[:, consistent_events], color=color, ax=ax_consistent)
     lavalamp(pooled.ix[:, consistent_events], color='k', marker='o',
              switchy_score_psi=singles.ix[:, consistent_events],
-             ax=ax_consistent, plot_kws=pooled_plot_kws)
+             ax=ax_consistent, plot_kws=pooled_plot_kws, density=False)
     title_suffix = '' if percent is None else ' ({:.1f}%){}'.format(
         100 - percent, suffix)
     ax_consistent.set_title('Pooled splicing events consistent with singles{}'